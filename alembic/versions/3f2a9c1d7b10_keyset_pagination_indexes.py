@@ -0,0 +1,33 @@
+"""keyset pagination indexes
+
+Revision ID: 3f2a9c1d7b10
+Revises: 
+Create Date: 2026-10-18 09:12:41.204518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f2a9c1d7b10'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ["users", "conversations", "messages", "entities"]
+
+
+def upgrade() -> None:
+    # Tables may already have been created from the models with these indexes
+    for table in TABLES:
+        op.create_index(
+            f"ix_{table}_created_at_id", table, ["created_at", "id"],
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.drop_index(f"ix_{table}_created_at_id", table_name=table, if_exists=True)
@@ -0,0 +1,40 @@
+"""cascade foreign keys
+
+Revision ID: 8c4e1b2d6a55
+Revises: 3f2a9c1d7b10
+Create Date: 2026-10-18 10:02:17.530114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c4e1b2d6a55'
+down_revision: Union[str, None] = '3f2a9c1d7b10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (table, column, referenced table), using Postgres' default constraint names
+FOREIGN_KEYS = [
+    ("conversations", "user_id", "users"),
+    ("messages", "conversation_id", "conversations"),
+    ("entities", "message_id", "messages"),
+]
+
+
+def _recreate(ondelete: Union[str, None]) -> None:
+    for table, column, referent in FOREIGN_KEYS:
+        name = f"{table}_{column}_fkey"
+        op.drop_constraint(name, table, type_="foreignkey")
+        op.create_foreign_key(
+            name, table, referent, [column], ["id"], ondelete=ondelete)
+
+
+def upgrade() -> None:
+    _recreate("CASCADE")
+
+
+def downgrade() -> None:
+    _recreate(None)
@@ -0,0 +1,82 @@
+"""entity rollups
+
+Revision ID: a4d8e2c6b9f1
+Revises: f3c9a7d1e5b4
+Create Date: 2026-10-18 14:48:03.118742
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4d8e2c6b9f1'
+down_revision: Union[str, None] = 'f3c9a7d1e5b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MARK_STALE_BUCKETS = """
+CREATE OR REPLACE FUNCTION mark_stale_rollup_buckets() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO stale_rollup_buckets (bucket)
+        SELECT DISTINCT (created_at AT TIME ZONE 'UTC')::date FROM new_entities;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO stale_rollup_buckets (bucket)
+        SELECT DISTINCT (created_at AT TIME ZONE 'UTC')::date FROM old_entities;
+    END IF;
+    RETURN NULL;
+END
+$$
+"""
+TRIGGERS = {
+    "entities_rollup_insert": "AFTER INSERT ON entities "
+                              "REFERENCING NEW TABLE AS new_entities",
+    "entities_rollup_update": "AFTER UPDATE ON entities "
+                              "REFERENCING OLD TABLE AS old_entities NEW TABLE AS new_entities",
+    "entities_rollup_delete": "AFTER DELETE ON entities "
+                              "REFERENCING OLD TABLE AS old_entities",
+}
+
+
+def upgrade() -> None:
+    op.create_table(
+        'entity_rollups',
+        sa.Column('entity_type', sa.String(), nullable=False),
+        sa.Column('bucket', sa.Date(), nullable=False),
+        sa.Column('entity_value', sa.String(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('entity_type', 'bucket', 'entity_value'),
+    )
+    op.create_index('ix_entity_rollups_bucket', 'entity_rollups', ['bucket'])
+    op.create_table(
+        'stale_rollup_buckets',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('bucket', sa.Date(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_stale_rollup_buckets_bucket', 'stale_rollup_buckets', ['bucket'])
+
+    op.execute(MARK_STALE_BUCKETS)
+    for name, event in TRIGGERS.items():
+        op.execute(f"CREATE TRIGGER {name} {event} "
+                   "FOR EACH STATEMENT EXECUTE FUNCTION mark_stale_rollup_buckets()")
+    # Backfill: the rollup worker builds every day that already has entities
+    op.execute(
+        "INSERT INTO stale_rollup_buckets (bucket) "
+        "SELECT DISTINCT (created_at AT TIME ZONE 'UTC')::date FROM entities"
+    )
+
+
+def downgrade() -> None:
+    for name in TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {name} ON entities")
+    op.execute("DROP FUNCTION IF EXISTS mark_stale_rollup_buckets()")
+    op.drop_index('ix_stale_rollup_buckets_bucket', table_name='stale_rollup_buckets')
+    op.drop_table('stale_rollup_buckets')
+    op.drop_index('ix_entity_rollups_bucket', table_name='entity_rollups')
+    op.drop_table('entity_rollups')
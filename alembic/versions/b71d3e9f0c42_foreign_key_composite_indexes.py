@@ -0,0 +1,47 @@
+"""foreign key composite indexes
+
+Revision ID: b71d3e9f0c42
+Revises: 8c4e1b2d6a55
+Create Date: 2026-10-18 10:41:55.872301
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b71d3e9f0c42'
+down_revision: Union[str, None] = '8c4e1b2d6a55'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ("ix_conversations_user_id_created_at_id", "conversations",
+     ["user_id", "created_at", "id"]),
+    ("ix_messages_conversation_id_created_at_id", "messages",
+     ["conversation_id", "created_at", "id"]),
+    ("ix_entities_message_id_id", "entities", ["message_id", "id"]),
+    ("ix_entities_entity_type_entity_value", "entities",
+     ["entity_type", "entity_value"]),
+]
+
+
+def upgrade() -> None:
+    # CONCURRENTLY keeps the tables writable while the indexes build, but
+    # cannot run inside the migration transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(
+                name, table, columns,
+                postgresql_concurrently=True, if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in INDEXES:
+            op.drop_index(
+                name, table_name=table,
+                postgresql_concurrently=True, if_exists=True,
+            )
@@ -0,0 +1,303 @@
+"""partition messages
+
+Revision ID: b9d4f2e7a1c5
+Revises: c6e1f8a3d2b7
+Create Date: 2026-10-18 18:40:12.318604
+
+Rebuilds messages and entities as tables partitioned by month on
+created_at, and adds conversations.archived_at for cold storage (see
+app.core.archive). The primary key of a partitioned table must include the
+partition key, so both are keyed by (id, created_at), and entities and
+extraction_outbox reference a message by (message_id, message_created_at).
+
+The old tables are renamed to *_unpartitioned and copied over BATCH_SIZE
+rows per transaction, then dropped. Ids and timestamps are kept, and the id
+sequences carry on where they were.
+
+Stop the API and workers first: rows written to the old tables during the
+copy are lost.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b9d4f2e7a1c5'
+down_revision: Union[str, None] = 'c6e1f8a3d2b7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 10000
+MONTHS_AHEAD = 3
+
+# app.models.partition.CREATE_MONTHLY_PARTITIONS as of this revision
+CREATE_MONTHLY_PARTITIONS = """
+CREATE OR REPLACE FUNCTION create_monthly_partitions(parent text, first_month date, last_month date)
+RETURNS integer LANGUAGE plpgsql AS $$
+DECLARE
+    month date := date_trunc('month', first_month);
+    name text;
+    created integer := 0;
+BEGIN
+    WHILE month <= last_month LOOP
+        name := format('%s_y%sm%s', parent, to_char(month, 'YYYY'), to_char(month, 'MM'));
+        IF to_regclass(name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                name, parent,
+                month::timestamp AT TIME ZONE 'UTC',
+                (month + interval '1 month')::timestamp AT TIME ZONE 'UTC');
+            created := created + 1;
+        END IF;
+        month := month + interval '1 month';
+    END LOOP;
+    RETURN created;
+END
+$$
+"""
+
+# app.models.rollup.ROLLUP_TRIGGERS as of this revision
+ROLLUP_TRIGGERS = [
+    "CREATE OR REPLACE TRIGGER entities_rollup_insert AFTER INSERT ON entities "
+    "REFERENCING NEW TABLE AS new_entities "
+    "FOR EACH STATEMENT EXECUTE FUNCTION mark_stale_rollup_buckets()",
+    "CREATE OR REPLACE TRIGGER entities_rollup_update AFTER UPDATE ON entities "
+    "REFERENCING OLD TABLE AS old_entities NEW TABLE AS new_entities "
+    "FOR EACH STATEMENT EXECUTE FUNCTION mark_stale_rollup_buckets()",
+    "CREATE OR REPLACE TRIGGER entities_rollup_delete AFTER DELETE ON entities "
+    "REFERENCING OLD TABLE AS old_entities "
+    "FOR EACH STATEMENT EXECUTE FUNCTION mark_stale_rollup_buckets()",
+]
+
+MESSAGE_COLUMNS = "id, conversation_id, sender_type, content, created_at, updated_at"
+ENTITY_COLUMNS = "id, message_id, type_id, value_id, confidence_score, created_at, updated_at"
+
+COPY_MESSAGES = f"""
+INSERT INTO messages ({MESSAGE_COLUMNS})
+SELECT {MESSAGE_COLUMNS} FROM messages_unpartitioned
+WHERE id > :low AND id <= :high
+"""
+COPY_ENTITIES = f"""
+INSERT INTO entities ({ENTITY_COLUMNS}, message_created_at)
+SELECT {', '.join('e.' + column for column in ENTITY_COLUMNS.split(', '))}, m.created_at
+FROM entities_unpartitioned e JOIN messages_unpartitioned m ON m.id = e.message_id
+WHERE e.id > :low AND e.id <= :high
+"""
+# Back into the tables downgrade() recreates
+RESTORE_MESSAGES = f"""
+INSERT INTO messages ({MESSAGE_COLUMNS})
+SELECT {MESSAGE_COLUMNS} FROM messages_partitioned
+WHERE id > :low AND id <= :high
+"""
+RESTORE_ENTITIES = f"""
+INSERT INTO entities ({ENTITY_COLUMNS})
+SELECT {ENTITY_COLUMNS} FROM entities_partitioned
+WHERE id > :low AND id <= :high
+"""
+
+
+def _in_batches(statement: str, table: str):
+    """Run `statement` over the ids of `table`, committing each batch"""
+    bind = op.get_bind()
+    low, high = bind.execute(sa.text(f"SELECT min(id) - 1, max(id) FROM {table}")).one()
+    if high is None:
+        return
+    with op.get_context().autocommit_block():
+        for start in range(low, high, BATCH_SIZE):
+            op.execute(sa.text(statement).bindparams(low=start, high=start + BATCH_SIZE))
+
+
+def _create_indexes():
+    op.create_index('ix_messages_created_at_id', 'messages', ['created_at', 'id'])
+    op.create_index('ix_messages_conversation_id_created_at_id', 'messages',
+                    ['conversation_id', 'created_at', 'id'])
+    op.create_index('ix_messages_search_vector', 'messages', ['search_vector'],
+                    postgresql_using='gin')
+    op.create_index('ix_messages_content_trgm', 'messages', ['content'],
+                    postgresql_using='gin', postgresql_ops={'content': 'gin_trgm_ops'})
+    op.create_index('ix_entities_created_at_id', 'entities', ['created_at', 'id'])
+    op.create_index('ix_entities_message_id_id', 'entities', ['message_id', 'id'])
+    op.create_index('ix_entities_type_id_value_id', 'entities', ['type_id', 'value_id'])
+
+
+def upgrade() -> None:
+    op.execute(CREATE_MONTHLY_PARTITIONS)
+    op.add_column('conversations',
+                  sa.Column('archived_at', sa.DateTime(timezone=True), nullable=True))
+
+    # created_at becomes part of the primary key
+    op.execute("UPDATE messages SET created_at = coalesce(updated_at, now()) "
+               "WHERE created_at IS NULL")
+    op.execute("UPDATE entities SET created_at = coalesce(updated_at, now()) "
+               "WHERE created_at IS NULL")
+
+    # Out of the way of the new tables' names; the old tables keep only
+    # their primary keys, for copying by id
+    op.drop_constraint('extraction_outbox_message_id_fkey', 'extraction_outbox',
+                       type_='foreignkey')
+    for table in ('messages', 'entities'):
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+        op.rename_table(table, f'{table}_unpartitioned')
+        op.execute(f"ALTER TABLE {table}_unpartitioned "
+                   f"RENAME CONSTRAINT {table}_pkey TO {table}_unpartitioned_pkey")
+    for index in ('ix_messages_id', 'ix_messages_created_at_id',
+                  'ix_messages_conversation_id_created_at_id', 'ix_messages_search_vector',
+                  'ix_entities_id', 'ix_entities_created_at_id', 'ix_entities_message_id_id',
+                  'ix_entities_type_id_value_id'):
+        op.execute(f"DROP INDEX IF EXISTS {index}")
+    op.execute("DROP INDEX IF EXISTS ix_messages_content_trgm")
+
+    op.create_table(
+        'messages',
+        sa.Column('id', sa.Integer(), server_default=sa.text("nextval('messages_id_seq')"),
+                  nullable=False),
+        sa.Column('conversation_id', sa.Integer(), nullable=False),
+        sa.Column('sender_type', sa.String(), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'),
+                  nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'),
+                  nullable=True),
+        sa.Column('search_vector', postgresql.TSVECTOR(),
+                  sa.Computed("to_tsvector('english', content)", persisted=True),
+                  nullable=True),
+        sa.PrimaryKeyConstraint('id', 'created_at'),
+        postgresql_partition_by='RANGE (created_at)',
+    )
+    op.create_table(
+        'entities',
+        sa.Column('id', sa.Integer(), server_default=sa.text("nextval('entities_id_seq')"),
+                  nullable=False),
+        sa.Column('message_id', sa.Integer(), nullable=False),
+        sa.Column('message_created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('type_id', sa.Integer(), nullable=False),
+        sa.Column('value_id', sa.Integer(), nullable=False),
+        sa.Column('confidence_score', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'),
+                  nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'),
+                  nullable=True),
+        sa.PrimaryKeyConstraint('id', 'created_at'),
+        postgresql_partition_by='RANGE (created_at)',
+    )
+    for table in ('messages', 'entities'):
+        op.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+        op.execute(
+            f"SELECT create_monthly_partitions('{table}', "
+            f"(coalesce((SELECT min(created_at) FROM {table}_unpartitioned), now()) "
+            f"AT TIME ZONE 'UTC')::date, (now() AT TIME ZONE 'UTC' "
+            f"+ interval '{MONTHS_AHEAD} months')::date)")
+
+    # Loaded before the indexes and foreign keys exist, which is much faster
+    _in_batches(COPY_MESSAGES, 'messages_unpartitioned')
+    _in_batches(COPY_ENTITIES, 'entities_unpartitioned')
+
+    op.add_column('extraction_outbox', sa.Column(
+        'message_created_at', sa.DateTime(timezone=True), nullable=True))
+    op.execute("UPDATE extraction_outbox o SET message_created_at = m.created_at "
+               "FROM messages_unpartitioned m WHERE m.id = o.message_id")
+    op.execute("DELETE FROM extraction_outbox WHERE message_created_at IS NULL")
+    op.alter_column('extraction_outbox', 'message_created_at', nullable=False)
+
+    _create_indexes()
+    op.create_foreign_key('messages_conversation_id_fkey', 'messages', 'conversations',
+                          ['conversation_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('entities_message_id_message_created_at_fkey', 'entities',
+                          'messages', ['message_id', 'message_created_at'],
+                          ['id', 'created_at'], ondelete='CASCADE')
+    op.create_foreign_key('entities_type_id_fkey', 'entities', 'entity_types',
+                          ['type_id'], ['id'])
+    op.create_foreign_key('entities_value_id_fkey', 'entities', 'entity_values',
+                          ['value_id'], ['id'])
+    op.create_foreign_key('extraction_outbox_message_id_message_created_at_fkey',
+                          'extraction_outbox', 'messages',
+                          ['message_id', 'message_created_at'], ['id', 'created_at'],
+                          ondelete='CASCADE')
+    for trigger in ROLLUP_TRIGGERS:
+        op.execute(trigger)
+
+    op.execute("ALTER SEQUENCE messages_id_seq OWNED BY messages.id")
+    op.execute("ALTER SEQUENCE entities_id_seq OWNED BY entities.id")
+    op.drop_table('entities_unpartitioned')
+    op.drop_table('messages_unpartitioned')
+    op.execute("ANALYZE messages, entities")
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.execute(sa.text(
+            "SELECT EXISTS (SELECT FROM conversations WHERE archived_at IS NOT NULL)")).scalar():
+        raise RuntimeError("Some conversations are archived; rehydrate them before downgrading")
+
+    op.drop_constraint('extraction_outbox_message_id_message_created_at_fkey',
+                       'extraction_outbox', type_='foreignkey')
+    for table in ('messages', 'entities'):
+        op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+        op.rename_table(table, f'{table}_partitioned')
+        op.execute(f"ALTER TABLE {table}_partitioned "
+                   f"RENAME CONSTRAINT {table}_pkey TO {table}_partitioned_pkey")
+    for index in ('ix_messages_created_at_id', 'ix_messages_conversation_id_created_at_id',
+                  'ix_messages_search_vector', 'ix_messages_content_trgm',
+                  'ix_entities_created_at_id', 'ix_entities_message_id_id',
+                  'ix_entities_type_id_value_id'):
+        op.execute(f"DROP INDEX {index}")
+
+    op.create_table(
+        'messages',
+        sa.Column('id', sa.Integer(), server_default=sa.text("nextval('messages_id_seq')"),
+                  nullable=False),
+        sa.Column('conversation_id', sa.Integer(), nullable=False),
+        sa.Column('sender_type', sa.String(), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'),
+                  nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'),
+                  nullable=True),
+        sa.Column('search_vector', postgresql.TSVECTOR(),
+                  sa.Computed("to_tsvector('english', content)", persisted=True),
+                  nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_table(
+        'entities',
+        sa.Column('id', sa.Integer(), server_default=sa.text("nextval('entities_id_seq')"),
+                  nullable=False),
+        sa.Column('message_id', sa.Integer(), nullable=False),
+        sa.Column('confidence_score', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'),
+                  nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'),
+                  nullable=True),
+        sa.Column('type_id', sa.Integer(), nullable=False),
+        sa.Column('value_id', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    _in_batches(RESTORE_MESSAGES, 'messages_partitioned')
+    _in_batches(RESTORE_ENTITIES, 'entities_partitioned')
+
+    op.drop_column('extraction_outbox', 'message_created_at')
+    _create_indexes()
+    op.create_index('ix_messages_id', 'messages', ['id'])
+    op.create_index('ix_entities_id', 'entities', ['id'])
+    op.create_foreign_key('messages_conversation_id_fkey', 'messages', 'conversations',
+                          ['conversation_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('entities_message_id_fkey', 'entities', 'messages',
+                          ['message_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('entities_type_id_fkey', 'entities', 'entity_types',
+                          ['type_id'], ['id'])
+    op.create_foreign_key('entities_value_id_fkey', 'entities', 'entity_values',
+                          ['value_id'], ['id'])
+    op.create_foreign_key('extraction_outbox_message_id_fkey', 'extraction_outbox',
+                          'messages', ['message_id'], ['id'], ondelete='CASCADE')
+    for trigger in ROLLUP_TRIGGERS:
+        op.execute(trigger)
+
+    op.execute("ALTER SEQUENCE messages_id_seq OWNED BY messages.id")
+    op.execute("ALTER SEQUENCE entities_id_seq OWNED BY entities.id")
+    op.drop_table('entities_partitioned')
+    op.drop_table('messages_partitioned')
+    op.execute("DROP FUNCTION create_monthly_partitions(text, date, date)")
+    op.drop_column('conversations', 'archived_at')
@@ -0,0 +1,64 @@
+"""archived messages
+
+Revision ID: c2e7a9f4b6d8
+Revises: b9d4f2e7a1c5
+Create Date: 2026-10-18 21:05:37.412086
+
+Indexes the messages of archived conversations by id, so GET /messages/{id}
+and GET /entities/message/{id} can find and rehydrate their conversation.
+Backfilled from the archive files of conversations archived before this
+revision.
+"""
+import gzip
+import json
+from pathlib import Path
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.core.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c2e7a9f4b6d8'
+down_revision: Union[str, None] = 'b9d4f2e7a1c5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _archive_path(conversation_id: int) -> Path:
+    # app.core.archive.archive_path as of this revision
+    return (Path(settings.archive_dir) / str(conversation_id // 10000)
+            / f"{conversation_id}.ndjson.gz")
+
+
+def upgrade() -> None:
+    op.create_table(
+        'archived_messages',
+        sa.Column('message_id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('conversation_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['conversation_id'], ['conversations.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('message_id')
+    )
+    op.create_index(op.f('ix_archived_messages_conversation_id'), 'archived_messages',
+                    ['conversation_id'], unique=False)
+
+    connection = op.get_bind()
+    archived = connection.execute(sa.text(
+        "SELECT id FROM conversations WHERE archived_at IS NOT NULL")).scalars().all()
+    table = sa.table('archived_messages', sa.column('message_id'), sa.column('conversation_id'))
+    for conversation_id in archived:
+        path = _archive_path(conversation_id)
+        if not path.exists():
+            continue
+        with gzip.open(path, "rt") as file:
+            rows = [{"message_id": json.loads(line)["id"], "conversation_id": conversation_id}
+                    for line in file]
+        if rows:
+            op.bulk_insert(table, rows)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_archived_messages_conversation_id'), table_name='archived_messages')
+    op.drop_table('archived_messages')
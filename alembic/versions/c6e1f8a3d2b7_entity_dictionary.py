@@ -0,0 +1,186 @@
+"""entity dictionary
+
+Revision ID: c6e1f8a3d2b7
+Revises: a4d8e2c6b9f1
+Create Date: 2026-10-18 16:21:37.504918
+
+Moves entity types and values into entity_types / entity_values and points
+entities at them by id. Existing rows are backfilled BATCH_SIZE ids per
+transaction, so no lock is held on entities for longer than one batch.
+NOT NULL and the foreign keys are added as NOT VALID constraints and then
+validated, which only blocks writes for the brief catalog changes.
+
+Stop the API and workers first: entities written by the old code during the
+backfill are picked up by the final pass, but not ones written after it.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c6e1f8a3d2b7'
+down_revision: Union[str, None] = 'a4d8e2c6b9f1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 10000
+
+
+def normalize(column: str) -> str:
+    """SQL for app.core.dictionary.normalize()"""
+    return f"lower(btrim(regexp_replace({column}, '\\s+', ' ', 'g')))"
+
+
+# New types and values of entities that have no ids yet. A value's canonical
+# spelling is its most frequent one.
+INTERN_TYPES = f"""
+INSERT INTO entity_types (name)
+SELECT DISTINCT {normalize('entity_type')} FROM entities WHERE value_id IS NULL
+ON CONFLICT DO NOTHING
+"""
+INTERN_VALUES = f"""
+INSERT INTO entity_values (type_id, key, value)
+SELECT DISTINCT ON (t.id, s.key) t.id, s.key, s.value
+FROM (
+    SELECT {normalize('entity_type')} AS type, {normalize('entity_value')} AS key,
+           btrim(regexp_replace(entity_value, '\\s+', ' ', 'g')) AS value, count(*) AS uses
+    FROM entities WHERE value_id IS NULL
+    GROUP BY 1, 2, 3
+) s
+JOIN entity_types t ON t.name = s.type
+ORDER BY t.id, s.key, s.uses DESC, s.value
+ON CONFLICT DO NOTHING
+"""
+BACKFILL = f"""
+UPDATE entities e SET type_id = v.type_id, value_id = v.id
+FROM entity_types t JOIN entity_values v ON v.type_id = t.id
+WHERE e.id > :low AND e.id <= :high AND e.value_id IS NULL
+  AND t.name = {normalize('e.entity_type')} AND v.key = {normalize('e.entity_value')}
+"""
+RESTORE = """
+UPDATE entities e SET entity_type = t.name, entity_value = v.value
+FROM entity_types t, entity_values v
+WHERE e.id > :low AND e.id <= :high AND e.entity_value IS NULL
+  AND t.id = e.type_id AND v.id = e.value_id
+"""
+
+
+def _in_batches(statement: str, where: str):
+    """Run `statement` over the ids of rows matching `where`, committing each batch"""
+    bind = op.get_bind()
+    low, high = bind.execute(sa.text(f"SELECT min(id) - 1, max(id) FROM entities WHERE {where}")).one()
+    if high is None:
+        return
+    with op.get_context().autocommit_block():
+        for start in range(low, high, BATCH_SIZE):
+            op.execute(sa.text(statement).bindparams(low=start, high=start + BATCH_SIZE))
+
+
+def upgrade() -> None:
+    op.create_table(
+        'entity_types',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name'),
+    )
+    op.create_table(
+        'entity_values',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('type_id', sa.Integer(), nullable=False),
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('value', sa.String(), nullable=False),
+        sa.ForeignKeyConstraint(['type_id'], ['entity_types.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('type_id', 'key', name='uq_entity_values_type_id_key'),
+    )
+    op.create_table(
+        'entity_aliases',
+        sa.Column('type_id', sa.Integer(), nullable=False),
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('value_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['type_id'], ['entity_types.id']),
+        sa.ForeignKeyConstraint(['value_id'], ['entity_values.id']),
+        sa.PrimaryKeyConstraint('type_id', 'key'),
+    )
+    op.add_column('entities', sa.Column('type_id', sa.Integer(), nullable=True))
+    op.add_column('entities', sa.Column('value_id', sa.Integer(), nullable=True))
+    op.execute("ALTER TABLE entities ALTER COLUMN entity_type DROP NOT NULL, "
+               "ALTER COLUMN entity_value DROP NOT NULL")
+
+    # The backfill's UPDATEs mark every day stale, so the rollup worker
+    # rebuilds entity_rollups by id afterwards
+    op.drop_index('ix_entity_rollups_bucket', table_name='entity_rollups')
+    op.drop_table('entity_rollups')
+    op.create_table(
+        'entity_rollups',
+        sa.Column('type_id', sa.Integer(), nullable=False),
+        sa.Column('bucket', sa.Date(), nullable=False),
+        sa.Column('value_id', sa.Integer(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('type_id', 'bucket', 'value_id'),
+    )
+    op.create_index('ix_entity_rollups_bucket', 'entity_rollups', ['bucket'])
+
+    # Each pass commits the schema changes above, releasing their locks
+    # before the full scans; the second picks up anything written meanwhile
+    for _ in range(2):
+        with op.get_context().autocommit_block():
+            op.execute(INTERN_TYPES)
+            op.execute(INTERN_VALUES)
+        _in_batches(BACKFILL, "value_id IS NULL")
+
+    with op.get_context().autocommit_block():
+        for column, parent in (("type_id", "entity_types"), ("value_id", "entity_values")):
+            op.execute(f"ALTER TABLE entities ADD CONSTRAINT entities_{column}_fkey "
+                       f"FOREIGN KEY ({column}) REFERENCES {parent} (id) NOT VALID")
+            op.execute(f"ALTER TABLE entities VALIDATE CONSTRAINT entities_{column}_fkey")
+        # SET NOT NULL skips its table scan when a validated CHECK proves it
+        op.execute("ALTER TABLE entities ADD CONSTRAINT entities_ids_not_null "
+                   "CHECK (type_id IS NOT NULL AND value_id IS NOT NULL) NOT VALID")
+        op.execute("ALTER TABLE entities VALIDATE CONSTRAINT entities_ids_not_null")
+        op.execute("ALTER TABLE entities ALTER COLUMN type_id SET NOT NULL, "
+                   "ALTER COLUMN value_id SET NOT NULL")
+        op.execute("ALTER TABLE entities DROP CONSTRAINT entities_ids_not_null")
+
+        op.create_index('ix_entities_type_id_value_id', 'entities',
+                        ['type_id', 'value_id'], postgresql_concurrently=True)
+        op.drop_index('ix_entities_entity_type_entity_value', table_name='entities',
+                      postgresql_concurrently=True)
+        op.drop_column('entities', 'entity_type')
+        op.drop_column('entities', 'entity_value')
+
+
+def downgrade() -> None:
+    op.add_column('entities', sa.Column('entity_type', sa.String(), nullable=True))
+    op.add_column('entities', sa.Column('entity_value', sa.String(), nullable=True))
+    _in_batches(RESTORE, "entity_value IS NULL")
+
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TABLE entities ALTER COLUMN entity_type SET NOT NULL, "
+                   "ALTER COLUMN entity_value SET NOT NULL")
+        op.create_index('ix_entities_entity_type_entity_value', 'entities',
+                        ['entity_type', 'entity_value'], postgresql_concurrently=True)
+        op.drop_index('ix_entities_type_id_value_id', table_name='entities',
+                      postgresql_concurrently=True)
+
+    op.drop_column('entities', 'value_id')
+    op.drop_column('entities', 'type_id')
+    op.drop_index('ix_entity_rollups_bucket', table_name='entity_rollups')
+    op.drop_table('entity_rollups')
+    op.create_table(
+        'entity_rollups',
+        sa.Column('entity_type', sa.String(), nullable=False),
+        sa.Column('bucket', sa.Date(), nullable=False),
+        sa.Column('entity_value', sa.String(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('entity_type', 'bucket', 'entity_value'),
+    )
+    op.create_index('ix_entity_rollups_bucket', 'entity_rollups', ['bucket'])
+    op.execute("INSERT INTO stale_rollup_buckets (bucket) "
+               "SELECT DISTINCT (created_at AT TIME ZONE 'UTC')::date FROM entities")
+    op.drop_table('entity_aliases')
+    op.drop_table('entity_values')
+    op.drop_table('entity_types')
@@ -0,0 +1,28 @@
+"""conversation summaries
+
+Revision ID: d5a1c7e3f9b2
+Revises: b71d3e9f0c42
+Create Date: 2026-10-18 12:41:08.204517
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd5a1c7e3f9b2'
+down_revision: Union[str, None] = 'b71d3e9f0c42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('conversations', sa.Column('summary', sa.Text(), nullable=True))
+    op.add_column('conversations', sa.Column('summary_message_id', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('conversations', 'summary_message_id')
+    op.drop_column('conversations', 'summary')
@@ -0,0 +1,45 @@
+"""extraction outbox
+
+Revision ID: e8b2f4a6c1d3
+Revises: d5a1c7e3f9b2
+Create Date: 2026-10-18 13:27:44.910265
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8b2f4a6c1d3'
+down_revision: Union[str, None] = 'd5a1c7e3f9b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'extraction_outbox',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('message_id', sa.Integer(), nullable=False),
+        sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('available_at', sa.DateTime(timezone=True),
+                  server_default=sa.text('now()'), nullable=False),
+        sa.Column('failed_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True),
+                  server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['message_id'], ['messages.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_extraction_outbox_message_id', 'extraction_outbox', ['message_id'])
+    op.create_index(
+        'ix_extraction_outbox_available_at_id', 'extraction_outbox',
+        ['available_at', 'id'], postgresql_where=sa.text('failed_at IS NULL'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_extraction_outbox_available_at_id', table_name='extraction_outbox')
+    op.drop_index('ix_extraction_outbox_message_id', table_name='extraction_outbox')
+    op.drop_table('extraction_outbox')
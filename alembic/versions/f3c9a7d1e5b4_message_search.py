@@ -0,0 +1,48 @@
+"""message search
+
+Revision ID: f3c9a7d1e5b4
+Revises: e8b2f4a6c1d3
+Create Date: 2026-10-18 14:02:17.530418
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3c9a7d1e5b4'
+down_revision: Union[str, None] = 'e8b2f4a6c1d3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # Adding a stored generated column rewrites the table under an exclusive
+    # lock; on a large messages table, run this in a maintenance window
+    op.add_column('messages', sa.Column(
+        'search_vector', postgresql.TSVECTOR(),
+        sa.Computed("to_tsvector('english', content)", persisted=True),
+        nullable=True))
+    # CONCURRENTLY keeps the table writable while the indexes build, but
+    # cannot run inside the migration transaction
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_messages_search_vector', 'messages', ['search_vector'],
+            postgresql_using='gin', postgresql_concurrently=True)
+        op.create_index(
+            'ix_messages_content_trgm', 'messages', ['content'],
+            postgresql_using='gin', postgresql_ops={'content': 'gin_trgm_ops'},
+            postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_messages_content_trgm', table_name='messages',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_messages_search_vector', table_name='messages',
+                      postgresql_concurrently=True, if_exists=True)
+    op.drop_column('messages', 'search_vector')
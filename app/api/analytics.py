@@ -0,0 +1,44 @@
+from datetime import date
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.rollups import top_entities
+from app.database.replica import get_read_db
+from app.schemas import EntityTopValues
+
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+
+
+@router.get("/entities/top", response_model=list[EntityTopValues])
+async def get_top_entities(
+    entity_type: Optional[str] = None,
+    user_id: Optional[int] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Most frequent values of each entity type between two days (inclusive, UTC)
+
+    Served from the entity rollups, which trail new entities by up to
+    ENTITY_ROLLUP_INTERVAL_SECONDS. Counts for one user are read live from
+    that user's entities.
+    """
+    return await top_entities(
+        db, entity_type=entity_type, user_id=user_id, start=start, end=end, limit=limit)
+
+
+@router.get("/entities/timeline", response_model=list[EntityTopValues])
+async def get_entity_timeline(
+    interval: Literal["day", "week", "month"] = "day",
+    entity_type: Optional[str] = None,
+    user_id: Optional[int] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    limit: int = Query(10, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Most frequent values of each entity type per day, week or month"""
+    return await top_entities(
+        db, entity_type=entity_type, user_id=user_id, start=start, end=end,
+        interval=interval, limit=limit)
@@ -2,13 +2,16 @@ from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from app.database.database import get_db
+from app.database.writes import UNIQUE_VIOLATION, insert_returning, integrity_code
 from app.models import User
+from app.models.loaders import USER_CONVERSATIONS
 from app.schemas.user import UserCreate, UserResponse
 from app.core.auth import (
-    create_access_token, get_password_hash, verify_password, get_current_user,
+    create_access_token, get_password_hash_async, verify_password_async, get_current_user,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
 from app.core.config import settings
@@ -27,7 +30,7 @@ async def authenticate_user(db: AsyncSession, username: str, password: str):
     user = result.scalars().first()
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password_async(password, user.hashed_password):
         return False
     return user
 
@@ -35,30 +38,25 @@ async def authenticate_user(db: AsyncSession, username: str, password: str):
 @router.post("/register", response_model=UserResponse)
 async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
     """Register a new user"""
-    # Check if user already exists
-    result = await db.execute(
-        select(User).where((User.username == user.username)
-                           | (User.email == user.email))
-    )
-    existing_user = result.scalars().first()
-    if existing_user:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Username or email already registered"
-        )
-
-    # Create new user
-    hashed_password = get_password_hash(user.password)
-    db_user = User(
-        username=user.username,
-        email=user.email,
-        full_name=user.full_name,
-        hashed_password=hashed_password
-    )
-    db.add(db_user)
+    # Create new user; the unique constraints on username/email reject duplicates
+    hashed_password = await get_password_hash_async(user.password)
+    try:
+        row = await insert_returning(db, User, {
+            "username": user.username,
+            "email": user.email,
+            "full_name": user.full_name,
+            "hashed_password": hashed_password
+        })
+    except IntegrityError as exc:
+        await db.rollback()
+        if integrity_code(exc) == UNIQUE_VIOLATION:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Username or email already registered"
+            )
+        raise
     await db.commit()
-    await db.refresh(db_user)
-    return db_user
+    return row
 
 
 @router.post("/login")
@@ -82,7 +80,9 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSessi
 async def read_users_me(db: AsyncSession = Depends(get_db)):
     """Get current user information - TEMPORARILY DISABLED AUTH"""
     # For now, return the first user as a placeholder
-    result = await db.execute(select(User).limit(1))
+    result = await db.execute(
+        select(User).options(USER_CONVERSATIONS).limit(1)
+    )
     user = result.scalars().first()
     if not user:
         raise HTTPException(status_code=404, detail="No users found")
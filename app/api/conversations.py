@@ -1,47 +1,77 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Literal, Optional, Union
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from app.core.archive import rehydrate, remove_archives
+from app.core.cache import invalidate_tags
+from app.core.pagination import apply_keyset, keyset_page
+from app.core.response_cache import cached_response, message_tags
 from app.database.database import get_db
-from app.models import Conversation, User
-from app.schemas import ConversationCreate, ConversationUpdate, ConversationResponse
+from app.database.replica import get_read_db
+from app.database.deletes import start_delete_job
+from app.database.writes import (
+    FOREIGN_KEY_VIOLATION, delete_returning, insert_returning, integrity_code,
+    update_returning
+)
+from app.models import Conversation
+from app.models.loaders import CONVERSATION_MESSAGES
+from app.schemas import ConversationCreate, ConversationUpdate, ConversationResponse, CursorPage
 
 router = APIRouter(prefix="/conversations", tags=["conversations"])
 
 @router.post("/", response_model=ConversationResponse)
 async def create_conversation(conversation: ConversationCreate, db: AsyncSession = Depends(get_db)):
     """Create a new conversation"""
-    # Verify user exists
-    user_result = await db.execute(select(User).where(User.id == conversation.user_id))
-    user = user_result.scalars().first()
-    
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-    
-    db_conversation = Conversation(**conversation.model_dump())
-    db.add(db_conversation)
+    try:
+        row = await insert_returning(db, Conversation, conversation.model_dump())
+    except IntegrityError as exc:
+        await db.rollback()
+        if integrity_code(exc) == FOREIGN_KEY_VIOLATION:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found"
+            )
+        raise
     await db.commit()
-    await db.refresh(db_conversation)
-    return db_conversation
+    await invalidate_tags(f"user:{row.user_id}:conversations")
+    return row
 
 @router.get("/{conversation_id}", response_model=ConversationResponse)
-async def get_conversation(conversation_id: int, db: AsyncSession = Depends(get_db)):
-    """Get conversation by ID"""
-    result = await db.execute(
-        select(Conversation)
-        .where(Conversation.id == conversation_id)
-    )
-    conversation = result.scalars().first()
-    
-    if not conversation:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Conversation not found"
+async def get_conversation(
+    conversation_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_db)
+):
+    """Get conversation by ID, served from the response cache when possible
+
+    An archived conversation is rehydrated first.
+    """
+    async def load():
+        await rehydrate(db, conversation_id)
+        result = await db.execute(
+            select(Conversation)
+            .options(CONVERSATION_MESSAGES)
+            .where(Conversation.id == conversation_id)
         )
+        conversation = result.scalars().first()
+        
+        if not conversation:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Conversation not found"
+            )
+        
+        tags = [f"user:{conversation.user_id}"]
+        tags += message_tags(m.id for m in conversation.messages)
+        return conversation, tags
     
-    return conversation
+    return await cached_response(
+        request, "get_conversation", ConversationResponse,
+        [f"conversation:{conversation_id}",
+         f"conversation:{conversation_id}:messages"],
+        load,
+    )
 
 @router.put("/{conversation_id}", response_model=ConversationResponse)
 async def update_conversation(
@@ -50,42 +80,79 @@ async def update_conversation(
     db: AsyncSession = Depends(get_db)
 ):
     """Update conversation by ID"""
-    result = await db.execute(select(Conversation).where(Conversation.id == conversation_id))
-    db_conversation = result.scalars().first()
+    row = await update_returning(
+        db, Conversation, conversation_id,
+        conversation_update.model_dump(exclude_unset=True)
+    )
     
-    if not db_conversation:
+    if row is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Conversation not found"
         )
     
-    # Update conversation fields
-    for field, value in conversation_update.model_dump(exclude_unset=True).items():
-        setattr(db_conversation, field, value)
-    
     await db.commit()
-    await db.refresh(db_conversation)
-    return db_conversation
+    await invalidate_tags(f"conversation:{conversation_id}")
+    return row
 
 @router.delete("/{conversation_id}")
-async def delete_conversation(conversation_id: int, db: AsyncSession = Depends(get_db)):
-    """Delete conversation by ID"""
-    result = await db.execute(select(Conversation).where(Conversation.id == conversation_id))
-    db_conversation = result.scalars().first()
+async def delete_conversation(
+    conversation_id: int,
+    response: Response,
+    background: bool = False,
+    db: AsyncSession = Depends(get_db)
+):
+    """Delete conversation by ID along with its messages and entities
+
+    With `background=true` the messages are removed in chunks by a delete job;
+    the response is 202 with the job, pollable at /jobs/delete/{job_id}.
+    """
+    if background:
+        user_id = await db.scalar(
+            select(Conversation.user_id).where(Conversation.id == conversation_id))
+        if user_id is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Conversation not found"
+            )
+        response.status_code = status.HTTP_202_ACCEPTED
+        return start_delete_job(
+            "conversation", conversation_id,
+            on_complete=lambda: invalidate_tags(
+                f"conversation:{conversation_id}", f"user:{user_id}:conversations"))
+
+    deleted = await delete_returning(db, Conversation, conversation_id)
     
-    if not db_conversation:
+    if deleted is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Conversation not found"
         )
     
-    await db.delete(db_conversation)
     await db.commit()
+    # The DELETE waited for any archiving in progress, so archived_at is current
+    if deleted.archived_at is not None:
+        await remove_archives([conversation_id])
+    await invalidate_tags(
+        f"conversation:{conversation_id}", f"user:{deleted.user_id}:conversations")
     return {"message": "Conversation deleted successfully"}
 
-@router.get("/", response_model=list[ConversationResponse])
-async def get_conversations(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
-    """Get all conversations with pagination"""
+@router.get("/", response_model=Union[list[ConversationResponse], CursorPage[ConversationResponse]])
+async def get_conversations(
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    pagination: Literal["offset", "cursor"] = "offset",
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Get all conversations with offset or keyset (cursor) pagination"""
+    if cursor is not None or pagination == "cursor":
+        result = await db.execute(
+            apply_keyset(select(Conversation), Conversation, cursor, limit)
+        )
+        items, next_cursor = keyset_page(result.scalars().all(), limit)
+        return {"items": items, "next_cursor": next_cursor}
+
     result = await db.execute(
         select(Conversation)
         .offset(skip)
@@ -95,11 +162,12 @@ async def get_conversations(skip: int = 0, limit: int = 100, db: AsyncSession =
     return conversations
 
 @router.get("/user/{user_id}", response_model=list[ConversationResponse])
-async def get_user_conversations(user_id: int, db: AsyncSession = Depends(get_db)):
+async def get_user_conversations(user_id: int, db: AsyncSession = Depends(get_read_db)):
     """Get all conversations for a specific user"""
     result = await db.execute(
         select(Conversation)
         .where(Conversation.user_id == user_id)
+        .order_by(Conversation.created_at.asc(), Conversation.id.asc())
     )
     conversations = result.scalars().all()
     return conversations
\ No newline at end of file
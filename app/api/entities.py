@@ -1,33 +1,86 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Literal, Optional, Union
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy import insert, literal
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from app.core.archive import rehydrate_message
+from app.core.broker import broker, entity_event
+from app.core.cache import invalidate_tags
+from app.core.dictionary import add_alias, find_type, intern_entities
+from app.core.pagination import apply_keyset, keyset_page
+from app.core.response_cache import cached_response
 from app.database.database import get_db
-from app.models import Entity, Message
-from app.schemas import EntityCreate, EntityUpdate, EntityResponse
+from app.database.replica import get_read_db
+from app.database.writes import (
+    FOREIGN_KEY_VIOLATION, delete_returning, integrity_code,
+    update_returning
+)
+from app.models import Conversation, Entity, Message
+from app.models.entity import ENTITY_COLUMNS
+from app.schemas import (
+    EntityAliasCreate, EntityAliasResponse, EntityCreate, EntityUpdate, EntityResponse,
+    CursorPage
+)
 
 router = APIRouter(prefix="/entities", tags=["entities"])
 
 @router.post("/", response_model=EntityResponse)
 async def create_entity(entity: EntityCreate, db: AsyncSession = Depends(get_db)):
     """Create a new entity"""
-    # Verify message exists
-    msg_result = await db.execute(select(Message).where(Message.id == entity.message_id))
-    message = msg_result.scalars().first()
-    
-    if not message:
+    pair = (entity.entity_type, entity.entity_value)
+    type_id, value_id = (await intern_entities(db, [pair]))[pair]
+    # The message's created_at completes the foreign key into its partition;
+    # no row is inserted if the message does not exist
+    message = (
+        select(Message.id, Message.created_at,
+               literal(type_id), literal(value_id), literal(entity.confidence_score))
+        .where(Message.id == entity.message_id)
+    )
+    try:
+        row = (await db.execute(
+            insert(Entity.__table__)
+            .from_select(["message_id", "message_created_at", "type_id", "value_id",
+                          "confidence_score"], message)
+            .returning(*ENTITY_COLUMNS,
+                       select(Message.conversation_id)
+                       .where(Message.id == entity.message_id)
+                       .scalar_subquery().label("conversation_id"))
+        )).one_or_none()
+    except IntegrityError as exc:
+        # The message was deleted concurrently
+        if integrity_code(exc) != FOREIGN_KEY_VIOLATION:
+            await db.rollback()
+            raise
+        row = None
+    if row is None:
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Message not found"
         )
-    
-    db_entity = Entity(**entity.model_dump())
-    db.add(db_entity)
     await db.commit()
-    await db.refresh(db_entity)
-    return db_entity
+    await invalidate_tags(f"message:{row.message_id}:entities")
+    await broker.publish(f"conversation:{row.conversation_id}", entity_event(row))
+    return row
+
+@router.post("/aliases", response_model=EntityAliasResponse)
+async def create_entity_alias(alias: EntityAliasCreate, db: AsyncSession = Depends(get_db)):
+    """Make another spelling resolve to an entity value, e.g. "NYC" to "New York"
+
+    Entities already stored under the alias are moved to the value.
+    """
+    try:
+        moved = await add_alias(db, alias.entity_type, alias.alias, alias.entity_value)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    await db.commit()
+    if moved:
+        await invalidate_tags(*{f"message:{message_id}:entities" for message_id in moved})
+    return {**alias.model_dump(), "entities_moved": len(moved)}
 
 @router.get("/{entity_id}", response_model=EntityResponse)
-async def get_entity(entity_id: int, db: AsyncSession = Depends(get_db)):
+async def get_entity(entity_id: int, db: AsyncSession = Depends(get_read_db)):
     """Get entity by ID"""
     result = await db.execute(select(Entity).where(Entity.id == entity_id))
     entity = result.scalars().first()
@@ -47,42 +100,63 @@ async def update_entity(
     db: AsyncSession = Depends(get_db)
 ):
     """Update entity by ID"""
-    result = await db.execute(select(Entity).where(Entity.id == entity_id))
-    db_entity = result.scalars().first()
+    values = entity_update.model_dump(exclude_unset=True)
+    if "entity_type" in values or "entity_value" in values:
+        # Values are interned per type, so both are needed to find the value
+        current = (await db.execute(
+            select(Entity.entity_type, Entity.entity_value).where(Entity.id == entity_id)
+        )).first()
+        if current is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Entity not found"
+            )
+        pair = (values.pop("entity_type", current.entity_type),
+                values.pop("entity_value", current.entity_value))
+        values["type_id"], values["value_id"] = (await intern_entities(db, [pair]))[pair]
+    row = await update_returning(db, Entity, entity_id, values, columns=ENTITY_COLUMNS)
     
-    if not db_entity:
+    if row is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Entity not found"
         )
     
-    # Update entity fields
-    for field, value in entity_update.model_dump(exclude_unset=True).items():
-        setattr(db_entity, field, value)
-    
     await db.commit()
-    await db.refresh(db_entity)
-    return db_entity
+    await invalidate_tags(f"message:{row.message_id}:entities")
+    return row
 
 @router.delete("/{entity_id}")
 async def delete_entity(entity_id: int, db: AsyncSession = Depends(get_db)):
     """Delete entity by ID"""
-    result = await db.execute(select(Entity).where(Entity.id == entity_id))
-    db_entity = result.scalars().first()
+    deleted = await delete_returning(db, Entity, entity_id)
     
-    if not db_entity:
+    if deleted is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Entity not found"
         )
     
-    await db.delete(db_entity)
     await db.commit()
+    await invalidate_tags(f"message:{deleted.message_id}:entities")
     return {"message": "Entity deleted successfully"}
 
-@router.get("/", response_model=list[EntityResponse])
-async def get_entities(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
-    """Get all entities with pagination"""
+@router.get("/", response_model=Union[list[EntityResponse], CursorPage[EntityResponse]])
+async def get_entities(
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    pagination: Literal["offset", "cursor"] = "offset",
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Get all entities with offset or keyset (cursor) pagination"""
+    if cursor is not None or pagination == "cursor":
+        result = await db.execute(
+            apply_keyset(select(Entity), Entity, cursor, limit)
+        )
+        items, next_cursor = keyset_page(result.scalars().all(), limit)
+        return {"items": items, "next_cursor": next_cursor}
+
     result = await db.execute(
         select(Entity)
         .offset(skip)
@@ -92,21 +166,71 @@ async def get_entities(skip: int = 0, limit: int = 100, db: AsyncSession = Depen
     return entities
 
 @router.get("/message/{message_id}", response_model=list[EntityResponse])
-async def get_message_entities(message_id: int, db: AsyncSession = Depends(get_db)):
-    """Get all entities for a specific message"""
-    result = await db.execute(
-        select(Entity)
-        .where(Entity.message_id == message_id)
+async def get_message_entities(
+    message_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_db)
+):
+    """Get all entities for a specific message, served from the response cache when possible
+
+    The message's conversation is rehydrated first if it is archived.
+    """
+    async def load():
+        owner_query = (
+            select(Message.conversation_id, Conversation.user_id)
+            .join(Conversation, Conversation.id == Message.conversation_id)
+            .where(Message.id == message_id)
+        )
+        owner = (await db.execute(owner_query)).first()
+        if owner is None and await rehydrate_message(db, message_id):
+            owner = (await db.execute(owner_query)).first()
+        if owner is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Message not found"
+            )
+
+        result = await db.execute(
+            select(Entity)
+            .where(Entity.message_id == message_id)
+            .order_by(Entity.id.asc())
+        )
+        entities = result.scalars().all()
+        # Ancestor tags cover the entities going away with a deleted
+        # conversation or user
+        tags = [f"conversation:{owner.conversation_id}", f"user:{owner.user_id}"]
+        return entities, tags
+
+    return await cached_response(
+        request, "get_message_entities", list[EntityResponse],
+        [f"message:{message_id}", f"message:{message_id}:entities"],
+        load,
     )
-    entities = result.scalars().all()
-    return entities
 
 @router.get("/type/{entity_type}", response_model=list[EntityResponse])
-async def get_entities_by_type(entity_type: str, db: AsyncSession = Depends(get_db)):
-    """Get all entities of a specific type"""
-    result = await db.execute(
-        select(Entity)
-        .where(Entity.entity_type == entity_type)
-    )
+async def get_entities_by_type(
+    entity_type: str,
+    entity_value: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Get all entities of a specific type, optionally with a specific value
+
+    Types and values match regardless of case and spacing, and through
+    aliases. For the most frequent values, use /analytics/entities/top
+    instead.
+    """
+    if entity_value is None:
+        type_id = await find_type(db, entity_type)
+        if type_id is None:
+            return []
+        stmt = select(Entity).where(Entity.type_id == type_id)
+    else:
+        pair = (entity_type, entity_value)
+        interned = await intern_entities(db, [pair], create=False)
+        if pair not in interned:
+            return []
+        type_id, value_id = interned[pair]
+        stmt = select(Entity).where(Entity.type_id == type_id, Entity.value_id == value_id)
+    result = await db.execute(stmt)
     entities = result.scalars().all()
     return entities
\ No newline at end of file
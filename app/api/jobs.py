@@ -0,0 +1,31 @@
+from fastapi import APIRouter, HTTPException, status
+from app.core.extraction import extraction_backlog
+from app.core.rollups import rollup_backlog
+from app.database.deletes import get_delete_job
+from app.schemas import DeleteJob, ExtractionBacklog, RollupBacklog
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+
+@router.get("/delete/{job_id}", response_model=DeleteJob)
+async def get_delete_job_status(job_id: str):
+    """Get the progress of a background delete started on this worker"""
+    job = get_delete_job(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Delete job not found"
+        )
+    return job
+
+
+@router.get("/extraction", response_model=ExtractionBacklog)
+async def get_extraction_backlog():
+    """Count messages queued for entity extraction, and those that failed for good"""
+    return await extraction_backlog()
+
+
+@router.get("/rollups", response_model=RollupBacklog)
+async def get_rollup_backlog():
+    """Count days whose entity analytics rollups wait to be recomputed"""
+    return await rollup_backlog()
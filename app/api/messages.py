@@ -1,36 +1,179 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+import json
+from datetime import datetime
+from typing import AsyncIterator, Literal, Optional, Union
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from app.database.database import get_db
-from app.models import Message, Conversation
-from app.schemas import MessageCreate, MessageUpdate, MessageResponse
+from app.core.config import settings
+from app.core.broker import broker, entity_event, message_event
+from app.core.archive import rehydrate, rehydrate_message
+from app.core.chat import ChatTimeout, Generation, chat_pipeline
+from app.core.context import build_context, update_summary
+from app.core.extraction import extraction_worker, insert_message, queue_extraction
+from app.core.cache import invalidate_tags
+from app.core.dictionary import intern_entities
+from app.core.pagination import apply_keyset, keyset_page
+from app.core.response_cache import cached_response, message_tags
+from app.core.search import find_messages
+from app.database.database import get_db, AsyncSessionLocal
+from app.database.replica import get_read_db
+from app.database.writes import (
+    FOREIGN_KEY_VIOLATION, delete_returning, integrity_code, update_returning
+)
+from app.models import Message, Conversation, Entity
+from app.models.entity import ENTITY_COLUMNS
+from app.models.loaders import MESSAGE_ENTITIES
+from app.models.message import MESSAGE_COLUMNS
+from app.schemas import (
+    MessageCreate, MessageUpdate, MessageResponse, CursorPage,
+    MessageBulkCreate, MessageBulkResult, MessageBulkResponse,
+    ChatTurnCreate, ChatTurnResponse, MessageSearchHit
+)
 
 router = APIRouter(prefix="/messages", tags=["messages"])
 
+async def _announce_message(row):
+    """Invalidate cached views of a new message's conversation and push it to subscribers"""
+    await invalidate_tags(f"conversation:{row.conversation_id}:messages")
+    await broker.publish(f"conversation:{row.conversation_id}", message_event(row))
+    extraction_worker.notify()
+
 @router.post("/", response_model=MessageResponse)
 async def create_message(message: MessageCreate, db: AsyncSession = Depends(get_db)):
-    """Create a new message"""
-    # Verify conversation exists
-    conv_result = await db.execute(select(Conversation).where(Conversation.id == message.conversation_id))
-    conversation = conv_result.scalars().first()
-    
-    if not conversation:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Conversation not found"
-        )
-    
-    db_message = Message(**message.model_dump())
-    db.add(db_message)
+    """Create a new message and queue it for entity extraction"""
+    try:
+        row = await insert_message(db, message.model_dump())
+    except IntegrityError as exc:
+        await db.rollback()
+        if integrity_code(exc) == FOREIGN_KEY_VIOLATION:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Conversation not found"
+            )
+        raise
     await db.commit()
-    await db.refresh(db_message)
-    return db_message
+    await _announce_message(row)
+    return row
+
+@router.post("/bulk", response_model=MessageBulkResponse)
+async def create_messages_bulk(payload: MessageBulkCreate, db: AsyncSession = Depends(get_db)):
+    """Create a batch of messages and their entities in one transaction
+
+    Conversation IDs are checked with a single query and rows are written with
+    multi-row INSERT ... RETURNING. Items whose conversation does not exist are
+    reported as failed without affecting the rest of the batch.
+    """
+    conversation_ids = {item.conversation_id for item in payload.messages}
+    result = await db.execute(
+        select(Conversation.id).where(Conversation.id.in_(conversation_ids))
+    )
+    existing = set(result.scalars().all())
+
+    results = {}
+    valid = []
+    for index, item in enumerate(payload.messages):
+        if item.conversation_id in existing:
+            valid.append((index, item))
+        else:
+            results[index] = MessageBulkResult(
+                index=index, status="failed", error="Conversation not found")
+
+    if valid:
+        message_rows = (await db.execute(
+            insert(Message).returning(
+                *MESSAGE_COLUMNS, sort_by_parameter_order=True),
+            [item.model_dump(exclude={"entities"}) for _, item in valid]
+        )).all()
+
+        # Items submitted with their entities skip extraction
+        await queue_extraction(db, [
+            row for row, (_, item) in zip(message_rows, valid) if not item.entities])
+
+        interned = await intern_entities(db, [
+            (entity.entity_type, entity.entity_value)
+            for _, item in valid for entity in item.entities])
+        entity_params = [
+            {"message_id": row.id, "message_created_at": row.created_at,
+             "confidence_score": entity.confidence_score,
+             **dict(zip(("type_id", "value_id"),
+                        interned[entity.entity_type, entity.entity_value]))}
+            for row, (_, item) in zip(message_rows, valid)
+            for entity in item.entities
+        ]
+        entities_by_message = {row.id: [] for row in message_rows}
+        entity_rows = []
+        if entity_params:
+            entity_rows = (await db.execute(
+                insert(Entity).returning(
+                    *ENTITY_COLUMNS, sort_by_parameter_order=True),
+                entity_params
+            )).all()
+            for entity_row in entity_rows:
+                entities_by_message[entity_row.message_id].append(
+                    dict(entity_row._mapping))
+
+        await db.commit()
+        extraction_worker.notify()
+        await invalidate_tags(*{
+            f"conversation:{row.conversation_id}:messages" for row in message_rows})
+        conversation_of = {row.id: row.conversation_id for row in message_rows}
+        for row in message_rows:
+            await broker.publish(f"conversation:{row.conversation_id}", message_event(row))
+        for entity_row in entity_rows:
+            await broker.publish(
+                f"conversation:{conversation_of[entity_row.message_id]}",
+                entity_event(entity_row))
+
+        for row, (index, _) in zip(message_rows, valid):
+            results[index] = MessageBulkResult(
+                index=index,
+                status="created",
+                message={**row._mapping, "entities": entities_by_message[row.id]}
+            )
+
+    return MessageBulkResponse(
+        created=len(valid),
+        failed=len(payload.messages) - len(valid),
+        results=[results[index] for index in range(len(payload.messages))]
+    )
+
+@router.get("/search", response_model=CursorPage[MessageSearchHit])
+async def search_messages(
+    q: str = Query(..., min_length=1, max_length=500),
+    fuzzy: bool = False,
+    user_id: Optional[int] = None,
+    conversation_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Search message content, best matches first
+
+    Full-text by default; fuzzy=true matches misspelled words by trigram
+    similarity. Matches are highlighted with <mark> tags.
+    """
+    items, next_cursor = await find_messages(
+        db, q, fuzzy=fuzzy, user_id=user_id, conversation_id=conversation_id,
+        cursor=cursor, limit=limit)
+    return {"items": items, "next_cursor": next_cursor}
 
 @router.get("/{message_id}", response_model=MessageResponse)
-async def get_message(message_id: int, db: AsyncSession = Depends(get_db)):
-    """Get message by ID"""
-    result = await db.execute(select(Message).where(Message.id == message_id))
+async def get_message(message_id: int, db: AsyncSession = Depends(get_read_db)):
+    """Get message by ID, rehydrating its conversation if it is archived"""
+    query = select(Message).options(MESSAGE_ENTITIES).where(Message.id == message_id)
+    result = await db.execute(query)
     message = result.scalars().first()
+
+    if not message:
+        # Rehydrating writes, so it goes to the primary, and the message is
+        # read back from there rather than from a replica that may lag
+        async with AsyncSessionLocal() as session:
+            if await rehydrate_message(session, message_id):
+                message = (await session.execute(query)).scalars().first()
     
     if not message:
         raise HTTPException(
@@ -47,42 +190,52 @@ async def update_message(
     db: AsyncSession = Depends(get_db)
 ):
     """Update message by ID"""
-    result = await db.execute(select(Message).where(Message.id == message_id))
-    db_message = result.scalars().first()
+    row = await update_returning(
+        db, Message, message_id, message_update.model_dump(exclude_unset=True)
+    )
     
-    if not db_message:
+    if row is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Message not found"
         )
     
-    # Update message fields
-    for field, value in message_update.model_dump(exclude_unset=True).items():
-        setattr(db_message, field, value)
-    
     await db.commit()
-    await db.refresh(db_message)
-    return db_message
+    await invalidate_tags(f"message:{message_id}")
+    return row
 
 @router.delete("/{message_id}")
 async def delete_message(message_id: int, db: AsyncSession = Depends(get_db)):
-    """Delete message by ID"""
-    result = await db.execute(select(Message).where(Message.id == message_id))
-    db_message = result.scalars().first()
+    """Delete message by ID along with its entities"""
+    deleted = await delete_returning(db, Message, message_id)
     
-    if not db_message:
+    if deleted is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Message not found"
         )
     
-    await db.delete(db_message)
     await db.commit()
+    await invalidate_tags(
+        f"message:{message_id}", f"conversation:{deleted.conversation_id}:messages")
     return {"message": "Message deleted successfully"}
 
-@router.get("/", response_model=list[MessageResponse])
-async def get_messages(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
-    """Get all messages with pagination"""
+@router.get("/", response_model=Union[list[MessageResponse], CursorPage[MessageResponse]])
+async def get_messages(
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    pagination: Literal["offset", "cursor"] = "offset",
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Get all messages with offset or keyset (cursor) pagination"""
+    if cursor is not None or pagination == "cursor":
+        result = await db.execute(
+            apply_keyset(select(Message), Message, cursor, limit)
+        )
+        items, next_cursor = keyset_page(result.scalars().all(), limit)
+        return {"items": items, "next_cursor": next_cursor}
+
     result = await db.execute(
         select(Message)
         .offset(skip)
@@ -92,12 +245,352 @@ async def get_messages(skip: int = 0, limit: int = 100, db: AsyncSession = Depen
     return messages
 
 @router.get("/conversation/{conversation_id}", response_model=list[MessageResponse])
-async def get_conversation_messages(conversation_id: int, db: AsyncSession = Depends(get_db)):
-    """Get all messages for a specific conversation"""
+async def get_conversation_messages(
+    conversation_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_db)
+):
+    """Get all messages for a specific conversation, served from the response cache when possible"""
+    async def load():
+        await rehydrate(db, conversation_id)
+        result = await db.execute(
+            select(Message)
+            .options(MESSAGE_ENTITIES)
+            .where(Message.conversation_id == conversation_id)
+            .order_by(Message.created_at.asc(), Message.id.asc())
+        )
+        messages = result.scalars().all()
+        # The owner's tag covers the messages going away with a deleted user
+        user_id = await db.scalar(
+            select(Conversation.user_id).where(Conversation.id == conversation_id))
+        tags = message_tags(m.id for m in messages)
+        if user_id is not None:
+            tags.append(f"user:{user_id}")
+        return messages, tags
+
+    return await cached_response(
+        request, "get_conversation_messages", list[MessageResponse],
+        [f"conversation:{conversation_id}",
+         f"conversation:{conversation_id}:messages"],
+        load,
+    )
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+async def _stream_conversation_messages(
+    conversation_id: int, include_entities: bool
+) -> AsyncIterator[list]:
+    """Yield a conversation's messages in batches through a server-side cursor
+
+    Uses its own session so the cursor stays open for the whole response.
+    Entities are fetched with one IN query per batch.
+    """
+    batch_size = settings.export_batch_size
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(
+            select(*MESSAGE_COLUMNS)
+            .where(Message.conversation_id == conversation_id)
+            .order_by(Message.created_at.asc(), Message.id.asc())
+            .execution_options(yield_per=batch_size)
+        )
+        async for partition in result.partitions(batch_size):
+            messages = [dict(row._mapping) for row in partition]
+            if include_entities:
+                by_message = {message["id"]: [] for message in messages}
+                entity_result = await session.execute(
+                    select(*ENTITY_COLUMNS)
+                    .where(Entity.message_id.in_(list(by_message)))
+                    .order_by(Entity.id.asc())
+                )
+                for row in entity_result:
+                    by_message[row.message_id].append(dict(row._mapping))
+                for message in messages:
+                    message["entities"] = by_message[message["id"]]
+            yield messages
+
+async def _encode_ndjson(batches: AsyncIterator[list]) -> AsyncIterator[str]:
+    async for batch in batches:
+        yield "".join(
+            json.dumps(message, default=_json_default) + "\n" for message in batch
+        )
+
+async def _encode_json_array(batches: AsyncIterator[list]) -> AsyncIterator[str]:
+    first = True
+    yield "["
+    async for batch in batches:
+        for message in batch:
+            prefix = "" if first else ","
+            first = False
+            yield prefix + json.dumps(message, default=_json_default)
+    yield "]"
+
+@router.get("/conversation/{conversation_id}/export")
+async def export_conversation_messages(
+    conversation_id: int,
+    format: Literal["ndjson", "json"] = "ndjson",
+    include_entities: bool = False,
+    db: AsyncSession = Depends(get_db)
+):
+    """Stream a conversation's full history as NDJSON or a chunked JSON array"""
+    await rehydrate(db, conversation_id)
     result = await db.execute(
-        select(Message)
-        .where(Message.conversation_id == conversation_id)
-        .order_by(Message.created_at.asc())
+        select(Conversation.id).where(Conversation.id == conversation_id)
     )
-    messages = result.scalars().all()
-    return messages
\ No newline at end of file
+    if result.scalar() is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Conversation not found"
+        )
+
+    batches = _stream_conversation_messages(conversation_id, include_entities)
+    if format == "json":
+        return StreamingResponse(
+            _encode_json_array(batches), media_type="application/json")
+    return StreamingResponse(
+        _encode_ndjson(batches), media_type="application/x-ndjson")
+
+async def _conversation_exists(conversation_id: int) -> bool:
+    """Whether the conversation exists, rehydrating it for replay if archived"""
+    # A short-lived session: get_db would hold its connection for as long as
+    # the subscription stays open
+    async with AsyncSessionLocal() as session:
+        await rehydrate(session, conversation_id)
+        result = await session.execute(
+            select(Conversation.id).where(Conversation.id == conversation_id)
+        )
+        return result.scalar() is not None
+
+async def _replay_events(conversation_id: int, after: int) -> list:
+    """Events for the messages created after message `after`, and their entities"""
+    async with AsyncSessionLocal() as session:
+        messages = (await session.execute(
+            select(*MESSAGE_COLUMNS)
+            .where(Message.conversation_id == conversation_id, Message.id > after)
+            .order_by(Message.id.asc())
+        )).all()
+        entities = []
+        if messages:
+            entities = (await session.execute(
+                select(*ENTITY_COLUMNS)
+                .where(Entity.message_id.in_([m.id for m in messages]))
+                .order_by(Entity.id.asc())
+            )).all()
+    return ([message_event(row) for row in messages]
+            + [entity_event(row) for row in entities])
+
+async def _conversation_events(
+    conversation_id: int, after: Optional[int]
+) -> AsyncIterator[Optional[dict]]:
+    """Yield replayed, then live events of a conversation
+
+    Yields None when no event arrived within the keepalive interval, and a
+    final "overflow" event if this subscriber fell too far behind.
+    """
+    with broker.subscribe(f"conversation:{conversation_id}") as subscription:
+        # Subscribed before replaying, so rows committed in between are seen
+        # live and skipped if the replay already included them
+        seen = {"message": 0, "entity": 0}
+        if after is not None:
+            for event in await _replay_events(conversation_id, after):
+                seen[event["type"]] = max(seen[event["type"]], event["id"])
+                yield event
+        while True:
+            event = await subscription.get(timeout=settings.pubsub_keepalive_seconds)
+            if event is None:
+                if subscription.overflowed:
+                    yield {"type": "overflow"}
+                    return
+                yield None
+            elif event["id"] > seen[event["type"]]:
+                yield event
+
+async def _encode_sse(events: AsyncIterator[Optional[dict]]) -> AsyncIterator[str]:
+    async for event in events:
+        if event is None:
+            yield ": keepalive\n\n"
+        elif event["type"] == "overflow":
+            yield "event: overflow\ndata: {}\n\n"
+        elif event["type"] == "message":
+            # Only messages carry an id, so Last-Event-ID is a message id
+            yield f"id: {event['id']}\nevent: message\ndata: {event['data']}\n\n"
+        else:
+            yield f"event: {event['type']}\ndata: {event['data']}\n\n"
+
+@router.get("/conversation/{conversation_id}/events")
+async def stream_conversation_events(
+    conversation_id: int,
+    request: Request,
+    after: Optional[int] = None
+):
+    """Push new messages and entities of a conversation as server-sent events
+
+    Reconnecting clients resume from the Last-Event-ID header (or `after`, a
+    message id): newer messages and their entities are replayed first. After
+    an `overflow` event the stream ends and the client should reconnect.
+    """
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id and last_event_id.isdigit():
+        after = int(last_event_id)
+    if not await _conversation_exists(conversation_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Conversation not found"
+        )
+    return StreamingResponse(
+        _encode_sse(_conversation_events(conversation_id, after)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def _send_events(websocket: WebSocket, events: AsyncIterator[Optional[dict]]):
+    async for event in events:
+        if event is None:
+            continue
+        if event["type"] == "overflow":
+            await websocket.close(code=1013, reason="Subscriber fell behind")
+            return
+        await websocket.send_text(
+            f'{{"type":"{event["type"]}","data":{event["data"]}}}')
+
+async def _wait_for_disconnect(websocket: WebSocket):
+    while (await websocket.receive())["type"] != "websocket.disconnect":
+        pass
+
+@router.websocket("/conversation/{conversation_id}/ws")
+async def conversation_events_websocket(
+    websocket: WebSocket,
+    conversation_id: int,
+    after: Optional[int] = None
+):
+    """Push new messages and entities of a conversation over a WebSocket
+
+    Sends {"type": "message" | "entity", "data": {...}} frames, replaying
+    messages newer than `after` first. Closes with 1013 if the client falls
+    too far behind.
+    """
+    if not await _conversation_exists(conversation_id):
+        await websocket.close(code=1008, reason="Conversation not found")
+        return
+    await websocket.accept()
+    events = _conversation_events(conversation_id, after)
+    sender = asyncio.create_task(_send_events(websocket, events))
+    receiver = asyncio.create_task(_wait_for_disconnect(websocket))
+    try:
+        await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in (sender, receiver):
+            task.cancel()
+        await asyncio.gather(sender, receiver, return_exceptions=True)
+        await events.aclose()
+
+async def _store_reply(conversation_id: int, generation: Generation):
+    """Store a finished reply as an "ai" message
+
+    Runs apart from the request, so the reply is kept even if the client
+    disconnects. Returns None if the model call failed or the conversation
+    was deleted in the meantime.
+    """
+    try:
+        content = await generation.result()
+    except Exception:
+        return None
+    async with AsyncSessionLocal() as session:
+        try:
+            row = await insert_message(session, {
+                "conversation_id": conversation_id,
+                "sender_type": "ai",
+                "content": content,
+            })
+        except IntegrityError as exc:
+            if integrity_code(exc) == FOREIGN_KEY_VIOLATION:
+                return None
+            raise
+        await session.commit()
+    await _announce_message(row)
+    chat_pipeline.spawn(update_summary(conversation_id))
+    return row
+
+def _chat_error(exc: Exception) -> HTTPException:
+    if isinstance(exc, ChatTimeout):
+        return HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="The assistant did not reply in time"
+        )
+    return HTTPException(
+        status_code=status.HTTP_502_BAD_GATEWAY,
+        detail="The assistant failed to reply"
+    )
+
+async def _encode_chat_sse(message, generation: Generation, reply_task) -> AsyncIterator[str]:
+    yield f"event: message\ndata: {message_event(message)['data']}\n\n"
+    try:
+        async for token in generation.stream():
+            yield f"event: token\ndata: {json.dumps(token)}\n\n"
+    except Exception as exc:
+        detail = json.dumps({"detail": _chat_error(exc).detail})
+        yield f"event: error\ndata: {detail}\n\n"
+        return
+    reply = await asyncio.shield(reply_task)
+    if reply is not None:
+        yield f"event: reply\ndata: {message_event(reply)['data']}\n\n"
+
+@router.post("/conversation/{conversation_id}/chat", response_model=ChatTurnResponse)
+async def chat_turn(
+    conversation_id: int,
+    turn: ChatTurnCreate,
+    stream: bool = True,
+    db: AsyncSession = Depends(get_db)
+):
+    """Store a user message and answer it with an AI reply
+
+    The model sees the conversation's rolling summary and its newest
+    messages within the token budget (see app.core.context). With `stream` (the default) the response is server-sent
+    events: `message` with the stored user message, a `token` per chunk of
+    the reply, then `reply` with the stored AI message, or `error` if the
+    model failed or timed out. Otherwise the stored pair is returned once
+    the reply is complete. Returns 503 without storing anything when the
+    assistant is saturated or no chat backend is configured.
+    """
+    # The prompt is built from the conversation's history
+    await rehydrate(db, conversation_id)
+    try:
+        row = await insert_message(db, {
+            "conversation_id": conversation_id,
+            "sender_type": "user",
+            "content": turn.content,
+        })
+    except IntegrityError as exc:
+        await db.rollback()
+        if integrity_code(exc) == FOREIGN_KEY_VIOLATION:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Conversation not found"
+            )
+        raise
+    history = await build_context(db, conversation_id)
+    # Admit the model call before committing, so a 503 stores nothing
+    generation = chat_pipeline.generate(history)
+    await db.commit()
+    await _announce_message(row)
+    reply_task = chat_pipeline.spawn(_store_reply(conversation_id, generation))
+
+    if stream:
+        return StreamingResponse(
+            _encode_chat_sse(row, generation, reply_task),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    try:
+        await generation.result()
+    except Exception as exc:
+        raise _chat_error(exc)
+    reply = await asyncio.shield(reply_task)
+    if reply is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Conversation not found"
+        )
+    return {"message": row, "reply": reply}
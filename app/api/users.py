@@ -1,136 +1,343 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Literal, Optional, Union
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload, joinedload
+from sqlalchemy.orm import selectinload, joinedload, load_only, noload
+from app.core.archive import lock_archived, remove_archives
+from app.core.cache import invalidate_tags
+from app.core.config import settings
+from app.core.pagination import apply_keyset, keyset_page
+from app.core.response_cache import cached_response, message_tags
+from app.core.responses import ORJSONResponse
 from app.database.database import get_db
-from app.models import User, Conversation, Message
-from app.schemas import UserCreate, UserUpdate, UserResponse, UserBasic
-from app.core.auth import get_password_hash, get_current_user
+from app.database.replica import get_read_db
+from app.database.deletes import start_delete_job
+from app.database.writes import (
+    UNIQUE_VIOLATION, delete_returning, insert_returning, integrity_code,
+    update_returning
+)
+from app.models import User, Conversation, Message, Entity
+from app.schemas import UserCreate, UserUpdate, UserResponse, UserBasic, UserProjection, CursorPage
+from app.core.auth import get_password_hash_async, get_current_user, principal_tag
 
 router = APIRouter(prefix="/users", tags=["users"])
 
+USER_FIELDS = ("id", "username", "email", "full_name",
+               "is_active", "created_at", "updated_at")
+BASIC_FIELDS = tuple(UserBasic.model_fields)
+CONVERSATION_FIELDS = ("id", "user_id", "title",
+                       "is_active", "created_at", "updated_at")
+MESSAGE_FIELDS = ("id", "conversation_id", "sender_type",
+                  "content", "created_at", "updated_at")
+ENTITY_FIELDS = ("id", "message_id", "entity_type", "entity_value",
+                 "confidence_score", "created_at", "updated_at")
 
-@router.post("/", response_model=UserResponse)
-async def create_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
-    """Create a new user"""
-    # Check if user already exists
-    result = await db.execute(
-        select(User).where((User.username == user.username)
-                           | (User.email == user.email))
-    )
-    existing_user = result.scalars().first()
-
-    if existing_user:
+# Each path also loads the relations before it
+EXPAND_PATHS = ("conversations", "conversations.messages",
+                "conversations.messages.entities")
+
+
+def _parse_fields(fields: Optional[str]) -> tuple:
+    """Resolve the `fields` query parameter to user columns, always including id"""
+    if not fields:
+        return BASIC_FIELDS
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = sorted(set(requested) - set(USER_FIELDS))
+    if unknown:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Username or email already registered"
+            detail=f"Unknown user fields: {', '.join(unknown)}"
         )
+    return ("id",) + tuple(dict.fromkeys(f for f in requested if f != "id"))
+
+
+def _parse_expand(expand: Optional[str]) -> int:
+    """Resolve the `expand` query parameter to a relation depth below User"""
+    depth = 0
+    for path in (expand or "").split(","):
+        path = path.strip()
+        if not path:
+            continue
+        if path not in EXPAND_PATHS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown expand path: {path}"
+            )
+        depth = max(depth, EXPAND_PATHS.index(path) + 1)
+    return depth
+
+
+def _user_query(fields: tuple, depth: int):
+    """Select users loading only the requested columns and relations"""
+    # created_at is needed for keyset cursors even when not returned
+    columns = dict.fromkeys(("id", "created_at") + fields)
+    stmt = select(User).options(load_only(*(getattr(User, c) for c in columns)))
+    if depth == 0:
+        return stmt.options(noload(User.conversations))
+    loader = selectinload(User.conversations)
+    if depth >= 2:
+        loader = loader.selectinload(Conversation.messages)
+    if depth >= 3:
+        loader = loader.selectinload(Message.entities)
+    return stmt.options(loader)
+
+
+def _user_tags(user: User, depth: int) -> list:
+    """Response cache tags of the relations loaded for `depth`"""
+    tags = []
+    if depth >= 1:
+        for conversation in user.conversations:
+            tags.append(f"conversation:{conversation.id}")
+            if depth >= 2:
+                tags.append(f"conversation:{conversation.id}:messages")
+                tags += message_tags(m.id for m in conversation.messages)
+    return tags
+
 
+async def _attach_children(db: AsyncSession, model, fields: tuple, fk: str,
+                           parents: dict, key: str) -> dict:
+    """Load `model` rows for the parent dicts into `parent[key]`, returning them by id"""
+    for parent in parents.values():
+        parent[key] = []
+    table = model.__table__
+    # Model attributes, so lookups like Entity.entity_type come along
+    columns = [getattr(model, f) for f in fields]
+    parent_ids = list(parents)
+    children = {}
+    # Chunked like selectinload to keep the IN list within bind parameter limits
+    for start in range(0, len(parent_ids), 500):
+        result = await db.execute(
+            select(*columns)
+            .where(table.c[fk].in_(parent_ids[start:start + 500]))
+            .order_by(table.c.id)
+        )
+        for row in result:
+            child = dict(row._mapping)
+            parents[child[fk]][key].append(child)
+            children[child["id"]] = child
+    return children
+
+
+async def _assemble_users(db: AsyncSession, rows, fields: tuple, depth: int) -> list:
+    """Build the get_users payload from user row tuples, without ORM objects
+
+    Each expanded relation costs one query, as with selectinload.
+    """
+    users = {row.id: {f: getattr(row, f) for f in fields} for row in rows}
+    if depth >= 1:
+        conversations = await _attach_children(
+            db, Conversation, CONVERSATION_FIELDS, "user_id", users, "conversations")
+    if depth >= 2:
+        messages = await _attach_children(
+            db, Message, MESSAGE_FIELDS, "conversation_id", conversations, "messages")
+    if depth >= 3:
+        await _attach_children(
+            db, Entity, ENTITY_FIELDS, "message_id", messages, "entities")
+    return list(users.values())
+
+
+def _serialize_user(user: User, fields: tuple, depth: int) -> dict:
+    """Build a response dict containing only loaded columns and relations"""
+    data = {f: getattr(user, f) for f in fields}
+    if depth >= 1:
+        data["conversations"] = []
+        for conversation in user.conversations:
+            conv_data = {f: getattr(conversation, f)
+                         for f in CONVERSATION_FIELDS}
+            if depth >= 2:
+                conv_data["messages"] = []
+                for message in conversation.messages:
+                    msg_data = {f: getattr(message, f) for f in MESSAGE_FIELDS}
+                    if depth >= 3:
+                        msg_data["entities"] = [
+                            {f: getattr(entity, f) for f in ENTITY_FIELDS}
+                            for entity in message.entities
+                        ]
+                    conv_data["messages"].append(msg_data)
+            data["conversations"].append(conv_data)
+    return data
+
+
+@router.post("/", response_model=UserResponse)
+async def create_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
+    """Create a new user"""
     # Hash the password
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash_async(user.password)
     user_data = user.model_dump()
     user_data.pop("password")  # Remove plain password
     user_data["hashed_password"] = hashed_password
 
-    db_user = User(**user_data)
-    db.add(db_user)
-    await db.commit()
-    await db.refresh(db_user)
-    return db_user
-
-
-@router.get("/{user_id}", response_model=UserResponse)
-async def get_user(user_id: int, db: AsyncSession = Depends(get_db)):
-    """Get user by ID with full details"""
-    result = await db.execute(
-        select(User)
-        .options(
-            selectinload(User.conversations).options(
-                selectinload(Conversation.messages).options(
-                    selectinload(Message.entities)
-                )
+    # The unique constraints on username/email reject duplicates
+    try:
+        row = await insert_returning(db, User, user_data)
+    except IntegrityError as exc:
+        await db.rollback()
+        if integrity_code(exc) == UNIQUE_VIOLATION:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Username or email already registered"
             )
+        raise
+    await db.commit()
+    return row
+
+
+@router.get("/{user_id}", response_model=UserProjection, response_model_exclude_unset=True)
+async def get_user(
+    user_id: int,
+    request: Request,
+    expand: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Get user by ID, expanding only the requested relations
+
+    Served from the response cache when possible.
+    """
+    user_fields = _parse_fields(fields)
+    depth = _parse_expand(expand)
+
+    async def load():
+        result = await db.execute(
+            _user_query(user_fields, depth).where(User.id == user_id)
         )
-        .where(User.id == user_id)
-    )
-    user = result.scalars().first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-    return user
+        user = result.scalars().first()
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found"
+            )
+        return _serialize_user(user, user_fields, depth), _user_tags(user, depth)
+
+    tags = [f"user:{user_id}"]
+    if depth >= 1:
+        tags.append(f"user:{user_id}:conversations")
+    return await cached_response(
+        request, "get_user", UserProjection, tags, load, exclude_unset=True)
 
 
 @router.put("/{user_id}", response_model=UserResponse)
 async def update_user(user_id: int, user_update: UserUpdate, db: AsyncSession = Depends(get_db)):
-    # Fetch the user with conversations eagerly loaded
-    result = await db.execute(
-        select(User)
-        .options(
-            selectinload(User.conversations).selectinload(
-                Conversation.messages)
-        )
-        .where(User.id == user_id)
-    )
-    user = result.scalars().first()
+    """Update the given fields of a user and return its columns
 
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    `conversations` is not loaded and comes back null; use
+    GET /users/{user_id}?expand=conversations for them. An empty body
+    changes nothing and returns the user as it is.
+    """
+    values = user_update.model_dump(exclude_unset=True)
+    if not values:
+        users = User.__table__
+        row = (await db.execute(select(users).where(users.c.id == user_id))).one_or_none()
+        if row is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        return row
+    if "password" in values:
+        values["hashed_password"] = await get_password_hash_async(values.pop("password"))
+    # Principals cached under the old username must go too
+    previous_username = None
+    if "username" in values:
+        previous_username = await db.scalar(
+            select(User.username).where(User.id == user_id))
 
-    # Update user fields
-    for key, value in user_update.model_dump(exclude_unset=True).items():
-        setattr(user, key, value)
-
-    await db.commit()
-    await db.refresh(user)
-
-    # Re-fetch with all relationships loaded for serialization
-    result = await db.execute(
-        select(User)
-        .options(
-            selectinload(User.conversations).options(
-                selectinload(Conversation.messages).options(
-                    selectinload(Message.entities)
-                )
+    try:
+        row = await update_returning(db, User, user_id, values)
+    except IntegrityError as exc:
+        await db.rollback()
+        if integrity_code(exc) == UNIQUE_VIOLATION:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Username or email already registered"
             )
-        )
-        .where(User.id == user_id)
-    )
-    user = result.scalars().first()
+        raise
 
-    return UserResponse.model_validate(user)
+    if row is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    await db.commit()
+    await invalidate_tags(f"user:{user_id}", principal_tag(row.username),
+                          *([principal_tag(previous_username)] if previous_username else []))
+    return row
 
 
 @router.delete("/{user_id}")
-async def delete_user(user_id: int, db: AsyncSession = Depends(get_db)):
-    """Delete user by ID"""
-    result = await db.execute(select(User).where(User.id == user_id))
-    db_user = result.scalars().first()
+async def delete_user(
+    user_id: int,
+    response: Response,
+    background: bool = False,
+    db: AsyncSession = Depends(get_db)
+):
+    """Delete user by ID along with their conversations, messages and entities
 
-    if not db_user:
+    With `background=true` the history is removed in chunks by a delete job;
+    the response is 202 with the job, pollable at /jobs/delete/{job_id}.
+    """
+    if background:
+        username = await db.scalar(select(User.username).where(User.id == user_id))
+        if username is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found"
+            )
+        response.status_code = status.HTTP_202_ACCEPTED
+        return start_delete_job(
+            "user", user_id, on_complete=lambda: invalidate_tags(
+                f"user:{user_id}", principal_tag(username)))
+
+    archived = await lock_archived(db, Conversation.user_id == user_id)
+    deleted = await delete_returning(db, User, user_id)
+
+    if deleted is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
 
-    await db.delete(db_user)
     await db.commit()
+    await remove_archives(archived)
+    await invalidate_tags(f"user:{user_id}", principal_tag(deleted.username))
     return {"message": "User deleted successfully"}
 
 
-@router.get("/", response_model=list[UserResponse])
-async def get_users(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
-    """Get all users with pagination"""
-    result = await db.execute(
-        select(User)
-        .options(
-            selectinload(User.conversations)
-            .selectinload(Conversation.messages)
-            .selectinload(Message.entities)
-        )
-        .offset(skip)
-        .limit(limit)
-    )
+@router.get(
+    "/",
+    response_model=Union[list[UserProjection], CursorPage[UserProjection]],
+    response_model_exclude_unset=True
+)
+async def get_users(
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    pagination: Literal["offset", "cursor"] = "offset",
+    expand: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Get users as a basic listing, expanding only the requested relations"""
+    user_fields = _parse_fields(fields)
+    depth = _parse_expand(expand)
+    paginate = cursor is not None or pagination == "cursor"
+    if settings.fast_json_responses:
+        columns = dict.fromkeys(("id", "created_at") + user_fields)
+        stmt = select(*(User.__table__.c[c] for c in columns))
+        if paginate:
+            result = await db.execute(apply_keyset(stmt, User, cursor, limit))
+            rows, next_cursor = keyset_page(result.all(), limit)
+            items = await _assemble_users(db, rows, user_fields, depth)
+            return ORJSONResponse({"items": items, "next_cursor": next_cursor})
+        result = await db.execute(stmt.offset(skip).limit(limit))
+        return ORJSONResponse(
+            await _assemble_users(db, result.all(), user_fields, depth))
+
+    stmt = _user_query(user_fields, depth)
+    if paginate:
+        result = await db.execute(apply_keyset(stmt, User, cursor, limit))
+        items, next_cursor = keyset_page(result.scalars().all(), limit)
+        return {
+            "items": [_serialize_user(u, user_fields, depth) for u in items],
+            "next_cursor": next_cursor
+        }
+
+    result = await db.execute(stmt.offset(skip).limit(limit))
     users = result.scalars().all()
-    return users
+    return [_serialize_user(u, user_fields, depth) for u in users]
@@ -0,0 +1,259 @@
+"""Cold storage for inactive conversations
+
+archive_conversations.py moves conversations that are marked inactive and
+have had no message for ARCHIVE_AFTER_DAYS out of the messages and entities
+tables. Each one becomes a gzipped NDJSON file under ARCHIVE_DIR, and its
+archived_at is set. The lines are the ones the NDJSON export writes with
+entities included: one message per line, its entities as type and value
+strings.
+
+Routes that read one conversation's messages call rehydrate() first. It
+loads an archived conversation back with its original ids and timestamps,
+then deletes the file. archived_messages maps the ids of archived messages
+to their conversation, so routes given a message id can call
+rehydrate_message() when the message is not found. Listings across conversations (search, GET /messages,
+expanded users) do not see archived messages, and entity analytics leave
+them out until they are rehydrated.
+
+Archiving and rehydrating lock the conversation row FOR NO KEY UPDATE, so
+they never interleave, while new messages can still be added. The file is
+written and fsynced before any row is deleted.
+
+Deleting a user or conversation removes the archive files of its archived
+conversations once the delete has committed (see lock_archived()).
+"""
+import asyncio
+import gzip
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Optional
+from sqlalchemy import and_, delete, exists, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.cache import invalidate_tags
+from app.core.config import settings
+from app.core.dictionary import intern_entities
+from app.core.metrics import Counter
+from app.core.response_cache import message_tags
+from app.models import ArchivedMessage, Conversation, Entity, Message
+from app.models.entity import ENTITY_COLUMNS
+from app.models.message import MESSAGE_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_CONVERSATIONS = Counter(
+    "archive_conversations_total",
+    "Conversations moved to cold storage or back, by action (archived or rehydrated)",
+    ("action",),
+)
+
+TIMESTAMP_FIELDS = ("created_at", "updated_at")
+# What an archived entity keeps; its message and ids come from the line it is on
+ENTITY_FIELDS = ("id", "entity_type", "entity_value", "confidence_score",
+                 "created_at", "updated_at")
+
+
+def archive_path(conversation_id: int) -> Path:
+    """Where a conversation's archive file lives, 10,000 conversations per directory"""
+    return (Path(settings.archive_dir) / str(conversation_id // 10000)
+            / f"{conversation_id}.ndjson.gz")
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _write(path: Path, messages: List[dict]):
+    """Write the file under a temporary name, fsync it, then move it in place"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_suffix(".partial")
+    with open(partial, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as file:
+            for message in messages:
+                file.write(json.dumps(message, default=_json_default).encode() + b"\n")
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(partial, path)
+
+
+def _read(path: Path) -> List[dict]:
+    with gzip.open(path, "rt") as file:
+        return [json.loads(line) for line in file]
+
+
+def _parse_times(row: dict) -> dict:
+    return {key: datetime.fromisoformat(value) if key in TIMESTAMP_FIELDS and value else value
+            for key, value in row.items()}
+
+
+async def find_archivable(db: AsyncSession, idle_for: timedelta, limit: int) -> List[int]:
+    """Ids of inactive conversations with messages, none newer than `idle_for`"""
+    cutoff = func.now() - idle_for
+    messages = exists().where(Message.conversation_id == Conversation.id)
+    result = await db.execute(
+        select(Conversation.id)
+        .where(Conversation.is_active.is_(False), Conversation.archived_at.is_(None),
+               messages, ~messages.where(Message.created_at >= cutoff))
+        .order_by(Conversation.id)
+        .limit(limit)
+    )
+    return list(result.scalars())
+
+
+async def archive_conversation(db: AsyncSession, conversation_id: int, idle_for: timedelta) -> int:
+    """Move a conversation's messages and entities to its archive file
+
+    Returns how many messages were archived; 0 if the conversation no longer
+    qualifies. Commits the caller's transaction.
+    """
+    conversation = (await db.execute(
+        select(Conversation.is_active, Conversation.archived_at)
+        .where(Conversation.id == conversation_id)
+        .with_for_update(key_share=True)
+    )).first()
+    recent = await db.scalar(select(exists().where(
+        Message.conversation_id == conversation_id,
+        Message.created_at >= func.now() - idle_for)))
+    if (conversation is None or conversation.is_active is not False
+            or conversation.archived_at is not None or recent):
+        await db.rollback()
+        return 0
+
+    messages = [dict(row._mapping) for row in await db.execute(
+        select(*MESSAGE_COLUMNS)
+        .where(Message.conversation_id == conversation_id)
+        .order_by(Message.created_at.asc(), Message.id.asc())
+    )]
+    if not messages:
+        await db.rollback()
+        return 0
+    by_message = {message["id"]: message for message in messages}
+    for message in messages:
+        message["entities"] = []
+    entities = await db.execute(
+        select(*ENTITY_COLUMNS)
+        .join(Message, and_(Message.id == Entity.message_id,
+                            Message.created_at == Entity.message_created_at))
+        .where(Message.conversation_id == conversation_id)
+        .order_by(Entity.id.asc())
+    )
+    for row in entities:
+        by_message[row.message_id]["entities"].append(
+            {field: row._mapping[field] for field in ENTITY_FIELDS})
+
+    await asyncio.to_thread(_write, archive_path(conversation_id), messages)
+
+    # Messages added since they were read are newer than every archived one
+    newest = max(message["created_at"] for message in messages)
+    deleted = await db.execute(
+        delete(Message)
+        .where(Message.conversation_id == conversation_id, Message.created_at <= newest)
+    )
+    if deleted.rowcount != len(messages):
+        await db.rollback()
+        logger.warning("Conversation %d changed while it was archived; skipped", conversation_id)
+        return 0
+    await db.execute(insert(ArchivedMessage), [
+        {"message_id": message_id, "conversation_id": conversation_id}
+        for message_id in by_message])
+    await db.execute(
+        update(Conversation).where(Conversation.id == conversation_id)
+        .values(archived_at=func.now()))
+    await db.commit()
+
+    ARCHIVE_CONVERSATIONS.inc(action="archived")
+    await invalidate_tags(f"conversation:{conversation_id}:messages",
+                          *message_tags(by_message))
+    return len(messages)
+
+
+async def rehydrate(db: AsyncSession, conversation_id: int) -> bool:
+    """Load an archived conversation back from its file, if it is archived
+
+    Costs one primary key lookup when it is not. Returns whether the
+    conversation was rehydrated; if so, the caller's transaction was committed.
+    """
+    archived_at = await db.scalar(
+        select(Conversation.archived_at).where(Conversation.id == conversation_id))
+    if archived_at is None:
+        return False
+
+    # Whoever waited on the lock finds the work done
+    archived_at = await db.scalar(
+        select(Conversation.archived_at).where(Conversation.id == conversation_id)
+        .with_for_update(key_share=True))
+    if archived_at is None:
+        await db.rollback()
+        return False
+
+    path = archive_path(conversation_id)
+    messages = await asyncio.to_thread(_read, path)
+    entities = [
+        {**_parse_times(entity), "message_id": message["id"],
+         "message_created_at": datetime.fromisoformat(message["created_at"])}
+        for message in messages for entity in message.pop("entities")
+    ]
+    await db.execute(insert(Message).on_conflict_do_nothing(),
+                     [_parse_times(message) for message in messages])
+    if entities:
+        interned = await intern_entities(
+            db, [(entity["entity_type"], entity["entity_value"]) for entity in entities])
+        for entity in entities:
+            entity["type_id"], entity["value_id"] = interned[
+                entity.pop("entity_type"), entity.pop("entity_value")]
+        await db.execute(insert(Entity).on_conflict_do_nothing(), entities)
+    await db.execute(
+        delete(ArchivedMessage).where(ArchivedMessage.conversation_id == conversation_id))
+    await db.execute(
+        update(Conversation).where(Conversation.id == conversation_id)
+        .values(archived_at=None))
+    await db.commit()
+
+    await asyncio.to_thread(path.unlink, missing_ok=True)
+    ARCHIVE_CONVERSATIONS.inc(action="rehydrated")
+    await invalidate_tags(f"conversation:{conversation_id}:messages")
+    return True
+
+
+async def archived_conversation(db: AsyncSession, message_id: int) -> Optional[int]:
+    """The archived conversation a message is in, if it is archived"""
+    return await db.scalar(
+        select(ArchivedMessage.conversation_id).where(ArchivedMessage.message_id == message_id))
+
+
+async def rehydrate_message(db: AsyncSession, message_id: int) -> bool:
+    """Rehydrate the conversation of an archived message, if it is archived
+
+    Costs one primary key lookup when it is not; see rehydrate().
+    """
+    conversation_id = await archived_conversation(db, message_id)
+    if conversation_id is None:
+        return False
+    return await rehydrate(db, conversation_id)
+
+
+async def lock_archived(db: AsyncSession, *criteria) -> List[int]:
+    """Ids of the archived conversations matching `criteria`, for deleting them
+
+    Every matching conversation is locked FOR UPDATE until the caller's
+    transaction ends, so one being archived meanwhile is waited for and seen
+    archived, and none is archived or rehydrated until the delete commits.
+    """
+    rows = await db.execute(
+        select(Conversation.id, Conversation.archived_at).where(*criteria)
+        .with_for_update())
+    return [row.id for row in rows if row.archived_at is not None]
+
+
+async def remove_archives(conversation_ids: List[int]):
+    """Delete the archive files of conversations that were deleted"""
+    def unlink():
+        for conversation_id in conversation_ids:
+            archive_path(conversation_id).unlink(missing_ok=True)
+    if conversation_ids:
+        await asyncio.to_thread(unlink)
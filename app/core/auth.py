@@ -1,14 +1,19 @@
+import time
 from datetime import datetime, timedelta
 from typing import Optional
+from cachetools import TTLCache
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from app.core.cache import TaggedCache
 from app.core.config import settings
+from app.core.hash_pool import run_password_job
 from app.database.database import get_db
 from app.models import User
+from app.schemas import UserBasic
 
 # Password hashing context
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -21,6 +26,24 @@ ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
 oauth2_scheme = OAuth2PasswordBearer(
     tokenUrl=f"{settings.api_v1_prefix}/auth/login")
 
+# Verified claims of recently seen tokens, so repeats skip the signature check
+_claims_cache = TTLCache(
+    maxsize=settings.principal_cache_maxsize,
+    ttl=settings.principal_cache_ttl_seconds)
+
+# Authenticated principals keyed by token sub and iat, tagged with
+# principal_tag(sub): the username is known before the user is read, so its
+# generation can be snapshotted first
+principal_cache = TaggedCache(
+    "principal",
+    ttl=settings.principal_cache_ttl_seconds,
+    maxsize=settings.principal_cache_maxsize)
+
+
+def principal_tag(username: str) -> str:
+    """Tag of the cached principals of `username`; writes to the user invalidate it"""
+    return f"username:{username}"
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
@@ -32,6 +55,16 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password on the hashing pool without blocking the event loop"""
+    return await run_password_job("verify", verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """Hash a password on the hashing pool without blocking the event loop"""
+    return await run_password_job("hash", get_password_hash, password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create a JWT access token"""
     to_encode = data.copy()
@@ -39,37 +72,64 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "iat": datetime.utcnow()})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
+def decode_token(token: str) -> Optional[dict]:
+    """Verify and decode a JWT token, reusing claims of recently seen tokens"""
+    claims = _claims_cache.get(token)
+    if claims is None:
+        try:
+            claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            return None
+        _claims_cache[token] = claims
+    elif claims.get("exp") is not None and claims["exp"] <= time.time():
+        _claims_cache.pop(token, None)
+        return None
+    return claims
+
+
 def verify_token(token: str) -> Optional[str]:
     """Verify and decode a JWT token"""
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            return None
-        return username
-    except JWTError:
+    claims = decode_token(token)
+    if claims is None:
         return None
+    return claims.get("sub")
+
 
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> UserBasic:
+    """Get the current authenticated user
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
-    """Get the current authenticated user"""
+    Returns a cached UserBasic principal rather than an ORM instance, so routes
+    that modify the user should load it from their own session.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    username = verify_token(token)
+    claims = decode_token(token)
+    username = claims.get("sub") if claims else None
     if username is None:
         raise credentials_exception
+
+    key = f"{username}:{claims.get('iat', '')}"
+    cached = await principal_cache.get(key)
+    if cached is not None:
+        return UserBasic(**cached)
+
+    # Snapshot before reading, so a write racing the read leaves the entry
+    # already stale rather than caching the old user as current
+    tags = await principal_cache.generations([principal_tag(username)])
     result = await db.execute(
         select(User).where(User.username == username)
     )
     user = result.scalars().first()
     if user is None:
         raise credentials_exception
-    return user
+    principal = UserBasic.model_validate(user)
+    await principal_cache.set(key, principal.model_dump(), tags)
+    return principal
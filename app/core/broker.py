@@ -0,0 +1,219 @@
+"""Publish/subscribe fan-out of new messages and entities to live clients
+
+Routes publish events to topics such as "conversation:42" after committing
+a write; SSE and WebSocket handlers subscribe to them. An event carries its
+row already encoded as JSON, so fanning out to thousands of subscribers
+does not serialize it again per subscriber.
+
+Each subscriber gets a bounded queue. A subscriber that falls a full queue
+behind is dropped rather than slowing down publishers or buffering without
+limit; its stream reports the overflow so the client can reconnect and
+replay from its last event id.
+
+By default events only reach subscribers on the publishing worker. With
+PUBSUB_POSTGRES_BRIDGE enabled, events go through Postgres NOTIFY instead,
+and every worker LISTENs and fans them out to its own subscribers.
+"""
+import asyncio
+import json
+import logging
+from typing import Any, Dict, Optional, Set
+import orjson
+from sqlalchemy import func, select
+from app.core.config import settings
+from app.core.metrics import Counter, Gauge
+from app.database.database import AsyncSessionLocal, engine
+from app.models import Entity, Message
+from app.models.entity import ENTITY_COLUMNS
+from app.models.message import MESSAGE_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+PUBSUB_SUBSCRIBERS = Gauge(
+    "pubsub_subscribers",
+    "Live event subscribers connected to this worker",
+)
+PUBSUB_EVENTS = Counter(
+    "pubsub_events_published_total",
+    "Events published to live subscribers",
+    ("type",),
+)
+PUBSUB_DROPPED = Counter(
+    "pubsub_subscribers_dropped_total",
+    "Subscribers dropped because their queue was full",
+)
+
+CHANNEL = "pubsub_events"
+# NOTIFY payloads must stay under 8000 bytes
+MAX_NOTIFY_BYTES = 7900
+
+
+class Subscription:
+    """A subscriber's bounded queue of events for one topic"""
+
+    def __init__(self, broker: "Broker", topic: str, maxsize: int):
+        self.broker = broker
+        self.topic = topic
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[dict]:
+        """Wait for the next event
+
+        Returns None on timeout, and once an overflowed subscription has been
+        drained; check `overflowed` to tell the two apart.
+        """
+        if self.overflowed and self.queue.empty():
+            return None
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Broker:
+    """In-process topic fan-out with an optional Postgres LISTEN/NOTIFY bridge"""
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._topics: Dict[str, Set[Subscription]] = {}
+        self._bridge: Optional["PostgresBridge"] = None
+
+    def subscribe(self, topic: str) -> Subscription:
+        subscription = Subscription(self, topic, self.queue_size)
+        self._topics.setdefault(topic, set()).add(subscription)
+        PUBSUB_SUBSCRIBERS.inc()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._topics.get(subscription.topic)
+        if subscribers and subscription in subscribers:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._topics[subscription.topic]
+            PUBSUB_SUBSCRIBERS.dec()
+
+    def subscriber_count(self, topic: str) -> int:
+        return len(self._topics.get(topic, ()))
+
+    def dispatch(self, topic: str, event: dict):
+        """Deliver an event to this worker's subscribers of `topic`"""
+        for subscription in list(self._topics.get(topic, ())):
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                subscription.overflowed = True
+                self.unsubscribe(subscription)
+                PUBSUB_DROPPED.inc()
+
+    async def publish(self, topic: str, event: dict):
+        """Publish an event to every subscriber of `topic`, across workers if bridged"""
+        PUBSUB_EVENTS.inc(type=event.get("type", ""))
+        if self._bridge is not None:
+            await self._bridge.notify(topic, event)
+        else:
+            self.dispatch(topic, event)
+
+    async def start(self):
+        if settings.pubsub_postgres_bridge and self._bridge is None:
+            self._bridge = PostgresBridge(self)
+            await self._bridge.start()
+
+    async def stop(self):
+        if self._bridge is not None:
+            await self._bridge.stop()
+            self._bridge = None
+
+
+class PostgresBridge:
+    """Relays published events between workers through LISTEN/NOTIFY
+
+    Events too large for a NOTIFY payload are sent as a reference and loaded
+    again by each listening worker.
+    """
+
+    def __init__(self, broker: Broker):
+        self.broker = broker
+        self._connection = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def start(self):
+        # A dedicated connection, held for as long as the worker runs
+        self._connection = await engine.connect()
+        raw = await self._connection.get_raw_connection()
+        await raw.driver_connection.add_listener(CHANNEL, self._on_notify)
+
+    async def stop(self):
+        if self._connection is not None:
+            raw = await self._connection.get_raw_connection()
+            await raw.driver_connection.remove_listener(CHANNEL, self._on_notify)
+            await self._connection.close()
+            self._connection = None
+
+    async def notify(self, topic: str, event: dict):
+        payload = json.dumps({"topic": topic, "event": event})
+        if len(payload.encode()) > MAX_NOTIFY_BYTES:
+            payload = json.dumps({"topic": topic, "ref": {
+                "type": event["type"], "id": event["id"]}})
+        async with engine.begin() as conn:
+            await conn.execute(select(func.pg_notify(CHANNEL, payload)))
+
+    def _on_notify(self, connection, pid, channel, payload):
+        message = json.loads(payload)
+        if "event" in message:
+            self.broker.dispatch(message["topic"], message["event"])
+            return
+        task = asyncio.get_running_loop().create_task(self._dispatch_ref(message))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch_ref(self, message: dict):
+        if not self.broker.subscriber_count(message["topic"]):
+            return
+        try:
+            event = await load_event(message["ref"]["type"], message["ref"]["id"])
+        except Exception:
+            logger.exception("Could not load %s for pubsub", message["ref"])
+            return
+        if event is not None:
+            self.broker.dispatch(message["topic"], event)
+
+
+def _event(type: str, columns, row: Any) -> dict:
+    values = {column.name: getattr(row, column.name) for column in columns}
+    data = orjson.dumps(values, option=orjson.OPT_UTC_Z).decode()
+    return {"type": type, "id": row.id, "data": data}
+
+
+def message_event(row: Any) -> dict:
+    """Event for a newly created message row"""
+    return _event("message", MESSAGE_COLUMNS, row)
+
+
+def entity_event(row: Any) -> dict:
+    """Event for a newly created entity row"""
+    return _event("entity", ENTITY_COLUMNS, row)
+
+
+async def load_event(type: str, id: int) -> Optional[dict]:
+    """Rebuild a message or entity event from the database"""
+    model, columns, build = {
+        "message": (Message, MESSAGE_COLUMNS, message_event),
+        "entity": (Entity, ENTITY_COLUMNS, entity_event),
+    }[type]
+    async with AsyncSessionLocal() as session:
+        row = (await session.execute(
+            select(*columns).where(model.id == id))).first()
+    return build(row) if row is not None else None
+
+
+broker = Broker(queue_size=settings.pubsub_queue_size)
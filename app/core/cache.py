@@ -0,0 +1,155 @@
+"""TTL caches with tag-based invalidation over a pluggable backend
+
+Entries record the generation of every tag they depend on (e.g. "user:42").
+Invalidating a tag bumps its generation, so every entry tagged with it is
+treated as a miss from then on, however many keys it spans.
+
+The default backend is an in-process LRU with TTL. Setting CACHE_URL to a
+redis:// URL shares entries and invalidations between workers; that needs
+the optional `redis` package.
+"""
+import itertools
+import json
+from typing import Any, Dict, Iterable, List, Optional
+from cachetools import TTLCache
+from app.core.config import settings
+
+
+class MemoryBackend:
+    """Per-process backend; invalidations are only seen by this worker"""
+
+    # An entry usually depends on several tags
+    generations_per_entry = 8
+    # As RedisBackend: kept well past the entry TTL of any cache
+    generation_ttl = 86400
+
+    def __init__(self, maxsize: int, ttl: int):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Generations come from one counter and are never reused. A tag with
+        # no generation, including one that was evicted or expired, is given a
+        # fresh one when read, so losing a generation turns the entries that
+        # recorded it into misses rather than making a stale one valid again
+        self._generations = TTLCache(
+            maxsize=maxsize * self.generations_per_entry,
+            ttl=max(ttl, self.generation_ttl))
+        self._counter = itertools.count(1)
+
+    async def get(self, key: str) -> Optional[Any]:
+        return self._entries.get(key)
+
+    async def set(self, key: str, value: Any, ttl: int):
+        self._entries[key] = value
+
+    async def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    async def get_generations(self, tags: List[str]) -> List[int]:
+        generations = []
+        for tag in tags:
+            generation = self._generations.get(tag)
+            if generation is None:
+                generation = self._generations[tag] = next(self._counter)
+            generations.append(generation)
+        return generations
+
+    async def bump_generations(self, tags: List[str], ttl: int):
+        for tag in tags:
+            self._generations[tag] = next(self._counter)
+
+
+class RedisBackend:
+    """Shared backend so every worker sees the same entries and invalidations"""
+
+    # Generations are shared by every cache namespace, so keep them well past
+    # the longest entry TTL rather than the TTL of whichever cache bumped last
+    generation_ttl = 86400
+
+    def __init__(self, url: str):
+        try:
+            from redis import asyncio as redis
+        except ImportError:
+            raise RuntimeError(
+                "CACHE_URL points at Redis but the 'redis' package is not installed")
+        self._redis = redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[Any]:
+        raw = await self._redis.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any, ttl: int):
+        await self._redis.set(key, json.dumps(value, default=str), ex=ttl)
+
+    async def delete(self, key: str):
+        await self._redis.delete(key)
+
+    async def get_generations(self, tags: List[str]) -> List[int]:
+        values = await self._redis.mget([f"gen:{tag}" for tag in tags])
+        return [int(v) if v is not None else 0 for v in values]
+
+    async def bump_generations(self, tags: List[str], ttl: int):
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for tag in tags:
+                pipe.incr(f"gen:{tag}")
+                pipe.expire(f"gen:{tag}", max(ttl, self.generation_ttl))
+            await pipe.execute()
+
+
+def create_backend(maxsize: int, ttl: int):
+    """Build the configured backend: Redis when CACHE_URL is set, else in-process"""
+    if settings.cache_url:
+        return RedisBackend(settings.cache_url)
+    return MemoryBackend(maxsize=maxsize, ttl=ttl)
+
+
+_caches: List["TaggedCache"] = []
+
+
+class TaggedCache:
+    """Namespaced cache whose entries are invalidated by tag"""
+
+    def __init__(self, namespace: str, ttl: int, maxsize: int = 10000, backend=None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.backend = backend or create_backend(maxsize=maxsize, ttl=ttl)
+        _caches.append(self)
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Return the cached value, or None if missing or any tag was invalidated"""
+        entry = await self.backend.get(self._key(key))
+        if entry is None:
+            return None
+        tags = entry["tags"]
+        if tags:
+            current = await self.backend.get_generations(list(tags))
+            if current != list(tags.values()):
+                return None
+        return entry["value"]
+
+    async def generations(self, tags: Iterable[str]) -> Dict[str, int]:
+        """Snapshot tag generations to store alongside a value being computed"""
+        tags = list(tags)
+        if not tags:
+            return {}
+        return dict(zip(tags, await self.backend.get_generations(tags)))
+
+    async def set(self, key: str, value: Any, tags: Optional[Dict[str, int]] = None):
+        """Store a value with the tag generations it was computed under"""
+        await self.backend.set(
+            self._key(key), {"value": value, "tags": tags or {}}, self.ttl)
+
+    async def delete(self, key: str):
+        await self.backend.delete(self._key(key))
+
+    async def invalidate(self, *tags: str):
+        """Invalidate every entry in this cache's backend tagged with any of `tags`"""
+        if tags:
+            await self.backend.bump_generations(list(tags), self.ttl)
+
+
+async def invalidate_tags(*tags: str):
+    """Invalidate `tags` in every cache, e.g. after a write to the tagged rows"""
+    for cache in _caches:
+        await cache.invalidate(*tags)
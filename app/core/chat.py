@@ -0,0 +1,331 @@
+"""Model calls that produce AI replies to chat turns
+
+A backend streams a reply for a conversation history given as
+(sender_type, content) pairs, and folds messages into a running summary of
+a conversation. A history may open with a ("summary", text) pair; see
+app.core.context. CHAT_BACKEND selects Gemini, or "fake", a deterministic
+local stand-in with configurable latency for offline runs and benchmarks.
+
+The pipeline bounds concurrent model calls, queues a limited number more and
+rejects the rest with a 503, and applies a timeout to each call, queueing
+included. Requests with identical model input while one is in flight share
+its call. Every caller streams the same tokens; a common case is many new
+conversations opening with the same suggested question.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Set, Tuple
+from fastapi import HTTPException, status
+from app.core.config import settings
+from app.core.metrics import Counter, Gauge, Histogram
+from app.database.query_stats import background_context
+
+History = Sequence[Tuple[str, str]]
+
+SUMMARY_PROMPT = """You keep a running summary of a conversation between a traveller
+and a tourism assistant. Update the summary with the new messages. Keep the
+traveller's destinations, dates, budget, preferences and any decisions made,
+drop small talk, and stay under {max_tokens} tokens.
+
+Current summary:
+{summary}
+
+New messages:
+{transcript}"""
+
+CHAT_REQUESTS = Counter(
+    "chat_requests_total",
+    "Chat replies requested, by backend and result (ok, timeout, error, rejected or coalesced)",
+    ("backend", "result"),
+)
+CHAT_INFLIGHT = Gauge(
+    "chat_inflight",
+    "Model calls running or queued on this worker",
+)
+CHAT_FIRST_TOKEN = Histogram(
+    "chat_first_token_seconds",
+    "Time from starting a model call to its first token, queueing included",
+    ("backend",),
+)
+CHAT_DURATION = Histogram(
+    "chat_reply_seconds",
+    "Time from starting a model call to its last token, queueing included",
+    ("backend",),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+
+
+class ChatTimeout(Exception):
+    """The model did not finish a reply within CHAT_TIMEOUT_SECONDS"""
+
+
+class ChatUnavailable(Exception):
+    """CHAT_BACKEND names no backend, or one that is missing its settings"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count, at about four characters per token
+
+    Close enough to budget a prompt without a model-specific tokenizer.
+    """
+    return len(text) // 4 + 1
+
+
+class GeminiBackend:
+    """Streams replies from the Gemini API"""
+
+    name = "gemini"
+
+    def __init__(self, api_key: Optional[str], model: str):
+        if not api_key:
+            raise ChatUnavailable("CHAT_BACKEND is 'gemini' but GEMINI_API_KEY is not set")
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self._genai = genai
+        self._model_name = model
+        self._model = genai.GenerativeModel(model)
+
+    async def stream(self, history: History) -> AsyncIterator[str]:
+        model = self._model
+        if history and history[0][0] == "summary":
+            model = self._genai.GenerativeModel(
+                self._model_name,
+                system_instruction=f"Summary of the conversation so far:\n{history[0][1]}")
+            history = history[1:]
+        contents = [
+            {"role": "model" if sender_type == "ai" else "user", "parts": [content]}
+            for sender_type, content in history
+        ]
+        response = await model.generate_content_async(contents, stream=True)
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+    async def summarize(self, summary: Optional[str], messages: History, max_tokens: int) -> str:
+        transcript = "\n".join(f"{sender_type}: {content}" for sender_type, content in messages)
+        prompt = SUMMARY_PROMPT.format(
+            max_tokens=max_tokens, summary=summary or "(none yet)", transcript=transcript)
+        response = await self._model.generate_content_async(
+            prompt, generation_config={"max_output_tokens": max_tokens})
+        return response.text
+
+
+class FakeBackend:
+    """Deterministic stand-in that answers without network access
+
+    The reply depends only on the history. It starts after `latency` seconds
+    and then produces `tokens_per_second` words per second.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency: float, tokens_per_second: float, reply_tokens: int):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+
+    def reply(self, history: History) -> List[str]:
+        question = next(
+            (content for sender_type, content in reversed(history) if sender_type != "ai"), "")
+        digest = hashlib.blake2b(
+            json.dumps(list(history)).encode(), digest_size=8).hexdigest()
+        words = f"About {question!r}: here is a suggestion ({digest}).".split()
+        while len(words) < self.reply_tokens:
+            words.append(f"detail-{len(words)}")
+        words = words[:self.reply_tokens]
+        return words[:1] + [" " + word for word in words[1:]]
+
+    async def stream(self, history: History) -> AsyncIterator[str]:
+        await asyncio.sleep(self.latency)
+        interval = 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0
+        for token in self.reply(history):
+            yield token
+            if interval:
+                await asyncio.sleep(interval)
+
+    async def summarize(self, summary: Optional[str], messages: History, max_tokens: int) -> str:
+        """Keep the newest "sender: content" lines that fit in `max_tokens`"""
+        await asyncio.sleep(self.latency)
+        lines = summary.splitlines() if summary else []
+        lines += [f"{sender_type}: {content[:200]}" for sender_type, content in messages]
+        kept, budget = [], max_tokens
+        for line in reversed(lines):
+            budget -= estimate_tokens(line)
+            if budget < 0:
+                break
+            kept.append(line)
+        return "\n".join(reversed(kept))
+
+
+def create_backend():
+    """Build the configured backend; raises ChatUnavailable if it cannot be"""
+    if settings.chat_backend == "fake":
+        return FakeBackend(
+            latency=settings.fake_chat_latency_ms / 1000,
+            tokens_per_second=settings.fake_chat_tokens_per_second,
+            reply_tokens=settings.fake_chat_reply_tokens,
+        )
+    if settings.chat_backend == "gemini":
+        return GeminiBackend(settings.gemini_api_key, settings.gemini_model)
+    raise ChatUnavailable(f"Unknown CHAT_BACKEND {settings.chat_backend!r}")
+
+
+class Generation:
+    """One model call, whose tokens any number of callers can stream"""
+
+    def __init__(self):
+        self.tokens: List[str] = []
+        self.error: Optional[Exception] = None
+        self.done = False
+        self._changed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def _append(self, token: str):
+        self.tokens.append(token)
+        self._notify()
+
+    def _finish(self, error: Optional[Exception] = None):
+        self.error = error
+        self.done = True
+        self._notify()
+
+    async def stream(self) -> AsyncIterator[str]:
+        """Yield every token from the first, then raise the call's error if it failed"""
+        sent = 0
+        while True:
+            while sent < len(self.tokens):
+                yield self.tokens[sent]
+                sent += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+    async def result(self) -> str:
+        """Wait for the whole reply"""
+        async for _ in self.stream():
+            pass
+        return "".join(self.tokens)
+
+
+class ChatPipeline:
+    """Bounded, coalescing model calls on top of a backend"""
+
+    def __init__(self, backend=None):
+        self._backend = backend
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._inflight: Dict[str, Generation] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = create_backend()
+        return self._backend
+
+    @property
+    def slots(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(settings.chat_max_concurrency)
+        return self._semaphore
+
+    def _key(self, history: History) -> str:
+        payload = json.dumps([self.backend.name, list(history)])
+        return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+    def generate(self, history: History) -> Generation:
+        """Start a reply for `history`, or join the identical call already in flight
+
+        Raises a 503 HTTPException when the call slots and queue are full, or
+        when no backend is configured.
+        """
+        try:
+            backend = self.backend
+        except ChatUnavailable as exc:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="The assistant is not configured",
+            ) from exc
+        key = self._key(history)
+        generation = self._inflight.get(key)
+        if generation is not None:
+            CHAT_REQUESTS.inc(backend=backend.name, result="coalesced")
+            return generation
+
+        capacity = settings.chat_max_concurrency + settings.chat_max_queue
+        if len(self._inflight) >= capacity:
+            CHAT_REQUESTS.inc(backend=backend.name, result="rejected")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="The assistant is busy, please retry shortly",
+                headers={"Retry-After": "1"},
+            )
+        generation = Generation()
+        self._inflight[key] = generation
+        CHAT_INFLIGHT.set(len(self._inflight))
+        generation.task = asyncio.get_running_loop().create_task(
+            self._run(key, generation, list(history)))
+        return generation
+
+    async def _call(self, generation: Generation, history: History, started: float):
+        async with self.slots:
+            async for token in self.backend.stream(history):
+                if not generation.tokens:
+                    CHAT_FIRST_TOKEN.observe(
+                        time.perf_counter() - started, backend=self.backend.name)
+                generation._append(token)
+
+    async def _run(self, key: str, generation: Generation, history: History):
+        name = self.backend.name
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(
+                self._call(generation, history, started), settings.chat_timeout_seconds)
+        except asyncio.TimeoutError:
+            CHAT_REQUESTS.inc(backend=name, result="timeout")
+            generation._finish(ChatTimeout(
+                f"No reply within {settings.chat_timeout_seconds} seconds"))
+        except asyncio.CancelledError:
+            generation._finish(RuntimeError("The reply was cancelled"))
+            raise
+        except Exception as exc:
+            CHAT_REQUESTS.inc(backend=name, result="error")
+            generation._finish(exc)
+        else:
+            CHAT_REQUESTS.inc(backend=name, result="ok")
+            CHAT_DURATION.observe(time.perf_counter() - started, backend=name)
+            generation._finish()
+        finally:
+            del self._inflight[key]
+            CHAT_INFLIGHT.set(len(self._inflight))
+
+    async def summarize(self, summary: Optional[str], messages: History) -> str:
+        """Fold `messages` into `summary`, sharing the call slots with replies"""
+        async with self.slots:
+            return await asyncio.wait_for(
+                self.backend.summarize(summary, messages, settings.chat_summary_tokens),
+                settings.chat_timeout_seconds)
+
+    def spawn(self, coro) -> asyncio.Task:
+        """Run follow-up work (such as storing a reply) that outlives the request"""
+        task = asyncio.get_running_loop().create_task(coro, context=background_context())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def close(self):
+        """Cancel in-flight calls and wait for follow-up work to finish"""
+        for generation in list(self._inflight.values()):
+            generation.task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+chat_pipeline = ChatPipeline()
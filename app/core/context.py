@@ -0,0 +1,121 @@
+"""Prompt context for chat turns: a rolling summary plus the newest messages
+
+Sending a conversation's whole history on every turn makes each model call
+slower and costlier as the conversation grows. A prompt instead holds the
+newest CHAT_HISTORY_MESSAGES messages that fit in CHAT_CONTEXT_TOKENS,
+after the conversation's stored summary of the messages before them. Both
+come from indexed lookups of bounded size, so building a prompt takes the
+same time at message 10 as at message 10,000.
+
+After each reply, messages that have left the window are folded into the
+summary, CHAT_SUMMARY_BATCH or more at a time: the model updates the
+previous summary with just those messages, and summary_message_id records
+the newest message folded in.
+"""
+import logging
+from typing import List, Optional, Sequence, Tuple
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.chat import estimate_tokens, chat_pipeline
+from app.core.config import settings
+from app.core.metrics import Counter
+from app.database.database import AsyncSessionLocal
+from app.models import Conversation, Message
+
+logger = logging.getLogger(__name__)
+
+CHAT_SUMMARY_UPDATES = Counter(
+    "chat_summary_updates_total",
+    "Conversation summary updates by result (updated, conflict or error)",
+    ("result",),
+)
+
+# Tokens for the role framing around each message
+MESSAGE_OVERHEAD = 4
+
+
+async def _load(db: AsyncSession, conversation_id: int, limit: int):
+    """The conversation's summary state and its newest `limit` messages, newest first"""
+    conversation = (await db.execute(
+        select(Conversation.summary, Conversation.summary_message_id)
+        .where(Conversation.id == conversation_id)
+    )).first()
+    messages = (await db.execute(
+        select(Message.id, Message.sender_type, Message.content)
+        .where(Message.conversation_id == conversation_id)
+        .order_by(Message.created_at.desc(), Message.id.desc())
+        .limit(limit)
+    )).all()
+    return conversation, messages
+
+
+def _window(summary: Optional[str], summary_message_id: Optional[int],
+            messages: Sequence) -> int:
+    """How many of the newest-first `messages` fit in the prompt after the summary
+
+    Always keeps the newest message, and never goes back past the summary.
+    """
+    budget = settings.chat_context_tokens
+    if summary:
+        budget -= estimate_tokens(summary) + MESSAGE_OVERHEAD
+    kept = 0
+    for message in messages[:settings.chat_history_messages]:
+        if summary_message_id is not None and message.id <= summary_message_id:
+            break
+        budget -= estimate_tokens(message.content) + MESSAGE_OVERHEAD
+        if kept and budget < 0:
+            break
+        kept += 1
+    return kept
+
+
+async def build_context(db: AsyncSession, conversation_id: int) -> List[Tuple[str, str]]:
+    """History to send to the model: ("summary", text) if any, then recent messages"""
+    conversation, messages = await _load(db, conversation_id, settings.chat_history_messages)
+    summary, summary_message_id = conversation if conversation else (None, None)
+    kept = _window(summary, summary_message_id, messages)
+    history = [(m.sender_type, m.content) for m in reversed(messages[:kept])]
+    if summary:
+        history.insert(0, ("summary", summary))
+    return history
+
+
+async def update_summary(conversation_id: int):
+    """Fold messages that have left the prompt window into the conversation's summary
+
+    Reads with one session and writes with another, so no connection is held
+    during the model call. The write only applies if nobody else updated the
+    summary in the meantime. Messages more than CHAT_SUMMARY_MAX_FOLD behind
+    the window are skipped rather than summarized.
+    """
+    try:
+        async with AsyncSessionLocal() as session:
+            conversation, messages = await _load(
+                session, conversation_id,
+                settings.chat_history_messages + settings.chat_summary_max_fold)
+        if conversation is None:
+            return
+        summary, summary_message_id = conversation
+        kept = _window(summary, summary_message_id, messages)
+        fold = [m for m in reversed(messages[kept:])
+                if summary_message_id is None or m.id > summary_message_id]
+        if len(fold) < settings.chat_summary_batch:
+            return
+
+        new_summary = await chat_pipeline.summarize(
+            summary, [(m.sender_type, m.content) for m in fold])
+        async with AsyncSessionLocal() as session:
+            table = Conversation.__table__
+            result = await session.execute(
+                update(table)
+                .where(table.c.id == conversation_id,
+                       table.c.summary_message_id.is_not_distinct_from(summary_message_id))
+                # Leave updated_at alone: the summary is not a user-visible edit
+                .values(summary=new_summary, summary_message_id=fold[-1].id,
+                        updated_at=table.c.updated_at)
+            )
+            await session.commit()
+        CHAT_SUMMARY_UPDATES.inc(result="updated" if result.rowcount else "conflict")
+    except Exception:
+        CHAT_SUMMARY_UPDATES.inc(result="error")
+        logger.exception("Could not update the summary of conversation %s", conversation_id)
@@ -0,0 +1,173 @@
+"""Interned entity types and values
+
+Entities store integer ids into entity_types and entity_values instead of
+repeating strings like "location" and "Paris" on every row. Types and values
+are looked up by a normalized key: surrounding whitespace trimmed, inner
+whitespace collapsed and lowercased, so "Paris", "paris" and " PARIS " are one
+value. The value keeps the spelling it was first seen with. An alias in
+entity_aliases makes another key resolve to an existing value.
+
+Lookups go through per-process TTL caches of ENTITY_DICTIONARY_CACHE_SIZE
+keys, so hot values cost no query. Dictionary rows are never deleted, so a
+cached id stays valid; a new alias reaches other processes once their cached
+entry expires after ENTITY_DICTIONARY_CACHE_SECONDS. Ids of rows created by
+the caller's own, uncommitted transaction are not cached, in case it rolls
+back.
+"""
+from typing import Dict, Iterable, Optional, Set, Tuple
+from cachetools import TTLCache
+from sqlalchemy import select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.metrics import Counter
+from app.models import Entity, EntityAlias, EntityType, EntityValue
+
+ENTITY_DICTIONARY_LOOKUPS = Counter(
+    "entity_dictionary_lookups_total",
+    "Entity type and value lookups by result (hit or miss in the process cache)",
+    ("result",),
+)
+
+# normalized type name -> type id
+_type_ids = TTLCache(maxsize=settings.entity_dictionary_cache_size,
+                     ttl=settings.entity_dictionary_cache_seconds)
+# (type id, normalized value) -> value id, aliases included
+_value_ids = TTLCache(maxsize=settings.entity_dictionary_cache_size,
+                      ttl=settings.entity_dictionary_cache_seconds)
+
+
+def normalize(text: str) -> str:
+    """The key a type or value is interned under"""
+    return " ".join(text.split()).lower()
+
+
+def _cached(cache: TTLCache, keys: Set) -> Tuple[Dict, Set]:
+    found = {key: cache[key] for key in keys if key in cache}
+    ENTITY_DICTIONARY_LOOKUPS.inc(len(found), result="hit")
+    ENTITY_DICTIONARY_LOOKUPS.inc(len(keys) - len(found), result="miss")
+    return found, keys - found.keys()
+
+
+async def _resolve_types(db: AsyncSession, names: Set[str], create: bool) -> Dict[str, int]:
+    ids, missing = _cached(_type_ids, names)
+    if missing:
+        for name, id in await db.execute(
+                select(EntityType.name, EntityType.id).where(EntityType.name.in_(missing))):
+            ids[name] = _type_ids[name] = id
+        missing -= ids.keys()
+    if missing and create:
+        # Sorted, so concurrent writers take the unique index locks in one order
+        created = await db.execute(
+            insert(EntityType).values([{"name": name} for name in sorted(missing)])
+            .on_conflict_do_nothing().returning(EntityType.name, EntityType.id))
+        ids.update(created.tuples().all())
+        missing -= ids.keys()
+        if missing:
+            # Created concurrently and committed by someone else
+            for name, id in await db.execute(
+                    select(EntityType.name, EntityType.id).where(EntityType.name.in_(missing))):
+                ids[name] = _type_ids[name] = id
+    return ids
+
+
+async def _lookup_values(db: AsyncSession, keys: Set[Tuple[int, str]]) -> Dict[Tuple[int, str], int]:
+    """Committed value ids for (type id, key) pairs, aliases first; cached"""
+    ids = {}
+    aliases = await db.execute(
+        select(EntityAlias.type_id, EntityAlias.key, EntityAlias.value_id)
+        .where(tuple_(EntityAlias.type_id, EntityAlias.key).in_(keys)))
+    for type_id, key, value_id in aliases:
+        ids[type_id, key] = value_id
+    if keys - ids.keys():
+        values = await db.execute(
+            select(EntityValue.type_id, EntityValue.key, EntityValue.id)
+            .where(tuple_(EntityValue.type_id, EntityValue.key).in_(keys - ids.keys())))
+        for type_id, key, value_id in values:
+            ids[type_id, key] = value_id
+    _value_ids.update(ids)
+    return ids
+
+
+async def intern_entities(
+    db: AsyncSession, pairs: Iterable[Tuple[str, str]], create: bool = True
+) -> Dict[Tuple[str, str], Tuple[int, int]]:
+    """(type_id, value_id) for each (entity_type, entity_value) pair, keyed by the pair
+
+    Missing types and values are added in the caller's transaction. With
+    create=False they are left out of the result instead. Call it once per
+    transaction: a second call would cache ids the first one created.
+    """
+    pairs = list(dict.fromkeys(pairs))
+    type_ids = await _resolve_types(db, {normalize(type) for type, _ in pairs}, create)
+    # The first spelling of each new value becomes its canonical one
+    spellings = {}
+    for type, value in pairs:
+        type_id = type_ids.get(normalize(type))
+        if type_id is not None:
+            spellings.setdefault((type_id, normalize(value)), " ".join(value.split()))
+
+    value_ids, missing = _cached(_value_ids, set(spellings))
+    if missing:
+        value_ids.update(await _lookup_values(db, missing))
+        missing -= value_ids.keys()
+    if missing and create:
+        created = await db.execute(
+            insert(EntityValue)
+            .values([{"type_id": type_id, "key": key, "value": spellings[type_id, key]}
+                     for type_id, key in sorted(missing)])
+            .on_conflict_do_nothing()
+            .returning(EntityValue.type_id, EntityValue.key, EntityValue.id))
+        for type_id, key, value_id in created:
+            value_ids[type_id, key] = value_id
+        missing -= value_ids.keys()
+        if missing:
+            value_ids.update(await _lookup_values(db, missing))
+
+    interned = {}
+    for type, value in pairs:
+        type_id = type_ids.get(normalize(type))
+        value_id = value_ids.get((type_id, normalize(value)))
+        if value_id is not None:
+            interned[type, value] = (type_id, value_id)
+    return interned
+
+
+async def find_type(db: AsyncSession, entity_type: str) -> Optional[int]:
+    """The id of an entity type, or None if no entity ever had it"""
+    name = normalize(entity_type)
+    return (await _resolve_types(db, {name}, create=False)).get(name)
+
+
+async def add_alias(db: AsyncSession, entity_type: str, alias: str, entity_value: str) -> list:
+    """Make `alias` resolve to `entity_value`, in the caller's transaction
+
+    Entities already stored under the alias are moved to the value. Returns
+    the message ids of the moved entities. Raises ValueError if the alias
+    and the value normalize to the same key.
+    """
+    ((type_id, value_id),) = (await intern_entities(db, [(entity_type, entity_value)])).values()
+    key = normalize(alias)
+    if key == normalize(entity_value):
+        raise ValueError(f"{alias!r} already resolves to {entity_value!r}")
+
+    await db.execute(
+        insert(EntityAlias).values(type_id=type_id, key=key, value_id=value_id)
+        .on_conflict_do_update(index_elements=[EntityAlias.type_id, EntityAlias.key],
+                               set_={"value_id": value_id}))
+    moved = []
+    old_id = await db.scalar(
+        select(EntityValue.id).where(EntityValue.type_id == type_id, EntityValue.key == key))
+    if old_id is not None and old_id != value_id:
+        # Aliases of the old value follow it
+        await db.execute(update(EntityAlias).where(EntityAlias.value_id == old_id)
+                         .values(value_id=value_id))
+        moved = (await db.execute(
+            update(Entity.__table__)
+            .where(Entity.type_id == type_id, Entity.value_id == old_id)
+            .values(value_id=value_id)
+            .returning(Entity.message_id)
+        )).scalars().all()
+    # Aliases change rarely; start this process's value cache over
+    _value_ids.clear()
+    return moved
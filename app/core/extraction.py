@@ -0,0 +1,276 @@
+"""Background entity extraction through a durable outbox
+
+New messages are queued in the extraction_outbox table in the same statement
+or transaction that creates them. Workers (EXTRACTION_WORKERS loops per
+process) claim due rows in batches of EXTRACTION_BATCH_SIZE with
+FOR UPDATE SKIP LOCKED, so several processes can share the queue. They run
+the extractor over the batch, then bulk-insert the entities and delete the
+outbox rows in one transaction.
+
+A claim pushes the row's available_at out by EXTRACTION_LEASE_SECONDS. If
+the worker dies before committing, the row becomes due again once the lease
+expires and another worker picks it up. Messages the extractor fails on are
+retried with exponential backoff, and so are messages whose entities the
+database rejects: when storing a batch fails, it is stored again message
+by message. After EXTRACTION_MAX_ATTEMPTS they are marked failed and kept
+for inspection.
+
+Workers are woken in-process right after a message is committed, and poll
+every EXTRACTION_POLL_SECONDS for rows queued by other processes.
+"""
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List
+from sqlalchemy import delete, func, insert, select, tuple_, update
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.broker import broker, entity_event
+from app.core.cache import invalidate_tags
+from app.core.config import settings
+from app.core.dictionary import intern_entities
+from app.core.extractors import create_extractor
+from app.core.metrics import Counter, Histogram
+from app.database.database import AsyncSessionLocal
+from app.models import Entity, ExtractionOutbox, Message
+from app.models.entity import ENTITY_COLUMNS
+from app.models.message import MESSAGE_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+EXTRACTION_MESSAGES = Counter(
+    "extraction_messages_total",
+    "Messages processed by the extraction worker, by result (extracted, retried or failed)",
+    ("result",),
+)
+EXTRACTION_ENTITIES = Counter(
+    "extraction_entities_total",
+    "Entities created by the extraction worker",
+)
+EXTRACTION_BATCH = Histogram(
+    "extraction_batch_seconds",
+    "Time to extract and store one claimed batch",
+)
+
+outbox = ExtractionOutbox.__table__
+
+
+async def insert_message(db: AsyncSession, values: Dict[str, Any]) -> Row:
+    """INSERT a message and queue it for extraction, in one statement"""
+    messages = Message.__table__
+    inserted = insert(messages).values(**values).returning(*MESSAGE_COLUMNS).cte("inserted")
+    queued = insert(outbox).from_select(
+        ["message_id", "message_created_at"], select(inserted.c.id, inserted.c.created_at)
+    ).cte("queued")
+    result = await db.execute(select(inserted).add_cte(queued))
+    return result.one()
+
+
+async def queue_extraction(db: AsyncSession, messages: Iterable[Row]):
+    """Queue already inserted messages for extraction, in the caller's transaction"""
+    rows = [{"message_id": message.id, "message_created_at": message.created_at}
+            for message in messages]
+    if rows:
+        await db.execute(insert(outbox), rows)
+
+
+class ExtractionWorker:
+    """Claims queued messages and stores the entities extracted from them"""
+
+    def __init__(self):
+        self._extractor = None
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def extractor(self):
+        if self._extractor is None:
+            self._extractor = create_extractor(settings.extraction_backend)
+        return self._extractor
+
+    def notify(self):
+        """Wake idle worker loops after new messages were committed"""
+        self._wakeup.set()
+
+    async def start(self):
+        for _ in range(settings.extraction_workers):
+            self._tasks.append(asyncio.get_running_loop().create_task(self._loop()))
+
+    async def stop(self):
+        """Stop the loops; batches in progress are retried once their lease expires"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _loop(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                claimed = await self.run_once()
+            except Exception:
+                logger.exception("Entity extraction batch failed")
+                claimed = 0
+            if claimed < settings.extraction_batch_size:
+                try:
+                    await asyncio.wait_for(
+                        self._wakeup.wait(), settings.extraction_poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _claim(self, session: AsyncSession) -> tuple:
+        """Lease a batch of due outbox rows and load their messages"""
+        due = (
+            select(outbox.c.id)
+            .where(outbox.c.failed_at.is_(None), outbox.c.available_at <= func.now())
+            .order_by(outbox.c.available_at, outbox.c.id)
+            .limit(settings.extraction_batch_size)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        result = await session.execute(
+            update(outbox)
+            .where(outbox.c.id.in_(due))
+            .values(attempts=outbox.c.attempts + 1,
+                    available_at=func.now() + timedelta(
+                        seconds=settings.extraction_lease_seconds))
+            .returning(outbox.c.id, outbox.c.message_id, outbox.c.message_created_at,
+                       outbox.c.attempts)
+        )
+        claimed = result.all()
+        messages = []
+        if claimed:
+            # With created_at, each message is looked up in its own partition
+            messages = (await session.execute(
+                select(Message.id, Message.created_at, Message.conversation_id, Message.content)
+                .where(tuple_(Message.id, Message.created_at).in_(
+                    [(row.message_id, row.message_created_at) for row in claimed]))
+                .order_by(Message.id)
+            )).all()
+        # Commit the lease, and hold no connection while the extractor runs
+        await session.commit()
+        return claimed, messages
+
+    async def _extract(self, messages: List[Row]) -> tuple:
+        """Extract a batch; if the batch fails, retry message by message to isolate bad ones"""
+        contents = [message.content for message in messages]
+        try:
+            return await self.extractor.extract(contents), {}
+        except Exception:
+            if len(messages) == 1:
+                raise
+        extracted, errors = [], {}
+        for message in messages:
+            try:
+                extracted.extend(await self.extractor.extract([message.content]))
+            except Exception as exc:
+                extracted.append([])
+                errors[message.id] = f"{type(exc).__name__}: {exc}"
+        return extracted, errors
+
+    async def _store(self, session: AsyncSession, claimed: List[Row], messages: List[Row],
+                     extracted: Dict[int, list], errors: Dict[int, str]) -> List[Row]:
+        """Insert the entities of `claimed`, settle their outbox rows and commit
+
+        Returns the inserted entity rows.
+        """
+        found = [
+            (message, entity_type, entity_value, confidence)
+            for message in messages
+            if message.id not in errors
+            for entity_type, entity_value, confidence in extracted.get(message.id, ())
+        ]
+        interned = await intern_entities(
+            session, [(entity_type, entity_value) for _, entity_type, entity_value, _ in found])
+        entity_params = [
+            {"message_id": message.id, "message_created_at": message.created_at,
+             "type_id": type_id, "value_id": value_id, "confidence_score": confidence}
+            for message, entity_type, entity_value, confidence in found
+            for type_id, value_id in [interned[entity_type, entity_value]]
+        ]
+        entity_rows = []
+        if entity_params:
+            entity_rows = (await session.execute(
+                insert(Entity).returning(
+                    *ENTITY_COLUMNS, sort_by_parameter_order=True),
+                entity_params
+            )).all()
+        done = [row.id for row in claimed if row.message_id not in errors]
+        if done:
+            await session.execute(delete(outbox).where(outbox.c.id.in_(done)))
+        for row in claimed:
+            if row.message_id in errors:
+                await self._record_failure(session, row, errors[row.message_id])
+        await session.commit()
+        return entity_rows
+
+    async def run_once(self) -> int:
+        """Claim and process one batch; returns how many outbox rows were claimed"""
+        async with AsyncSessionLocal() as session:
+            claimed, messages = await self._claim(session)
+            if not claimed:
+                return 0
+            started = time.perf_counter()
+
+            try:
+                extracted, errors = await self._extract(messages)
+            except Exception as exc:
+                extracted = [[] for _ in messages]
+                errors = {message.id: f"{type(exc).__name__}: {exc}" for message in messages}
+            extracted = {message.id: entities for message, entities in zip(messages, extracted)}
+
+            try:
+                entity_rows = await self._store(session, claimed, messages, extracted, errors)
+            except Exception:
+                # Such as a value the database rejects: store message by message,
+                # so only the offending ones are retried
+                logger.warning("Storing an extraction batch failed; storing message by message",
+                               exc_info=True)
+                await session.rollback()
+                entity_rows = []
+                for row in claimed:
+                    own = [message for message in messages if message.id == row.message_id]
+                    try:
+                        entity_rows += await self._store(session, [row], own, extracted, errors)
+                    except Exception as exc:
+                        await session.rollback()
+                        errors[row.message_id] = f"{type(exc).__name__}: {exc}"
+                        await self._store(session, [row], own, extracted, errors)
+            failed = [row for row in claimed if row.message_id in errors]
+
+        EXTRACTION_BATCH.observe(time.perf_counter() - started)
+        EXTRACTION_MESSAGES.inc(len(claimed) - len(failed), result="extracted")
+        EXTRACTION_ENTITIES.inc(len(entity_rows))
+        if entity_rows:
+            await invalidate_tags(*{f"message:{row.message_id}:entities" for row in entity_rows})
+            conversation_of = {message.id: message.conversation_id for message in messages}
+            for row in entity_rows:
+                await broker.publish(
+                    f"conversation:{conversation_of[row.message_id]}", entity_event(row))
+        return len(claimed)
+
+    async def _record_failure(self, session: AsyncSession, row: Row, error: str):
+        if row.attempts >= settings.extraction_max_attempts:
+            EXTRACTION_MESSAGES.inc(result="failed")
+            values = {"failed_at": func.now()}
+        else:
+            EXTRACTION_MESSAGES.inc(result="retried")
+            backoff = settings.extraction_retry_seconds * 2 ** (row.attempts - 1)
+            values = {"available_at": func.now() + timedelta(seconds=backoff)}
+        await session.execute(
+            update(outbox).where(outbox.c.id == row.id)
+            .values(last_error=error[:1000], **values))
+
+
+async def extraction_backlog() -> Dict[str, int]:
+    """Counts of queued and permanently failed outbox rows"""
+    async with AsyncSessionLocal() as session:
+        row = (await session.execute(select(
+            func.count().filter(outbox.c.failed_at.is_(None)),
+            func.count().filter(outbox.c.failed_at.is_not(None)),
+        ))).one()
+    return {"queued": row[0], "failed": row[1]}
+
+
+extraction_worker = ExtractionWorker()
@@ -0,0 +1,111 @@
+"""Entity extractors for the background extraction worker
+
+An extractor turns a batch of message texts into (entity_type, entity_value,
+confidence_score) tuples per text. EXTRACTION_BACKEND selects one; "rules",
+the default, uses keyword lists and patterns for the four entity types the
+chatbot tracks (location, activity, time and budget), so it works offline.
+"""
+import re
+from typing import List, Sequence, Tuple
+
+Extracted = Tuple[str, str, int]
+
+LOCATIONS = [
+    "Bali", "Ubud", "Canggu", "Seminyak", "Kuta", "Legian", "Uluwatu", "Jimbaran",
+    "Sanur", "Nusa Dua", "Nusa Penida", "Nusa Lembongan", "Amed", "Lovina", "Munduk",
+    "Sidemen", "Tanah Lot", "Mount Batur", "Mount Agung", "Lombok", "Gili Islands",
+    "Gili Trawangan", "Gili Air", "Gili Meno", "Komodo", "Labuan Bajo", "Flores",
+    "Java", "Jakarta", "Yogyakarta", "Borobudur", "Prambanan", "Mount Bromo",
+    "Bandung", "Surabaya", "Raja Ampat", "Sumatra", "Lake Toba", "Sulawesi",
+    "Indonesia", "Singapore", "Bangkok", "Paris", "Switzerland",
+]
+ACTIVITIES = [
+    "scuba diving", "diving", "free diving", "snorkeling", "snorkelling", "surfing",
+    "surf lessons", "hiking", "trekking", "sunrise trek", "volcano trek", "yoga",
+    "cooking class", "white water rafting", "rafting", "canyoning", "kayaking",
+    "paddle boarding", "paragliding", "fishing", "cycling", "swimming", "spa",
+    "massage", "temple tour", "temple visit", "sightseeing", "shopping", "nightlife",
+    "beach club", "island hopping", "wildlife tour", "photography",
+]
+MONTHS = [
+    "January", "February", "March", "April", "May", "June", "July", "August",
+    "September", "October", "November", "December",
+]
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+SEASONS = ["dry season", "wet season", "rainy season", "high season", "low season",
+           "shoulder season", "summer", "winter", "spring", "autumn"]
+BUDGET_LEVELS = ["backpacker", "budget", "cheap", "affordable", "mid-range",
+                 "luxury", "high-end"]
+
+
+def _alternation(words: Sequence[str]) -> str:
+    # Longest first, so "scuba diving" wins over "diving"
+    return "|".join(re.escape(word) for word in sorted(words, key=len, reverse=True))
+
+
+_NUMBER = r"(?:\d+|a|an|one|two|three|four|five|six|seven|eight|nine|ten|couple of)"
+_AMOUNT = r"\d[\d,.]*\s?(?:k|K|rb|juta|million)?"
+
+LOCATION_RE = re.compile(rf"\b(?:{_alternation(LOCATIONS)})\b", re.IGNORECASE)
+ACTIVITY_RE = re.compile(rf"\b(?:{_alternation(ACTIVITIES)})\b", re.IGNORECASE)
+TIME_RES = [
+    re.compile(rf"\b{_NUMBER}[- ](?:day|night|week|month)s?(?:[- ]trip)?\b", re.IGNORECASE),
+    re.compile(rf"\b\d{{1,2}}(?:st|nd|rd|th)?(?: of)? (?:{_alternation(MONTHS)})\b", re.IGNORECASE),
+    # Capitalized only, and not "May I ..."
+    re.compile(rf"\b(?!May (?:I|we|you)\b)(?:{_alternation(MONTHS)})(?: \d{{1,2}}(?:st|nd|rd|th)?)?\b"),
+    re.compile(rf"\b(?:next|this) (?:week|weekend|month|year|{_alternation(WEEKDAYS)})\b", re.IGNORECASE),
+    re.compile(rf"\b(?:{_alternation(SEASONS)})\b", re.IGNORECASE),
+]
+BUDGET_RES = [
+    re.compile(rf"(?:US)?\$\s?{_AMOUNT}(?:\s?(?:-|to)\s?\$?{_AMOUNT})?"),
+    re.compile(rf"\b(?:Rp\.?|IDR|USD|EUR|€)\s?{_AMOUNT}", re.IGNORECASE),
+    re.compile(rf"\b{_AMOUNT}\s?(?:USD|EUR|IDR|dollars|euros|rupiah)\b", re.IGNORECASE),
+]
+BUDGET_LEVEL_RE = re.compile(
+    rf"\b(?:{_alternation(BUDGET_LEVELS)})\b(?= (?:trip|travel|hotel|hotels|stay|option|options|accommodation))",
+    re.IGNORECASE)
+
+_CANONICAL = {word.lower(): word for word in LOCATIONS + MONTHS}
+
+
+class RuleBasedExtractor:
+    """Keyword and pattern matching; fast, deterministic and offline"""
+
+    name = "rules"
+
+    def extract_one(self, content: str) -> List[Extracted]:
+        found = {}
+
+        def add(entity_type: str, value: str, confidence: int):
+            value = " ".join(value.split()).strip(" .,")
+            key = (entity_type, value.lower())
+            if value and key not in found:
+                found[key] = (entity_type, value, confidence)
+
+        for match in LOCATION_RE.finditer(content):
+            add("location", _CANONICAL.get(match.group().lower(), match.group()), 90)
+        for match in ACTIVITY_RE.finditer(content):
+            add("activity", match.group().lower(), 90)
+        spans = []
+        for pattern in TIME_RES:
+            for match in pattern.finditer(content):
+                # Skip "August" inside an already matched "3rd of August"
+                if not any(start <= match.start() and match.end() <= end for start, end in spans):
+                    spans.append(match.span())
+                    add("time", match.group(), 80)
+        for pattern in BUDGET_RES:
+            for match in pattern.finditer(content):
+                add("budget", match.group(), 85)
+        for match in BUDGET_LEVEL_RE.finditer(content):
+            add("budget", match.group().lower(), 60)
+        return list(found.values())
+
+    async def extract(self, contents: Sequence[str]) -> List[List[Extracted]]:
+        return [self.extract_one(content) for content in contents]
+
+
+def create_extractor(backend: str):
+    """Build the extractor named by EXTRACTION_BACKEND"""
+    if backend == "rules":
+        return RuleBasedExtractor()
+    raise RuntimeError(f"Unknown EXTRACTION_BACKEND {backend!r}")
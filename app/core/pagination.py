@@ -0,0 +1,66 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Callable, Optional, Sequence, Tuple
+from fastapi import HTTPException, status
+from sqlalchemy import tuple_
+
+
+def _encode(values: list) -> str:
+    raw = json.dumps(values).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode(cursor: str, parse: Callable[[Any, Any], tuple]) -> tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        first, id = json.loads(base64.urlsafe_b64decode(padded))
+        return parse(first, id)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor"
+        )
+
+
+def encode_cursor(created_at: datetime, id: int) -> str:
+    """Encode a (created_at, id) keyset position as an opaque cursor"""
+    return _encode([created_at.isoformat(), id])
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decode an opaque cursor back into a (created_at, id) keyset position"""
+    return _decode(cursor, lambda created_at, id: (
+        datetime.fromisoformat(created_at), int(id)))
+
+
+def encode_rank_cursor(rank: float, id: int) -> str:
+    """Encode a (rank, id) position in relevance-ordered results as an opaque cursor"""
+    return _encode([rank, id])
+
+
+def decode_rank_cursor(cursor: str) -> Tuple[float, int]:
+    """Decode an opaque cursor back into a (rank, id) position"""
+    return _decode(cursor, lambda rank, id: (float(rank), int(id)))
+
+
+def apply_keyset(stmt, model, cursor: Optional[str], limit: int):
+    """Order a select by (created_at, id) and seek past the cursor position
+
+    One extra row is fetched so the caller can tell whether another page exists.
+    """
+    stmt = stmt.order_by(model.created_at.asc(), model.id.asc())
+    if cursor:
+        created_at, id = decode_cursor(cursor)
+        stmt = stmt.where(tuple_(model.created_at, model.id) > (created_at, id))
+    return stmt.limit(limit + 1)
+
+
+def keyset_page(rows: Sequence, limit: int) -> Tuple[list, Optional[str]]:
+    """Split a keyset result into the page rows and the next cursor"""
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(last.created_at, last.id)
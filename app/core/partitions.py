@@ -0,0 +1,85 @@
+"""Creates monthly partitions of messages and entities ahead of time
+
+Every PARTITION_CHECK_SECONDS, and at startup, the worker creates the
+partitions from the current UTC month through PARTITION_MONTHS_AHEAD months
+ahead that do not exist yet (see app.models.partition). Creating a partition
+briefly locks its parent table, so this is done long before the month
+starts rather than when its first row arrives.
+
+Workers in several processes take turns through a transaction-level
+advisory lock. A failure is logged and retried on the next run. It only
+matters once the months already created run out: rows then land in the
+default partition, and the month's partition cannot be created until they
+are moved out of it.
+"""
+import asyncio
+import logging
+from typing import Optional
+from sqlalchemy import func, select, text
+from app.core.config import settings
+from app.core.metrics import Counter
+from app.database.database import AsyncSessionLocal
+from app.models.partition import PARTITIONED_TABLES
+
+logger = logging.getLogger(__name__)
+
+PARTITIONS_CREATED = Counter(
+    "partitions_created_total",
+    "Monthly partitions created ahead of time, by table",
+    ("table",),
+)
+
+# pg_try_advisory_xact_lock key held while creating partitions
+PARTITION_LOCK = 7_301_925_045
+
+CREATE_AHEAD = text(
+    "SELECT create_monthly_partitions(:table, (now() AT TIME ZONE 'UTC')::date, "
+    "(now() AT TIME ZONE 'UTC' + make_interval(months => :months))::date)"
+)
+
+
+class PartitionWorker:
+    """Keeps PARTITION_MONTHS_AHEAD months of partitions created"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        try:
+            await self.run_once()
+        except Exception:
+            logger.exception("Creating partitions failed")
+        self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(settings.partition_check_seconds)
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Creating partitions failed")
+
+    async def run_once(self) -> int:
+        """Create missing partitions; returns how many were created"""
+        created = 0
+        async with AsyncSessionLocal() as session:
+            if not await session.scalar(select(func.pg_try_advisory_xact_lock(PARTITION_LOCK))):
+                return 0
+            # Give up rather than queue behind long transactions on the parents
+            await session.execute(text("SET LOCAL lock_timeout = '5s'"))
+            for table in PARTITIONED_TABLES:
+                count = await session.scalar(
+                    CREATE_AHEAD, {"table": table, "months": settings.partition_months_ahead})
+                PARTITIONS_CREATED.inc(count, table=table)
+                created += count
+            await session.commit()
+        return created
+
+
+partition_worker = PartitionWorker()
@@ -0,0 +1,112 @@
+"""Cached, pre-serialized responses for read-heavy GET routes
+
+Entries hold the rendered JSON body and its ETag, keyed by path and query
+string, and are tagged with every row and collection they were built from:
+
+    user:{id}                     the user row
+    user:{id}:conversations       which conversations the user has
+    conversation:{id}             the conversation row
+    conversation:{id}:messages    which messages the conversation has
+    message:{id}                  the message row
+    message:{id}:entities         the message's entities
+
+Write handlers invalidate the tags they touch with invalidate_tags(). Views
+are tagged with their ancestors too, so deleting a parent also invalidates
+views of the children removed by ON DELETE CASCADE.
+"""
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Tuple
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+from app.core.cache import TaggedCache
+from app.core.config import settings
+from app.core.metrics import Counter
+
+RESPONSE_CACHE_REQUESTS = Counter(
+    "response_cache_requests_total",
+    "Cached GET route lookups by result (hit, miss or not_modified)",
+    ("route", "result"),
+)
+
+response_cache = TaggedCache(
+    "response",
+    ttl=settings.response_cache_ttl_seconds,
+    maxsize=settings.response_cache_maxsize,
+)
+
+_adapters: Dict[Any, TypeAdapter] = {}
+
+
+def message_tags(message_ids: Iterable[int]) -> List[str]:
+    """Tags of the given messages and of their entities"""
+    return [tag for id in message_ids
+            for tag in (f"message:{id}", f"message:{id}:entities")]
+
+
+def _adapter(response_model) -> TypeAdapter:
+    adapter = _adapters.get(response_model)
+    if adapter is None:
+        adapter = _adapters[response_model] = TypeAdapter(response_model)
+    return adapter
+
+
+def _cache_key(request: Request) -> str:
+    query = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+    return f"{request.url.path}?{query}"
+
+
+def _etag(body: str) -> str:
+    return f'"{hashlib.blake2b(body.encode(), digest_size=16).hexdigest()}"'
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [value.strip() for value in header.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def _respond(request: Request, route: str, entry: dict, result: str) -> Response:
+    headers = {"ETag": entry["etag"], "Cache-Control": "no-cache"}
+    if _etag_matches(request, entry["etag"]):
+        RESPONSE_CACHE_REQUESTS.inc(route=route, result="not_modified")
+        return Response(status_code=304, headers=headers)
+    RESPONSE_CACHE_REQUESTS.inc(route=route, result=result)
+    return Response(content=entry["body"], media_type="application/json", headers=headers)
+
+
+async def cached_response(
+    request: Request,
+    route: str,
+    response_model,
+    tags: Iterable[str],
+    load: Callable[[], Awaitable[Tuple[Any, Iterable[str]]]],
+    exclude_unset: bool = False,
+) -> Response:
+    """Serve a GET route from the response cache, building it with `load` on a miss
+
+    `tags` are the ones known before loading; `load` returns the data along
+    with the tags of the rows it found. Hits are answered from the stored
+    body, or with 304 when If-None-Match carries its ETag.
+    """
+    key = _cache_key(request)
+    entry = await response_cache.get(key)
+    if entry is not None:
+        return _respond(request, route, entry, "hit")
+
+    # Snapshot generations before reading, so a write racing the load leaves
+    # the entry already stale rather than caching old data as current
+    generations = await response_cache.generations(tags)
+    data, found_tags = await load()
+    generations.update(await response_cache.generations(
+        tag for tag in found_tags if tag not in generations))
+
+    adapter = _adapter(response_model)
+    body = adapter.dump_json(
+        adapter.validate_python(data, from_attributes=True),
+        exclude_unset=exclude_unset,
+    ).decode()
+    entry = {"body": body, "etag": _etag(body)}
+    await response_cache.set(key, entry, generations)
+    return _respond(request, route, entry, "miss")
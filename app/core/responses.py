@@ -0,0 +1,16 @@
+"""Response classes for routes that build their payload themselves"""
+from typing import Any
+import orjson
+from fastapi.responses import JSONResponse
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response encoded with orjson, for plain dict/list payloads
+
+    Unlike response_model routes nothing is validated or converted through
+    jsonable_encoder; datetimes are written as ISO 8601 with a trailing Z, as
+    pydantic does.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z)
@@ -0,0 +1,193 @@
+"""Pre-aggregated entity counts for the analytics endpoints
+
+entity_rollups holds the number of entities per UTC day, type and value,
+by their ids in the entity dictionary (see app.core.dictionary).
+Analytics queries sum at most one row per day and value instead of counting
+entities, so they take milliseconds however large the entities table grows.
+Per-user queries read the user's own entities instead: a user rarely
+mentions the same value twice in a day, so per-user daily rollups would be
+about as large as the entities they summarize.
+
+Rollups are maintained incrementally, a day at a time. A statement trigger
+on entities records every day an INSERT, UPDATE or DELETE touched in
+stale_rollup_buckets, cascaded deletes included. The rollup worker
+recomputes those days every ENTITY_ROLLUP_INTERVAL_SECONDS, at most
+ENTITY_ROLLUP_BATCH_DAYS per transaction, from a range scan over each day's
+entities. Rollups lag the entities by up to one interval.
+
+Recomputing takes a transaction-level advisory lock, so workers in several
+processes take turns instead of redoing each other's work.
+"""
+import asyncio
+import itertools
+import logging
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from sqlalchemy import and_, delete, func, insert, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.metrics import Counter, Histogram
+from app.database.database import AsyncSessionLocal
+from app.core.dictionary import normalize
+from app.models import (
+    Conversation, Entity, EntityRollup, EntityType, EntityValue, Message, StaleRollupBucket
+)
+
+logger = logging.getLogger(__name__)
+
+ENTITY_ROLLUP_DAYS = Counter(
+    "entity_rollup_days_total",
+    "Days of entity rollups recomputed",
+)
+ENTITY_ROLLUP_BATCH = Histogram(
+    "entity_rollup_batch_seconds",
+    "Time to recompute one batch of stale days",
+)
+
+# pg_try_advisory_xact_lock key held while recomputing
+ROLLUP_LOCK = 7_301_925_044
+
+stale = StaleRollupBucket.__table__
+
+
+async def _recompute(session: AsyncSession, bucket: date):
+    """Replace a day's rollups with fresh counts of its entities"""
+    start = datetime(bucket.year, bucket.month, bucket.day, tzinfo=timezone.utc)
+    await session.execute(delete(EntityRollup).where(EntityRollup.bucket == bucket))
+    await session.execute(insert(EntityRollup).from_select(
+        ["type_id", "bucket", "value_id", "count"],
+        select(Entity.type_id, literal(bucket), Entity.value_id, func.count())
+        .where(Entity.created_at >= start, Entity.created_at < start + timedelta(days=1))
+        .group_by(Entity.type_id, Entity.value_id)
+    ))
+
+
+class RollupWorker:
+    """Recomputes the rollups of days whose entities changed"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if settings.entity_rollups_enabled:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self):
+        """Stop the loop; a batch in progress is rolled back and redone later"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                refreshed = await self.run_once()
+            except Exception:
+                logger.exception("Entity rollup refresh failed")
+                refreshed = 0
+            if refreshed < settings.entity_rollup_batch_days:
+                await asyncio.sleep(settings.entity_rollup_interval_seconds)
+
+    async def run_once(self) -> int:
+        """Recompute one batch of stale days; returns how many were recomputed"""
+        async with AsyncSessionLocal() as session:
+            if not await session.scalar(select(func.pg_try_advisory_xact_lock(ROLLUP_LOCK))):
+                return 0
+            started = time.perf_counter()
+            # Markers written after this point stay behind for the next run
+            oldest = (select(stale.c.bucket).distinct().order_by(stale.c.bucket)
+                      .limit(settings.entity_rollup_batch_days))
+            buckets = sorted(set((await session.execute(
+                delete(stale).where(stale.c.bucket.in_(oldest)).returning(stale.c.bucket)
+            )).scalars()))
+            for bucket in buckets:
+                await _recompute(session, bucket)
+            await session.commit()
+
+        if buckets:
+            ENTITY_ROLLUP_BATCH.observe(time.perf_counter() - started)
+            ENTITY_ROLLUP_DAYS.inc(len(buckets))
+        return len(buckets)
+
+
+def _user_counts(user_id: int):
+    """One row per entity of the user, shaped like entity_rollups"""
+    return (
+        select(Entity.type_id,
+               func.timezone("UTC", Entity.created_at).cast(EntityRollup.bucket.type)
+               .label("bucket"),
+               Entity.value_id, literal(1).label("count"))
+        .join(Message, and_(Message.id == Entity.message_id,
+                            Message.created_at == Entity.message_created_at))
+        .join(Conversation, Conversation.id == Message.conversation_id)
+        .where(Conversation.user_id == user_id)
+        .subquery()
+    )
+
+
+async def top_entities(
+    db: AsyncSession,
+    entity_type: Optional[str] = None,
+    user_id: Optional[int] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    interval: Optional[str] = None,
+    limit: int = 10,
+) -> List[Dict]:
+    """The `limit` most frequent values of each entity type
+
+    Days run from `start` to `end`, both included. With an interval ("day",
+    "week" or "month") there is one group per type and period.
+    """
+    counts = _user_counts(user_id) if user_id is not None else EntityRollup.__table__
+    period = (func.date_trunc(interval, counts.c.bucket).cast(counts.c.bucket.type)
+              if interval else literal(None, counts.c.bucket.type))
+    totals = select(
+        counts.c.type_id, period.label("bucket"), counts.c.value_id,
+        func.sum(counts.c.count).label("count"),
+    )
+    if entity_type is not None:
+        totals = totals.where(counts.c.type_id == select(EntityType.id).where(
+            EntityType.name == normalize(entity_type)).scalar_subquery())
+    if start is not None:
+        totals = totals.where(counts.c.bucket >= start)
+    if end is not None:
+        totals = totals.where(counts.c.bucket <= end)
+    totals = totals.group_by(counts.c.type_id, period, counts.c.value_id).subquery()
+
+    ranked = select(
+        EntityType.name.label("entity_type"), totals.c.bucket,
+        EntityValue.value.label("entity_value"), totals.c.count,
+        func.row_number().over(
+            partition_by=(totals.c.type_id, totals.c.bucket),
+            order_by=(totals.c.count.desc(), EntityValue.value),
+        ).label("rank"),
+    ).select_from(
+        totals.join(EntityType, EntityType.id == totals.c.type_id)
+        .join(EntityValue, EntityValue.id == totals.c.value_id)
+    ).subquery()
+    rows = (await db.execute(
+        select(ranked.c.entity_type, ranked.c.bucket, ranked.c.entity_value, ranked.c.count)
+        .where(ranked.c.rank <= limit)
+        .order_by(ranked.c.bucket, ranked.c.entity_type, ranked.c.rank)
+    )).all()
+    return [
+        {"entity_type": entity_type, "bucket": bucket,
+         "values": [{"entity_value": row.entity_value, "count": row.count} for row in group]}
+        for (entity_type, bucket), group in itertools.groupby(
+            rows, key=lambda row: (row.entity_type, row.bucket))
+    ]
+
+
+async def rollup_backlog() -> Dict[str, Optional[date]]:
+    """How many days wait to be recomputed, and the oldest of them"""
+    async with AsyncSessionLocal() as session:
+        row = (await session.execute(select(
+            func.count(stale.c.bucket.distinct()), func.min(stale.c.bucket),
+        ))).one()
+    return {"stale_days": row[0], "oldest_stale_day": row[1]}
+
+
+rollup_worker = RollupWorker()
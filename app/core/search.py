@@ -0,0 +1,136 @@
+"""Full-text and fuzzy search over message content
+
+Text search matches websearch_to_tsquery('english', q) against the stored
+messages.search_vector through its GIN index and ranks with ts_rank, so
+"bali beaches" also finds "beach in Bali". Quoted phrases, "or" and -word
+work as they do on web search engines.
+
+Fuzzy search matches q against the content with pg_trgm word similarity
+(q <% content) through the trigram GIN index, so a misspelled "snorkling"
+still finds "snorkeling". It ranks by word_similarity.
+
+Results are ordered by (rank, id) descending and paged with a keyset cursor
+on that pair, and only the rows of the returned page are highlighted.
+
+Highlights are HTML: the content is escaped and matches are wrapped in
+<mark> tags, so clients can render them as is. Text search highlights come
+from ts_headline, which marks matches with control characters that are
+first removed from the content; they are swapped for the tags after
+escaping. Fuzzy highlights mark the words that are trigram-similar to a
+word of q, the way pg_trgm compares them.
+"""
+import html
+import re
+from typing import List, Optional, Set, Tuple
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.pagination import decode_rank_cursor, encode_rank_cursor
+from app.models import Conversation, Message
+
+SEARCH_CONFIG = "english"
+# Never in highlighted text: they are stripped from the content beforehand
+START_SEL, STOP_SEL = "\x02", "\x03"
+MAX_FRAGMENTS = 2
+MAX_WORDS = 20
+HEADLINE_OPTIONS = (f"StartSel={START_SEL}, StopSel={STOP_SEL}, "
+                    f"MaxFragments={MAX_FRAGMENTS}, MaxWords={MAX_WORDS}, MinWords=8")
+FRAGMENT_DELIMITER = " ... "
+# pg_trgm's default similarity_threshold
+SIMILARITY_THRESHOLD = 0.3
+
+WORD = re.compile(r"[^\W_]+")
+
+
+def _render(headline: str) -> str:
+    """Escape a ts_headline result and turn its selection markers into <mark> tags"""
+    return (html.escape(headline, quote=False)
+            .replace(START_SEL, "<mark>").replace(STOP_SEL, "</mark>"))
+
+
+def _trigrams(word: str) -> Set[str]:
+    # As pg_trgm: lowercased, two spaces before and one after
+    padded = f"  {word.lower()} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _similar(word: Set[str], query: List[Set[str]]) -> bool:
+    return any(len(word & q) / len(word | q) >= SIMILARITY_THRESHOLD for q in query)
+
+
+def fuzzy_highlight(content: str, q: str) -> str:
+    """Up to MAX_FRAGMENTS fragments of `content` around the words similar to q's"""
+    query = [_trigrams(word) for word in WORD.findall(q)]
+    words = list(WORD.finditer(content))
+    if not words:
+        return html.escape(content, quote=False)
+    matched = {i for i, word in enumerate(words) if _similar(_trigrams(word.group()), query)}
+
+    windows: List[List[int]] = []
+    for i in sorted(matched) or [0]:
+        if windows and i < windows[-1][1]:
+            continue
+        if len(windows) == MAX_FRAGMENTS:
+            break
+        start = max(0, min(i - MAX_WORDS // 2, len(words) - MAX_WORDS))
+        windows.append([start, min(start + MAX_WORDS, len(words))])
+
+    fragments = []
+    for start, stop in windows:
+        parts, position = [], words[start].start()
+        for i in range(start, stop):
+            word = words[i]
+            parts.append(html.escape(content[position:word.start()], quote=False))
+            text = html.escape(word.group(), quote=False)
+            parts.append(f"<mark>{text}</mark>" if i in matched else text)
+            position = word.end()
+        fragments.append("".join(parts))
+    return FRAGMENT_DELIMITER.join(fragments)
+
+
+async def find_messages(
+    db: AsyncSession,
+    q: str,
+    fuzzy: bool = False,
+    user_id: Optional[int] = None,
+    conversation_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = 20,
+) -> Tuple[list, Optional[str]]:
+    """One page of matching messages, best first, and the cursor of the next page"""
+    query = func.websearch_to_tsquery(SEARCH_CONFIG, q)
+    if fuzzy:
+        rank = func.word_similarity(q, Message.content)
+        match = Message.content.bool_op("%>")(q)
+    else:
+        rank = func.ts_rank(Message.search_vector, query)
+        match = Message.search_vector.bool_op("@@")(query)
+
+    stmt = select(
+        Message.id, Message.conversation_id, Message.sender_type, Message.content,
+        Message.created_at, rank.label("rank"),
+    ).where(match)
+    if conversation_id is not None:
+        stmt = stmt.where(Message.conversation_id == conversation_id)
+    if user_id is not None:
+        stmt = stmt.where(Message.conversation_id.in_(
+            select(Conversation.id).where(Conversation.user_id == user_id)))
+    if cursor:
+        stmt = stmt.where(tuple_(rank, Message.id) < decode_rank_cursor(cursor))
+    page = stmt.order_by(rank.desc(), Message.id.desc()).limit(limit + 1).subquery()
+
+    columns = [page]
+    if not fuzzy:
+        columns.append(func.ts_headline(
+            SEARCH_CONFIG, func.translate(page.c.content, START_SEL + STOP_SEL, ""),
+            query, HEADLINE_OPTIONS).label("headline"))
+    result = await db.execute(
+        select(*columns).order_by(page.c.rank.desc(), page.c.id.desc()))
+    rows = result.all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_rank_cursor(rows[-1].rank, rows[-1].id)
+    hits = [{**row._mapping,
+             "highlight": fuzzy_highlight(row.content, q) if fuzzy else _render(row.headline)}
+            for row in rows]
+    return hits, next_cursor
@@ -1,6 +1,8 @@
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase, sessionmaker
 from sqlalchemy.pool import QueuePool
+from app.database.pool import InstrumentedPool, PoolMonitor, ReplicaPool
+from app.database.query_stats import instrument_engine
 from app.core.config import settings
 from sqlalchemy.ext.asyncio import AsyncSession
 import os
@@ -8,33 +10,57 @@ from sqlalchemy import create_engine
 
 database_url = settings.ephemeral_database_url if settings.debug else settings.database_url
 
+pool_options = dict(
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    pool_recycle=settings.db_pool_recycle,
+    pool_pre_ping=settings.db_pool_pre_ping,
+)
+
 # Detect if running under Alembic migration
 if os.environ.get("ALEMBIC_MIGRATION", "0") == "1":
     # Use sync engine for Alembic
     engine = create_engine(
         database_url.replace("+asyncpg", "+psycopg2"),
         poolclass=QueuePool,
-        pool_size=20,
-        max_overflow=30,
-        pool_pre_ping=True,
-        pool_recycle=300,
+        **pool_options,
     )
     SessionLocal = sessionmaker(bind=engine, expire_on_commit=False)
 else:
     # Use async engine for app
     engine = create_async_engine(
         database_url,
-        poolclass=QueuePool,
-        pool_size=20,
-        max_overflow=30,
-        pool_pre_ping=True,
-        pool_recycle=300,
+        poolclass=InstrumentedPool,
+        **pool_options,
     )
     AsyncSessionLocal = async_sessionmaker(
         bind=engine,
         class_=AsyncSession,
         expire_on_commit=False
     )
+    pool_monitor = PoolMonitor(engine)
+    if settings.query_stats_enabled or settings.slow_query_ms > 0:
+        instrument_engine(engine.sync_engine)
+
+    # Read replica for get_read_db (see app.database.replica). Its
+    # transactions are read only, like a real replica's
+    read_engine = ReadSessionLocal = read_pool_monitor = None
+    if settings.read_replica_url:
+        read_engine = create_async_engine(
+            settings.read_replica_url,
+            poolclass=ReplicaPool,
+            connect_args={"server_settings": {"default_transaction_read_only": "on"}},
+            **pool_options,
+        )
+        ReadSessionLocal = async_sessionmaker(
+            bind=read_engine,
+            class_=AsyncSession,
+            expire_on_commit=False
+        )
+        read_pool_monitor = PoolMonitor(read_engine)
+        if settings.query_stats_enabled or settings.slow_query_ms > 0:
+            instrument_engine(read_engine.sync_engine)
 
 
 class Base(DeclarativeBase):
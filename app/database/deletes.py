@@ -0,0 +1,101 @@
+"""Chunked background deletes for users and conversations with long histories
+
+A single DELETE of a heavy user cascades through every conversation, message
+and entity in one transaction. A delete job removes the messages in batches
+of `delete_batch_size` instead, each batch in its own short transaction
+(entities go with them through ON DELETE CASCADE), then deletes the parent
+row. Job progress is kept in memory, so it is only visible from the worker
+that started the job.
+"""
+import asyncio
+import uuid
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Optional, Set
+from cachetools import TTLCache
+from sqlalchemy import delete, func, select
+from app.core.archive import lock_archived, remove_archives
+from app.core.config import settings
+from app.database.database import AsyncSessionLocal
+from app.database.query_stats import background_context
+from app.models import Conversation, Message, User
+from app.schemas.job import DeleteJob
+
+# Finished jobs stay queryable for an hour
+_jobs = TTLCache(maxsize=1000, ttl=3600)
+# Strong references so running jobs are not garbage collected
+_tasks: Set[asyncio.Task] = set()
+
+TARGETS = {"user": User, "conversation": Conversation}
+
+
+def _conversations_of(target: str, target_id: int):
+    if target == "user":
+        return Conversation.user_id == target_id
+    return Conversation.id == target_id
+
+
+def _messages_of(target: str, target_id: int):
+    if target == "user":
+        return Message.conversation_id.in_(
+            select(Conversation.id).where(Conversation.user_id == target_id)
+        )
+    return Message.conversation_id == target_id
+
+
+async def _run(job: DeleteJob, on_complete: Optional[Callable[[], Awaitable]]):
+    criteria = _messages_of(job.target, job.target_id)
+    model = TARGETS[job.target]
+    job.status = "running"
+    try:
+        async with AsyncSessionLocal() as session:
+            job.total_messages = await session.scalar(
+                select(func.count()).select_from(Message).where(criteria))
+
+            batch = (
+                select(Message.id).where(criteria)
+                .limit(settings.delete_batch_size).scalar_subquery()
+            )
+            while True:
+                result = await session.execute(
+                    delete(Message).where(Message.id.in_(batch)))
+                await session.commit()
+                if not result.rowcount:
+                    break
+                job.deleted_messages += result.rowcount
+
+            # Only the conversation rows (if any) are left to cascade
+            archived = await lock_archived(session, _conversations_of(job.target, job.target_id))
+            await session.execute(delete(model).where(model.id == job.target_id))
+            await session.commit()
+        await remove_archives(archived)
+
+        if on_complete is not None:
+            await on_complete()
+        job.status = "completed"
+    except Exception as exc:
+        job.status = "failed"
+        job.error = str(exc)
+    job.finished_at = datetime.now(timezone.utc)
+
+
+def start_delete_job(
+    target: str,
+    target_id: int,
+    on_complete: Optional[Callable[[], Awaitable]] = None,
+) -> DeleteJob:
+    """Start deleting a user or conversation in the background and return its job"""
+    job = DeleteJob(
+        id=uuid.uuid4().hex,
+        target=target,
+        target_id=target_id,
+        created_at=datetime.now(timezone.utc),
+    )
+    _jobs[job.id] = job
+    task = asyncio.create_task(_run(job, on_complete), context=background_context())
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return job
+
+
+def get_delete_job(job_id: str) -> Optional[DeleteJob]:
+    return _jobs.get(job_id)
@@ -0,0 +1,165 @@
+"""Connection pool instrumentation, warmup and liveness checks
+
+The app engines' pools record how long checkouts wait for a connection, how
+many give up after DB_POOL_TIMEOUT, and how many connections are checked out,
+idle and in overflow, labelled with the pool (primary or replica). GET
+/health/pool reports the same per worker process, next to the server's
+connection limit, to size pools across uvicorn workers.
+
+Connections are not pinged on every checkout. PoolMonitor opens
+DB_POOL_WARMUP of them at startup and pings idle ones every
+DB_POOL_LIVENESS_SECONDS; a failed ping invalidates the pool, so connections
+broken by a server restart are replaced on their next checkout.
+"""
+import asyncio
+import logging
+import time
+from contextlib import AsyncExitStack
+from typing import Optional
+
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.core.config import settings
+from app.core.metrics import Counter, Gauge, Histogram
+from app.database.query_stats import record_pool_wait
+
+logger = logging.getLogger(__name__)
+
+DB_POOL_WAIT = Histogram(
+    "db_pool_wait_seconds",
+    "Time to check out a connection, including opening a new one",
+    ("pool",),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, 30.0),
+)
+DB_POOL_TIMEOUTS = Counter(
+    "db_pool_timeouts_total",
+    "Checkouts that gave up after DB_POOL_TIMEOUT seconds",
+    ("pool",),
+)
+DB_POOL_CONNECTIONS = Gauge(
+    "db_pool_connections",
+    "Pooled connections by state (checked_out, idle or overflow)",
+    ("pool", "state"),
+)
+DB_POOL_LIVENESS_FAILURES = Counter(
+    "db_pool_liveness_failures_total",
+    "Idle connections that failed a liveness ping",
+    ("pool",),
+)
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that feeds the db_pool_* metrics"""
+
+    name = "primary"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            DB_POOL_TIMEOUTS.inc(pool=self.name)
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            DB_POOL_WAIT.observe(waited, pool=self.name)
+            record_pool_wait(waited)
+            self._observe()
+
+    def _do_return_conn(self, record):
+        super()._do_return_conn(record)
+        self._observe()
+
+    def _observe(self):
+        DB_POOL_CONNECTIONS.set(self.checkedout(), pool=self.name, state="checked_out")
+        DB_POOL_CONNECTIONS.set(self.checkedin(), pool=self.name, state="idle")
+        DB_POOL_CONNECTIONS.set(max(self.overflow(), 0), pool=self.name, state="overflow")
+
+
+class ReplicaPool(InstrumentedPool):
+    """The read replica's pool (see app.database.replica)"""
+
+    name = "replica"
+
+
+def pool_status(pool: InstrumentedPool) -> dict:
+    """Current connections and lifetime checkout stats of this process's pool"""
+    checkouts = DB_POOL_WAIT.count(pool=pool.name)
+    waited = DB_POOL_WAIT.sum(pool=pool.name)
+    return {
+        "size": pool.size(),
+        "max_overflow": settings.db_max_overflow,
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "checkouts": int(checkouts),
+        "mean_wait_ms": round(waited / checkouts * 1000, 3) if checkouts else 0.0,
+        "timeouts": int(DB_POOL_TIMEOUTS.value(pool=pool.name)),
+        "liveness_failures": int(DB_POOL_LIVENESS_FAILURES.value(pool=pool.name)),
+    }
+
+
+class PoolMonitor:
+    """Warms the pool up at startup and pings its idle connections"""
+
+    def __init__(self, engine: AsyncEngine):
+        self._engine = engine
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        await self.warm_up()
+        if settings.db_pool_liveness_seconds > 0:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def warm_up(self) -> int:
+        """Open up to DB_POOL_WARMUP connections and leave them idle in the pool
+
+        Connections are opened one at a time: the first runs the dialect's
+        one-time initialization, which must not run concurrently.
+        """
+        opened = 0
+        try:
+            async with AsyncExitStack() as stack:
+                for _ in range(min(settings.db_pool_warmup, settings.db_pool_size)):
+                    await stack.enter_async_context(self._engine.connect())
+                    opened += 1
+        except Exception:
+            logger.exception("Connection pool warmup stopped after %d connections", opened)
+        return opened
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(settings.db_pool_liveness_seconds)
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Connection pool liveness check failed")
+
+    async def run_once(self) -> int:
+        """Ping each connection idle at the start; returns how many failed
+
+        The pool hands out connections first in, first out, so checking out
+        as many as are idle visits each of them once.
+        """
+        failed = 0
+        for _ in range(self._engine.pool.checkedin()):
+            try:
+                async with self._engine.connect() as conn:
+                    await conn.execute(text("SELECT 1"))
+            except exc.DBAPIError as error:
+                if not error.connection_invalidated:
+                    raise
+                # SQLAlchemy has already invalidated the rest of the pool
+                failed += 1
+                DB_POOL_LIVENESS_FAILURES.inc(pool=self._engine.pool.name)
+                logger.warning("Dropped a dead pooled connection: %s", error.orig)
+                break
+        return failed
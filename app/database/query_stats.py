@@ -0,0 +1,196 @@
+"""Per-request SQL statement counts, database time and slow-query log
+
+With QUERY_STATS_ENABLED, QueryStatsMiddleware gives every HTTP request a
+RequestQueries record, and engine event hooks fill it in: how many
+statements ran, the time spent in them, the durations of the
+QUERY_STATS_SLOWEST slowest, and the time spent waiting for a pooled
+connection. The response carries them in a Server-Timing header, which
+browser dev tools show per request:
+
+    Server-Timing: db;dur=41.2;desc="7 queries", db-pool;dur=0.3,
+        db-slow1;dur=30.8, db-slow2;dur=4.1
+
+The header holds counts and durations only; statement text stays in the
+server-side slow-query log.
+
+They also feed the db_request_* histograms, labelled with the method and
+route template, so an N+1 shows up as a route whose statement count grows
+with the data. A streamed response's header covers the statements run
+before its first byte; the metrics cover the whole request.
+
+Statements slower than SLOW_QUERY_MS are logged with the route they ran
+for, or "background" for workers, whether or not the middleware is on.
+Parameters are never logged. Tasks that outlive a request are started in
+background_context(), so their statements are not counted against it.
+Times are wall-clock, so they include time the event loop spent on other
+requests while a statement was in flight.
+"""
+import contextvars
+import heapq
+import logging
+import time
+from typing import List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core.config import settings
+from app.core.metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+DB_REQUEST_QUERIES = Histogram(
+    "db_request_queries",
+    "SQL statements per request, by route",
+    ("route",),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 250),
+)
+DB_REQUEST_SECONDS = Histogram(
+    "db_request_seconds",
+    "Time per request spent in SQL statements, by route",
+    ("route",),
+)
+DB_REQUEST_POOL_WAIT = Histogram(
+    "db_request_pool_wait_seconds",
+    "Time per request spent waiting for pooled connections, by route",
+    ("route",),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0, 30.0),
+)
+DB_SLOW_QUERIES = Counter(
+    "db_slow_queries_total",
+    "Statements slower than SLOW_QUERY_MS, by route (or background)",
+    ("route",),
+)
+
+# Statement text in the slow-query log
+LOG_STATEMENT_CHARS = 1000
+
+_STARTED = "query_stats_started"
+
+
+def _shorten(statement: str, limit: int) -> str:
+    statement = " ".join(statement.split())
+    return statement if len(statement) <= limit else statement[:limit - 3] + "..."
+
+
+class RequestQueries:
+    """The statements of one request, as the engine hooks saw them"""
+
+    def __init__(self, scope: dict):
+        # Routing fills in scope["route"] once the request reaches the router
+        self._scope = scope
+        self.count = 0
+        self.seconds = 0.0
+        self.pool_wait = 0.0
+        # Min-heap of the QUERY_STATS_SLOWEST longest statement durations
+        self.slowest: List[float] = []
+
+    @property
+    def route(self) -> str:
+        route = self._scope.get("route")
+        path = getattr(route, "path", None) or "unmatched"
+        return f"{self._scope['method']} {path}"
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        if settings.query_stats_slowest > 0:
+            if len(self.slowest) < settings.query_stats_slowest:
+                heapq.heappush(self.slowest, seconds)
+            elif seconds > self.slowest[0]:
+                heapq.heapreplace(self.slowest, seconds)
+
+    def server_timing(self) -> str:
+        parts = [f'db;dur={self.seconds * 1000:.1f};desc="{self.count} queries"',
+                 f"db-pool;dur={self.pool_wait * 1000:.1f}"]
+        for rank, seconds in enumerate(sorted(self.slowest, reverse=True), 1):
+            parts.append(f"db-slow{rank};dur={seconds * 1000:.1f}")
+        return ", ".join(parts)
+
+    def observe(self):
+        route = self.route
+        DB_REQUEST_QUERIES.observe(self.count, route=route)
+        DB_REQUEST_SECONDS.observe(self.seconds, route=route)
+        DB_REQUEST_POOL_WAIT.observe(self.pool_wait, route=route)
+
+
+_current: contextvars.ContextVar[Optional[RequestQueries]] = contextvars.ContextVar(
+    "request_queries", default=None)
+
+
+def background_context() -> contextvars.Context:
+    """A copy of the current context outside any request, for tasks that outlive it
+
+    Pass it as create_task(..., context=...).
+    """
+    context = contextvars.copy_context()
+    context.run(_current.set, None)
+    return context
+
+
+def record_pool_wait(seconds: float):
+    """Called by the instrumented pools after every checkout"""
+    queries = _current.get()
+    if queries is not None:
+        queries.pool_wait += seconds
+
+
+def _record(statement: str, seconds: float):
+    queries = _current.get()
+    if queries is not None:
+        queries.add(seconds)
+    if settings.slow_query_ms > 0 and seconds * 1000 >= settings.slow_query_ms:
+        route = queries.route if queries is not None else "background"
+        DB_SLOW_QUERIES.inc(route=route)
+        logger.warning("Slow query (%.1f ms) in %s: %s", seconds * 1000, route,
+                       _shorten(statement, LOG_STATEMENT_CHARS))
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault(_STARTED, []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _record(statement, time.perf_counter() - conn.info[_STARTED].pop())
+
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute
+    started = context.connection.info.get(_STARTED) if context.connection is not None else None
+    if started and context.statement is not None:
+        _record(context.statement, time.perf_counter() - started.pop())
+
+
+def instrument_engine(engine: Engine):
+    """Time every statement of `engine` (the sync_engine of an async one)"""
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+class QueryStatsMiddleware:
+    """Records each request's statements and reports them in Server-Timing"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        queries = RequestQueries(scope)
+        token = _current.set(queries)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [
+                    *message.get("headers", []),
+                    (b"server-timing", queries.server_timing().encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            queries.observe()
@@ -0,0 +1,171 @@
+"""Read/write routing between the primary and a read replica
+
+Read-only routes take their session from get_read_db instead of get_db. With
+READ_REPLICA_URL set it is bound to the replica, unless:
+
+- the client wrote within READ_YOUR_WRITES_SECONDS, so it sees its own
+  writes. ReadYourWritesMiddleware marks such clients with a cookie on every
+  POST, PUT, PATCH or DELETE, which works across uvicorn workers.
+- ReplicaMonitor last found the replica down or more than
+  READ_REPLICA_MAX_LAG_SECONDS behind. It checks every
+  READ_REPLICA_CHECK_SECONDS.
+- the replica refuses a connection, which also marks it down until the next
+  check.
+
+Transactions on the replica engine are read only. A stand-in that points
+READ_REPLICA_URL at the primary therefore rejects writes, the same way a
+real replica would.
+
+Routes served from the response cache keep reading from the primary. Their
+misses follow writes that invalidated them, and an entry filled from a
+lagging replica would stay stale until its TTL.
+"""
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from fastapi import Request
+from sqlalchemy import exc, text
+
+from app.core.config import settings
+from app.core.metrics import Counter, Gauge
+from app.database.database import AsyncSessionLocal, ReadSessionLocal, read_engine
+
+logger = logging.getLogger(__name__)
+
+DB_READ_SESSIONS = Counter(
+    "db_read_sessions_total",
+    "Read-only sessions by where they went (replica, or primary_sticky, "
+    "primary_lagging or primary_down)",
+    ("route",),
+)
+DB_REPLICA_UP = Gauge("db_replica_up", "Whether the last replica check succeeded")
+DB_REPLICA_LAG = Gauge("db_replica_lag_seconds", "Replication lag at the last replica check")
+
+STICKY_COOKIE = "read_primary_until"
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+# Zero once the replica has replayed everything it received; otherwise the
+# age of the last transaction replayed. A server that is not in recovery is
+# a single-instance stand-in, always current.
+REPLICA_LAG = text("""
+SELECT CASE WHEN NOT pg_is_in_recovery()
+              OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp())
+       END
+""")
+
+
+class ReplicaMonitor:
+    """Checks whether the replica is up and how far behind the primary it is"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        # Seconds behind the primary, or None while down or not yet checked
+        self.lag: Optional[float] = None
+
+    @property
+    def available(self) -> bool:
+        return self.lag is not None and self.lag <= settings.read_replica_max_lag_seconds
+
+    async def start(self):
+        if read_engine is not None:
+            await self.run_once()
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(settings.read_replica_check_seconds)
+            await self.run_once()
+
+    async def run_once(self) -> Optional[float]:
+        """Measure the replica's lag; returns it, or None if it is down"""
+        try:
+            async with read_engine.connect() as conn:
+                lag = await conn.scalar(REPLICA_LAG)
+        except Exception as error:
+            if self.lag is not None:
+                logger.warning("Read replica is down, reading from the primary: %s", error)
+            self.mark_down()
+            return None
+        self.lag = float(lag) if lag is not None else None
+        DB_REPLICA_UP.set(1)
+        DB_REPLICA_LAG.set(self.lag if self.lag is not None else 0)
+        return self.lag
+
+    def mark_down(self):
+        self.lag = None
+        DB_REPLICA_UP.set(0)
+
+    def status(self) -> dict:
+        return {"configured": read_engine is not None, "available": self.available,
+                "lag_seconds": self.lag}
+
+
+replica_monitor = ReplicaMonitor()
+
+
+def _sticky(request: Request) -> bool:
+    try:
+        return float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+async def _replica_session(request: Request):
+    """A session with a replica connection, or None to use the primary"""
+    if _sticky(request):
+        DB_READ_SESSIONS.inc(route="primary_sticky")
+        return None
+    if not replica_monitor.available:
+        route = "primary_down" if replica_monitor.lag is None else "primary_lagging"
+        DB_READ_SESSIONS.inc(route=route)
+        return None
+    session = ReadSessionLocal()
+    try:
+        await session.connection()
+    except (exc.DBAPIError, OSError) as error:
+        await session.close()
+        logger.warning("Read replica refused a connection, reading from the primary: %s", error)
+        replica_monitor.mark_down()
+        DB_READ_SESSIONS.inc(route="primary_down")
+        return None
+    DB_READ_SESSIONS.inc(route="replica")
+    return session
+
+
+# Dependency to get a read-only database session
+async def get_read_db(request: Request):
+    replica = await _replica_session(request) if read_engine is not None else None
+    async with replica or AsyncSessionLocal() as session:
+        yield session
+
+
+class ReadYourWritesMiddleware:
+    """Sends a client's reads to the primary for a while after each write"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or read_engine is None
+                or scope["method"] not in WRITE_METHODS):
+            return await self.app(scope, receive, send)
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start":
+                until = time.time() + settings.read_your_writes_seconds
+                cookie = (f"{STICKY_COOKIE}={until:.3f}; Path=/; HttpOnly; SameSite=Lax; "
+                          f"Max-Age={max(int(settings.read_your_writes_seconds), 1)}")
+                message = {**message, "headers": [*message.get("headers", []),
+                                                  (b"set-cookie", cookie.encode())]}
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
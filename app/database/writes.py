@@ -0,0 +1,57 @@
+"""Single-statement write helpers
+
+Writes go through INSERT/UPDATE/DELETE ... RETURNING so server-generated values
+(id, created_at, updated_at) come back with the write itself, instead of a
+commit followed by refresh() and a re-select. Existence checks on parent rows
+are left to the foreign keys; callers map the IntegrityError with
+integrity_code().
+"""
+from typing import Any, Dict, Optional, Sequence
+from sqlalchemy import delete, insert, update
+from sqlalchemy.engine import Row
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+FOREIGN_KEY_VIOLATION = "23503"
+UNIQUE_VIOLATION = "23505"
+
+
+def integrity_code(exc: IntegrityError) -> Optional[str]:
+    """Return the Postgres SQLSTATE of an IntegrityError (asyncpg or psycopg2)"""
+    return getattr(exc.orig, "sqlstate", None) or getattr(exc.orig, "pgcode", None)
+
+
+async def insert_returning(db: AsyncSession, model, values: Dict[str, Any], *extra,
+                           columns: Optional[Sequence] = None) -> Row:
+    """INSERT one row and return it, server defaults included
+
+    `extra` columns or scalar subqueries are returned alongside the row's
+    `columns`, all of the table's by default.
+    """
+    table = model.__table__
+    result = await db.execute(
+        insert(table).values(**values).returning(*(columns or table.c), *extra))
+    return result.one()
+
+
+async def update_returning(db: AsyncSession, model, id: int, values: Dict[str, Any],
+                           columns: Optional[Sequence] = None) -> Optional[Row]:
+    """UPDATE a row by primary key and return it, or None if it does not exist"""
+    table = model.__table__
+    result = await db.execute(
+        update(table).where(table.c.id == id).values(**values)
+        .returning(*(columns or table.c))
+    )
+    return result.one_or_none()
+
+
+async def delete_returning(db: AsyncSession, model, id: int) -> Optional[Row]:
+    """DELETE a row by primary key and return it, or None if it does not exist
+
+    Children go with it through ON DELETE CASCADE; nothing is loaded first.
+    """
+    table = model.__table__
+    result = await db.execute(
+        delete(table).where(table.c.id == id).returning(*table.c)
+    )
+    return result.one_or_none()
@@ -1,7 +1,20 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import text
+from app.core.broker import broker
+from app.core.chat import chat_pipeline
+from app.core.extraction import extraction_worker
+from app.core.partitions import partition_worker
+from app.core.rollups import rollup_worker
 from app.core.config import settings
-from app.api import users, conversations, messages, entities, auth
+from app.core.hash_pool import shutdown_hash_pool
+from app.core.metrics import render_metrics
+from app.database.database import engine, pool_monitor, read_engine, read_pool_monitor
+from app.database.pool import pool_status
+from app.database.query_stats import QueryStatsMiddleware
+from app.database.replica import ReadYourWritesMiddleware, replica_monitor
+from app.api import users, conversations, messages, entities, analytics, auth, jobs
 
 app = FastAPI(
     title=settings.app_name,
@@ -18,12 +31,18 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(ReadYourWritesMiddleware)
+# Outermost, so the header and metrics cover the whole request
+if settings.query_stats_enabled:
+    app.add_middleware(QueryStatsMiddleware)
 
 # Include API routes
 app.include_router(users.router, prefix=settings.api_v1_prefix)
 app.include_router(conversations.router, prefix=settings.api_v1_prefix)
 app.include_router(messages.router, prefix=settings.api_v1_prefix)
 app.include_router(entities.router, prefix=settings.api_v1_prefix)
+app.include_router(analytics.router, prefix=settings.api_v1_prefix)
+app.include_router(jobs.router, prefix=settings.api_v1_prefix)
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
 
 
@@ -36,7 +55,8 @@ async def root():
             f"{settings.api_v1_prefix}/users",
             f"{settings.api_v1_prefix}/conversations",
             f"{settings.api_v1_prefix}/messages",
-            f"{settings.api_v1_prefix}/entities"
+            f"{settings.api_v1_prefix}/entities",
+            f"{settings.api_v1_prefix}/analytics"
         ]
     }
 
@@ -46,6 +66,57 @@ async def health_check():
     return {"status": "healthy", "service": "tourism-chatbot-backend"}
 
 
+@app.get(f"{settings.api_v1_prefix}/health/pool")
+async def pool_health():
+    """Connection pool usage of this worker process, and the server's connection limit"""
+    async with engine.connect() as conn:
+        server = (await conn.execute(text(
+            "SELECT current_setting('max_connections')::int, "
+            "(SELECT count(*) FROM pg_stat_activity WHERE datname = current_database())"
+        ))).one()
+    return {
+        "pool": pool_status(engine.pool),
+        "server": {"max_connections": server[0], "connections": server[1]},
+        "replica": {
+            **replica_monitor.status(),
+            "pool": pool_status(read_engine.pool) if read_engine is not None else None,
+        },
+    }
+
+
+@app.get(f"{settings.api_v1_prefix}/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics for this worker process"""
+    return render_metrics()
+
+
+@app.on_event("startup")
+async def startup():
+    # Before anything else connects: see PoolMonitor.warm_up()
+    await pool_monitor.start()
+    if read_pool_monitor is not None:
+        await read_pool_monitor.start()
+    await replica_monitor.start()
+    await partition_worker.start()
+    await broker.start()
+    await extraction_worker.start()
+    await rollup_worker.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await extraction_worker.stop()
+    await rollup_worker.stop()
+    await partition_worker.stop()
+    await chat_pipeline.close()
+    await broker.stop()
+    await replica_monitor.stop()
+    if read_pool_monitor is not None:
+        await read_pool_monitor.stop()
+    await pool_monitor.stop()
+    shutdown_hash_pool()
+
+
 @app.get(f"{settings.api_v1_prefix}/seed")
 async def seed_database():
     """Development endpoint to reseed the database"""
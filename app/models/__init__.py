@@ -1,6 +1,14 @@
 from .user import User
 from .conversation import Conversation
 from .message import Message
+from .dictionary import EntityType, EntityValue, EntityAlias
 from .entity import Entity
+from .outbox import ExtractionOutbox
+from .rollup import EntityRollup, StaleRollupBucket
+from .archive import ArchivedMessage
+from . import partition  # noqa: F401  partition DDL for create_all
 
-__all__ = ["User", "Conversation", "Message", "Entity"]
\ No newline at end of file
+__all__ = [
+    "User", "Conversation", "Message", "EntityType", "EntityValue", "EntityAlias",
+    "Entity", "ExtractionOutbox", "EntityRollup", "StaleRollupBucket", "ArchivedMessage"
+]
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, ForeignKey
+from app.database.database import Base
+
+
+class ArchivedMessage(Base):
+    """Which archived conversation a message is in (see app.core.archive)
+
+    Lets a message be looked up by id while it is in cold storage, so routes
+    given only a message id can rehydrate its conversation.
+    """
+    __tablename__ = "archived_messages"
+
+    message_id = Column(Integer, primary_key=True, autoincrement=False)
+    conversation_id = Column(Integer, ForeignKey(
+        "conversations.id", ondelete="CASCADE"), nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<ArchivedMessage(message_id={self.message_id}, conversation_id={self.conversation_id})>"
@@ -1,24 +1,38 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Index, Integer, String, DateTime, ForeignKey, Boolean, Text
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, relationship
 from app.database.database import Base
 
 
 class Conversation(Base):
     __tablename__ = "conversations"
+    __table_args__ = (
+        Index("ix_conversations_created_at_id", "created_at", "id"),
+        Index("ix_conversations_user_id_created_at_id",
+              "user_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"),
+                     nullable=False)
     title = Column(String, nullable=False)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True),
                         onupdate=func.now(), server_default=func.now())
+    # Rolling summary of the messages up to summary_message_id, for building
+    # prompts (see app.core.context); only loaded when asked for
+    summary = deferred(Column(Text, nullable=True), raiseload=True)
+    summary_message_id = Column(Integer, nullable=True)
+    # Set while the messages live in cold storage (see app.core.archive)
+    archived_at = Column(DateTime(timezone=True), nullable=True)
 
     # Relationships
-    user = relationship("User", back_populates="conversations")
+    user = relationship("User", back_populates="conversations",
+                        lazy="raise_on_sql")
     messages = relationship(
-        "Message", back_populates="conversation", cascade="all, delete-orphan")
+        "Message", back_populates="conversation", cascade="all, delete-orphan",
+        passive_deletes=True, lazy="raise_on_sql")
 
     def __repr__(self):
         return f"<Conversation(id={self.id}, title='{self.title}', user_id={self.user_id})>"
@@ -0,0 +1,45 @@
+from sqlalchemy import Column, ForeignKey, Integer, String, UniqueConstraint
+from app.database.database import Base
+
+
+class EntityType(Base):
+    """An interned entity type; entities refer to it by id (see app.core.dictionary)"""
+    __tablename__ = "entity_types"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False, unique=True)  # normalized, e.g. "location"
+
+    def __repr__(self):
+        return f"<EntityType(id={self.id}, name='{self.name}')>"
+
+
+class EntityValue(Base):
+    """An interned entity value of one type
+
+    `key` is the normalized form values are looked up by; `value` is the
+    spelling the API returns.
+    """
+    __tablename__ = "entity_values"
+    __table_args__ = (
+        UniqueConstraint("type_id", "key", name="uq_entity_values_type_id_key"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    type_id = Column(Integer, ForeignKey("entity_types.id"), nullable=False)
+    key = Column(String, nullable=False)
+    value = Column(String, nullable=False)
+
+    def __repr__(self):
+        return f"<EntityValue(id={self.id}, type_id={self.type_id}, value='{self.value}')>"
+
+
+class EntityAlias(Base):
+    """Another spelling of a value, e.g. "nyc" for "New York", interned as that value"""
+    __tablename__ = "entity_aliases"
+
+    type_id = Column(Integer, ForeignKey("entity_types.id"), primary_key=True)
+    key = Column(String, primary_key=True)
+    value_id = Column(Integer, ForeignKey("entity_values.id"), nullable=False)
+
+    def __repr__(self):
+        return f"<EntityAlias(type_id={self.type_id}, key='{self.key}', value_id={self.value_id})>"
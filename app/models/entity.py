@@ -1,25 +1,63 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import (
+    Column, ForeignKeyConstraint, Index, Integer, String, DateTime, ForeignKey,
+    literal_column, select
+)
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import column_property, relationship
 from app.database.database import Base
+from .dictionary import EntityType, EntityValue
 
 class Entity(Base):
     __tablename__ = "entities"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    message_id = Column(Integer, ForeignKey("messages.id"), nullable=False)
-    entity_type = Column(String, nullable=False)  # e.g., "location", "activity", "time", "budget"
-    entity_value = Column(String, nullable=False)
+    __table_args__ = (
+        Index("ix_entities_created_at_id", "created_at", "id"),
+        Index("ix_entities_message_id_id", "message_id", "id"),
+        Index("ix_entities_type_id_value_id", "type_id", "value_id"),
+        # Partitioned messages are keyed by (id, created_at)
+        ForeignKeyConstraint(["message_id", "message_created_at"],
+                             ["messages.id", "messages.created_at"], ondelete="CASCADE"),
+        # Monthly partitions (see app.models.partition)
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    message_id = Column(Integer, nullable=False)
+    message_created_at = Column(DateTime(timezone=True), nullable=False)
+    # Interned in entity_types / entity_values (see app.core.dictionary)
+    type_id = Column(Integer, ForeignKey("entity_types.id"), nullable=False)
+    value_id = Column(Integer, ForeignKey("entity_values.id"), nullable=False)
     confidence_score = Column(Integer, default=100)  # 0-100
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), primary_key=True,
+                        server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
-    
+
+    # The strings the API returns, e.g. "location" and "Paris", looked up by
+    # primary key. Filter on type_id / value_id instead of these.
+    entity_type = column_property(
+        select(EntityType.name).where(EntityType.id == type_id)
+        .correlate_except(EntityType).scalar_subquery())
+    entity_value = column_property(
+        select(EntityValue.value).where(EntityValue.id == value_id)
+        .correlate_except(EntityValue).scalar_subquery())
+
     # Relationships
-    message = relationship("Message", back_populates="entities")
-    
+    message = relationship("Message", back_populates="entities", lazy="raise_on_sql")
+
     def __repr__(self):
-        return f"<Entity(id={self.id}, type='{self.entity_type}', value='{self.entity_value}')>"
+        return f"<Entity(id={self.id}, type_id={self.type_id}, value_id={self.value_id})>"
+
 
-# Add relationship to Message model
-from .message import Message
-Message.entities = relationship("Entity", back_populates="message", cascade="all, delete-orphan")
\ No newline at end of file
+# Columns of an entity as the API returns it, for Core selects and RETURNING.
+# SQLAlchemy does not correlate subqueries in INSERT ... RETURNING with the
+# inserted table, so the lookups are spelled out.
+ENTITY_COLUMNS = (
+    Entity.__table__.c.id,
+    Entity.__table__.c.message_id,
+    literal_column("(SELECT name FROM entity_types WHERE id = entities.type_id)",
+                   String).label("entity_type"),
+    literal_column("(SELECT value FROM entity_values WHERE id = entities.value_id)",
+                   String).label("entity_value"),
+    Entity.__table__.c.confidence_score,
+    Entity.__table__.c.created_at,
+    Entity.__table__.c.updated_at,
+)
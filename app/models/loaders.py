@@ -0,0 +1,24 @@
+"""Loader options routes pass to their queries to choose which relations are fetched
+
+Every relationship is declared with lazy="raise_on_sql", so a query loads
+nothing beyond its own row unless it asks for one of these.
+"""
+from sqlalchemy.orm import selectinload
+from .user import User
+from .conversation import Conversation
+from .message import Message
+
+USER_CONVERSATIONS = selectinload(User.conversations)
+
+USER_TREE = (
+    selectinload(User.conversations)
+    .selectinload(Conversation.messages)
+    .selectinload(Message.entities)
+)
+
+CONVERSATION_MESSAGES = (
+    selectinload(Conversation.messages)
+    .selectinload(Message.entities)
+)
+
+MESSAGE_ENTITIES = selectinload(Message.entities)
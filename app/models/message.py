@@ -1,31 +1,55 @@
-from .conversation import Conversation
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text
+from sqlalchemy import (
+    Column, Computed, DDL, Index, Integer, String, ForeignKey, DateTime, Text, event
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, relationship
 from app.database.database import Base
 
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        Index("ix_messages_created_at_id", "created_at", "id"),
+        Index("ix_messages_conversation_id_created_at_id",
+              "conversation_id", "created_at", "id"),
+        Index("ix_messages_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_messages_content_trgm", "content", postgresql_using="gin",
+              postgresql_ops={"content": "gin_trgm_ops"}),
+        # Monthly partitions (see app.models.partition), so the primary key
+        # includes created_at
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True)
     conversation_id = Column(Integer, ForeignKey(
-        "conversations.id"), nullable=False)
+        "conversations.id", ondelete="CASCADE"), nullable=False)
     sender_type = Column(String, nullable=False)  # Changed from Enum to String
     content = Column(Text, nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), primary_key=True,
+                        server_default=func.now())
     updated_at = Column(DateTime(timezone=True),
                         onupdate=func.now(), server_default=func.now())
+    # Full-text search document, maintained by Postgres; see app.core.search
+    search_vector = deferred(Column(
+        TSVECTOR, Computed("to_tsvector('english', content)", persisted=True)),
+        raiseload=True)
 
     # Relationships
-    conversation = relationship("Conversation", back_populates="messages")
+    conversation = relationship("Conversation", back_populates="messages",
+                                lazy="raise_on_sql")
     entities = relationship(
-        "Entity", back_populates="message", cascade="all, delete-orphan")
+        "Entity", back_populates="message", cascade="all, delete-orphan",
+        passive_deletes=True, lazy="raise_on_sql")
 
     def __repr__(self):
         return f"<Message(id={self.id}, type='{self.sender_type}', content='{self.content[:50]}...')>"
 
 
-# relationship to Conversation model (fk)
-Conversation.messages = relationship(
-    "Message", back_populates="conversation", cascade="all, delete-orphan")
+# The columns reads, RETURNING clauses and events carry; search_vector stays in the database
+MESSAGE_COLUMNS = tuple(
+    column for column in Message.__table__.c if column.name != "search_vector")
+
+# ix_messages_content_trgm needs the pg_trgm operator classes
+event.listen(Message.__table__, "before_create",
+             DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
@@ -0,0 +1,35 @@
+from sqlalchemy import Column, ForeignKeyConstraint, Index, Integer, DateTime, Text, text
+from sqlalchemy.sql import func
+from app.database.database import Base
+
+
+class ExtractionOutbox(Base):
+    """Messages waiting for entity extraction (see app.core.extraction)
+
+    Rows are written in the same transaction as their message and deleted in
+    the same transaction as the extracted entities, so a message is neither
+    lost nor extracted twice when a worker stops mid-batch.
+    """
+    __tablename__ = "extraction_outbox"
+    __table_args__ = (
+        # The claim query: due rows that have not failed for good
+        Index("ix_extraction_outbox_available_at_id", "available_at", "id",
+              postgresql_where=text("failed_at IS NULL")),
+        ForeignKeyConstraint(["message_id", "message_created_at"],
+                             ["messages.id", "messages.created_at"], ondelete="CASCADE"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    message_id = Column(Integer, nullable=False, index=True)
+    message_created_at = Column(DateTime(timezone=True), nullable=False)
+    attempts = Column(Integer, nullable=False, server_default="0")
+    # Not claimable before this time: set to the lease expiry when claimed,
+    # and to the retry time after a failure
+    available_at = Column(DateTime(timezone=True), nullable=False,
+                          server_default=func.now())
+    failed_at = Column(DateTime(timezone=True))
+    last_error = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"<ExtractionOutbox(id={self.id}, message_id={self.message_id}, attempts={self.attempts})>"
@@ -0,0 +1,50 @@
+"""Monthly range partitions of messages and entities on created_at
+
+Each partitioned table has one partition per UTC calendar month, named like
+messages_y2026m10, and a DEFAULT partition for rows outside them. The
+partition worker (see app.core.partitions) keeps PARTITION_MONTHS_AHEAD
+months created in advance. The default partition only catches rows with
+unusual timestamps, such as backdated imports.
+"""
+from sqlalchemy import DDL, event
+from app.database.database import Base
+
+PARTITIONED_TABLES = ("messages", "entities")
+
+# Installed by migration b9d4f2e7a1c5; repeated here for create_all.
+# Creates the monthly partitions of `parent` from the month of `first_month`
+# through the month of `last_month` that do not exist yet, and returns how
+# many it created.
+CREATE_MONTHLY_PARTITIONS = """
+CREATE OR REPLACE FUNCTION create_monthly_partitions(parent text, first_month date, last_month date)
+RETURNS integer LANGUAGE plpgsql AS $$
+DECLARE
+    month date := date_trunc('month', first_month);
+    name text;
+    created integer := 0;
+BEGIN
+    WHILE month <= last_month LOOP
+        name := format('%s_y%sm%s', parent, to_char(month, 'YYYY'), to_char(month, 'MM'));
+        IF to_regclass(name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                name, parent,
+                month::timestamp AT TIME ZONE 'UTC',
+                (month + interval '1 month')::timestamp AT TIME ZONE 'UTC');
+            created := created + 1;
+        END IF;
+        month := month + interval '1 month';
+    END LOOP;
+    RETURN created;
+END
+$$
+"""
+
+# DDL() treats % as a format character
+event.listen(Base.metadata, "after_create", DDL(CREATE_MONTHLY_PARTITIONS.replace("%", "%%")))
+for _table in PARTITIONED_TABLES:
+    event.listen(Base.metadata, "after_create", DDL(
+        f"CREATE TABLE IF NOT EXISTS {_table}_default PARTITION OF {_table} DEFAULT"))
+    event.listen(Base.metadata, "after_create", DDL(
+        f"SELECT create_monthly_partitions('{_table}', (now() AT TIME ZONE 'UTC')::date, "
+        f"(now() AT TIME ZONE 'UTC' + interval '3 months')::date)"))
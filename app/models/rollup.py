@@ -0,0 +1,76 @@
+from sqlalchemy import Column, DDL, Date, Index, Integer, event
+from app.database.database import Base
+
+
+class EntityRollup(Base):
+    """Entities per UTC day, type and value (see app.core.rollups)
+
+    type_id and value_id are ids from the entity dictionary, whose rows are
+    never deleted, so they are not declared as foreign keys.
+    """
+    __tablename__ = "entity_rollups"
+    __table_args__ = (
+        # Recomputing a day, and queries across all types
+        Index("ix_entity_rollups_bucket", "bucket"),
+    )
+
+    type_id = Column(Integer, primary_key=True)
+    bucket = Column(Date, primary_key=True)
+    value_id = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False)
+
+    def __repr__(self):
+        return f"<EntityRollup(bucket={self.bucket}, type_id={self.type_id}, value_id={self.value_id}, count={self.count})>"
+
+
+class StaleRollupBucket(Base):
+    """A day whose entities changed since its rollups were last computed
+
+    Written by a statement trigger on entities, one row per statement and day,
+    including deletes cascaded from messages, conversations and users. Rows
+    are only ever inserted by writers, so concurrent writes never wait on
+    each other here.
+    """
+    __tablename__ = "stale_rollup_buckets"
+
+    id = Column(Integer, primary_key=True)
+    bucket = Column(Date, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<StaleRollupBucket(id={self.id}, bucket={self.bucket})>"
+
+
+# Installed by migration a4d8e2c6b9f1; repeated here for create_all
+MARK_STALE_BUCKETS = """
+CREATE OR REPLACE FUNCTION mark_stale_rollup_buckets() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO stale_rollup_buckets (bucket)
+        SELECT DISTINCT (created_at AT TIME ZONE 'UTC')::date FROM new_entities;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO stale_rollup_buckets (bucket)
+        SELECT DISTINCT (created_at AT TIME ZONE 'UTC')::date FROM old_entities;
+    END IF;
+    RETURN NULL;
+END
+$$
+"""
+ROLLUP_TRIGGERS = [
+    "CREATE OR REPLACE TRIGGER entities_rollup_insert AFTER INSERT ON entities "
+    "REFERENCING NEW TABLE AS new_entities "
+    "FOR EACH STATEMENT EXECUTE FUNCTION mark_stale_rollup_buckets()",
+    "CREATE OR REPLACE TRIGGER entities_rollup_update AFTER UPDATE ON entities "
+    "REFERENCING OLD TABLE AS old_entities NEW TABLE AS new_entities "
+    "FOR EACH STATEMENT EXECUTE FUNCTION mark_stale_rollup_buckets()",
+    "CREATE OR REPLACE TRIGGER entities_rollup_delete AFTER DELETE ON entities "
+    "REFERENCING OLD TABLE AS old_entities "
+    "FOR EACH STATEMENT EXECUTE FUNCTION mark_stale_rollup_buckets()",
+]
+
+# The function inserts into stale_rollup_buckets, so install it once every
+# table exists
+event.listen(Base.metadata, "after_create", DDL(MARK_STALE_BUCKETS))
+for _trigger in ROLLUP_TRIGGERS:
+    event.listen(Base.metadata, "after_create", DDL(_trigger))
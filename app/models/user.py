@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean
+from sqlalchemy import Column, Index, Integer, String, DateTime, Boolean
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database.database import Base
@@ -6,6 +6,9 @@ from app.database.database import Base
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        Index("ix_users_created_at_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, unique=True, index=True, nullable=False)
@@ -17,12 +20,11 @@ class User(Base):
     updated_at = Column(DateTime(timezone=True),
                         onupdate=func.now(), server_default=func.now())
 
-    # Relationships
-
-    # Relationships
-    from .conversation import Conversation
+    # Relationships are never loaded implicitly; see app.models.loaders.
+    # Children are removed by ON DELETE CASCADE rather than loaded and deleted
     conversations = relationship(
-        "Conversation", back_populates="user", lazy="selectin")
+        "Conversation", back_populates="user", cascade="all, delete-orphan",
+        passive_deletes=True, lazy="raise_on_sql")
 
     def __repr__(self):
         return f"<User(id={self.id}, username='{self.username}', email='{self.email}')>"
@@ -1,20 +1,39 @@
-from .entity import EntityCreate, EntityUpdate, EntityResponse
-from .message import MessageCreate, MessageUpdate, MessageResponse
-from .user import UserCreate, UserUpdate, UserResponse, UserBasic
+from .entity import (
+    EntityCreate, EntityUpdate, EntityResponse, EntityInline, EntityAliasCreate,
+    EntityAliasResponse
+)
+from .message import (
+    MessageCreate, MessageUpdate, MessageResponse,
+    MessageBulkItem, MessageBulkCreate, MessageBulkResult, MessageBulkResponse,
+    ChatTurnCreate, ChatTurnResponse, MessageSearchHit
+)
+from .user import UserCreate, UserUpdate, UserResponse, UserBasic, UserProjection
 from .conversation import ConversationCreate, ConversationUpdate, ConversationResponse
+from .pagination import CursorPage
+from .job import DeleteJob, ExtractionBacklog, RollupBacklog
+from .analytics import EntityValueCount, EntityTopValues
 
 
 __all__ = [
-    "UserCreate", "UserUpdate", "UserResponse", "UserBasic",
+    "UserCreate", "UserUpdate", "UserResponse", "UserBasic", "UserProjection",
     "ConversationCreate", "ConversationUpdate", "ConversationResponse",
     "MessageCreate", "MessageUpdate", "MessageResponse",
-    "EntityCreate", "EntityUpdate", "EntityResponse"
+    "MessageBulkItem", "MessageBulkCreate", "MessageBulkResult", "MessageBulkResponse",
+    "ChatTurnCreate", "ChatTurnResponse", "MessageSearchHit",
+    "EntityCreate", "EntityUpdate", "EntityResponse", "EntityInline",
+    "EntityAliasCreate", "EntityAliasResponse",
+    "CursorPage", "DeleteJob", "ExtractionBacklog", "RollupBacklog",
+    "EntityValueCount", "EntityTopValues"
 ]
 
 # Rebuild models and update forward refs to resolve circular/forward references
 UserResponse.model_rebuild()
+UserProjection.model_rebuild()
 ConversationResponse.model_rebuild()
 MessageResponse.model_rebuild()
+MessageBulkResult.model_rebuild()
+MessageBulkResponse.model_rebuild()
+ChatTurnResponse.model_rebuild()
 EntityResponse.model_rebuild()
 UserResponse.update_forward_refs()
 ConversationResponse.update_forward_refs()
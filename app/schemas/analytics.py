@@ -0,0 +1,15 @@
+from pydantic import BaseModel
+from datetime import date
+from typing import List, Optional
+
+
+class EntityValueCount(BaseModel):
+    entity_value: str
+    count: int
+
+
+class EntityTopValues(BaseModel):
+    """The most frequent values of one entity type, overall or in one period"""
+    entity_type: str
+    bucket: Optional[date] = None
+    values: List[EntityValueCount]
@@ -0,0 +1,26 @@
+from pydantic import BaseModel, model_validator
+from sqlalchemy import inspect
+
+
+class ORMResponse(BaseModel):
+    """Base for response schemas read from ORM instances
+
+    Attributes the query did not load (relationships a route did not ask for,
+    deferred columns) are left unset instead of triggering a lazy load.
+    """
+
+    @model_validator(mode="before")
+    @classmethod
+    def _skip_unloaded(cls, data):
+        state = inspect(data, raiseerr=False)
+        if state is None or not hasattr(state, "unloaded"):
+            return data
+        unloaded = state.unloaded
+        return {
+            name: getattr(data, name)
+            for name in cls.model_fields
+            if name not in unloaded and hasattr(data, name)
+        }
+
+    class Config:
+        from_attributes = True
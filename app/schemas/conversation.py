@@ -1,6 +1,7 @@
 from pydantic import BaseModel
 from datetime import datetime
 from typing import Optional, List, TYPE_CHECKING
+from .base import ORMResponse
 
 
 if TYPE_CHECKING:
@@ -22,7 +23,7 @@ class ConversationUpdate(BaseModel):
     is_active: Optional[bool] = None
 
 
-class ConversationResponse(ConversationBase):
+class ConversationResponse(ConversationBase, ORMResponse):
     id: int
     is_active: bool
     # MessageResponse does NOT cause recursion
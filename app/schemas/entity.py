@@ -1,6 +1,7 @@
 from pydantic import BaseModel
 from datetime import datetime
 from typing import Optional, TYPE_CHECKING
+from .base import ORMResponse
 
 if TYPE_CHECKING:
     from .message import MessageResponse
@@ -17,13 +18,30 @@ class EntityCreate(EntityBase):
     pass
 
 
+class EntityInline(BaseModel):
+    """Entity submitted together with its message, before the message has an id"""
+    entity_type: str
+    entity_value: str
+    confidence_score: Optional[int] = 100
+
+
 class EntityUpdate(BaseModel):
     entity_type: Optional[str] = None
     entity_value: Optional[str] = None
     confidence_score: Optional[int] = None
 
 
-class EntityResponse(EntityBase):
+class EntityAliasCreate(BaseModel):
+    entity_type: str
+    alias: str
+    entity_value: str
+
+
+class EntityAliasResponse(EntityAliasCreate):
+    entities_moved: int
+
+
+class EntityResponse(EntityBase, ORMResponse):
     id: int
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
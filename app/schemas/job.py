@@ -0,0 +1,28 @@
+from pydantic import BaseModel
+from datetime import date, datetime
+from typing import Literal, Optional
+
+
+class DeleteJob(BaseModel):
+    """Progress of a chunked background delete"""
+    id: str
+    target: Literal["user", "conversation"]
+    target_id: int
+    status: Literal["pending", "running", "completed", "failed"] = "pending"
+    total_messages: int = 0
+    deleted_messages: int = 0
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+
+class ExtractionBacklog(BaseModel):
+    """Messages waiting in the entity extraction outbox"""
+    queued: int
+    failed: int
+
+
+class RollupBacklog(BaseModel):
+    """Days whose entity rollups wait to be recomputed"""
+    stale_days: int
+    oldest_stale_day: Optional[date] = None
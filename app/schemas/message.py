@@ -1,6 +1,8 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional, List, TYPE_CHECKING
+from typing import Optional, List, Literal, TYPE_CHECKING
+from .base import ORMResponse
+from .entity import EntityInline
 
 if TYPE_CHECKING:
     from .entity import EntityResponse
@@ -21,7 +23,7 @@ class MessageUpdate(BaseModel):
     content: Optional[str] = None
 
 
-class MessageResponse(MessageBase):
+class MessageResponse(MessageBase, ORMResponse):
     id: int
     created_at: datetime
     updated_at: Optional[datetime] = None
@@ -32,4 +34,49 @@ class MessageResponse(MessageBase):
         from_attributes = True
 
 
+class MessageBulkItem(MessageBase):
+    entities: List[EntityInline] = []
+
+
+class MessageBulkCreate(BaseModel):
+    messages: List[MessageBulkItem] = Field(..., min_length=1, max_length=10000)
+
+
+class MessageBulkResult(BaseModel):
+    index: int
+    status: Literal["created", "failed"]
+    message: Optional[MessageResponse] = None
+    error: Optional[str] = None
+
+
+class MessageBulkResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[MessageBulkResult]
+
+
 # Resolve forward references
+
+
+class ChatTurnCreate(BaseModel):
+    """A user message to answer with an AI reply"""
+    content: str = Field(..., min_length=1)
+
+
+class ChatTurnResponse(BaseModel):
+    message: MessageResponse
+    reply: MessageResponse
+
+
+class MessageSearchHit(BaseModel):
+    """A matching message, with its relevance and highlighted fragments"""
+    id: int
+    conversation_id: int
+    sender_type: str
+    content: str
+    created_at: datetime
+    rank: float
+    highlight: str
+
+    class Config:
+        from_attributes = True
@@ -1,6 +1,7 @@
 from pydantic import BaseModel, EmailStr
 from datetime import datetime
 from typing import Optional, List, TYPE_CHECKING
+from .base import ORMResponse
 
 if TYPE_CHECKING:
     from .conversation import ConversationResponse
@@ -28,8 +29,11 @@ class UserBasic(UserBase):
     id: int
     is_active: Optional[bool] = True
 
+    class Config:
+        from_attributes = True
+
 
-class UserResponse(UserBase):
+class UserResponse(UserBase, ORMResponse):
     id: int
     username: str
     email: str
@@ -40,3 +44,15 @@ class UserResponse(UserBase):
 
     class Config:
         from_attributes = True
+
+
+class UserProjection(BaseModel):
+    """User with only the requested columns and expanded relations set"""
+    id: int
+    username: Optional[str] = None
+    email: Optional[str] = None
+    full_name: Optional[str] = None
+    is_active: Optional[bool] = None
+    conversations: Optional[List["ConversationResponse"]] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
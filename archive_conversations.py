@@ -0,0 +1,51 @@
+"""Move inactive conversations to cold storage (see app.core.archive)
+
+Archives conversations marked inactive whose newest message is older than
+--older-than-days (ARCHIVE_AFTER_DAYS by default), one transaction each.
+They are loaded back automatically the next time their messages are read.
+
+    python archive_conversations.py --older-than-days 180 --limit 1000
+"""
+import argparse
+import asyncio
+from datetime import timedelta
+from app.core.archive import archive_conversation, archive_path, find_archivable
+from app.core.config import settings
+from app.database.database import AsyncSessionLocal, engine
+
+
+async def archive(args):
+    idle_for = timedelta(days=args.older_than_days)
+    try:
+        async with AsyncSessionLocal() as session:
+            conversation_ids = await find_archivable(session, idle_for, args.limit)
+        print(f"{len(conversation_ids)} conversations to archive")
+        if args.dry_run:
+            return
+
+        archived = messages = 0
+        for conversation_id in conversation_ids:
+            async with AsyncSessionLocal() as session:
+                count = await archive_conversation(session, conversation_id, idle_for)
+            if count:
+                archived += 1
+                messages += count
+                print(f"Archived conversation {conversation_id}: {count} messages "
+                      f"to {archive_path(conversation_id)}")
+        print(f"Archived {archived} conversations, {messages} messages")
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--older-than-days", type=int, default=settings.archive_after_days)
+    parser.add_argument("--limit", type=int, default=1000,
+                        help="most conversations to archive in this run")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="only count the conversations that qualify")
+    asyncio.run(archive(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
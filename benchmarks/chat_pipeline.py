@@ -0,0 +1,173 @@
+"""Latency and throughput of chat turns against the fake model backend
+
+Starts one uvicorn worker in a subprocess with CHAT_BACKEND=fake, creates
+conversations and sends one streamed chat turn to each, with a bounded
+number of clients in flight. The model is the deterministic fake backend,
+so the numbers reflect the
+pipeline (storage, history, queueing, streaming) around a model with fixed
+latency rather than the model itself. Reports time to first token, time to
+the stored reply and turns per second, plus how many calls were coalesced
+when several conversations open with the same question.
+
+Requires the configured database and httpx. Seeded rows are removed afterwards.
+
+    python -m benchmarks.chat_pipeline --turns 200 --clients 50
+    python -m benchmarks.chat_pipeline --turns 200 --clients 50 --distinct-questions 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+
+from app.core.config import settings
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def server_metric(client: httpx.AsyncClient, sample: str) -> float:
+    text = (await client.get(f"{settings.api_v1_prefix}/metrics")).text
+    for line in text.splitlines():
+        if line.startswith(sample + " "):
+            return float(line.split()[1])
+    return 0.0
+
+
+async def wait_for_server(client: httpx.AsyncClient):
+    for _ in range(200):
+        try:
+            await client.get(f"{settings.api_v1_prefix}/health")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+def summarize(samples) -> dict:
+    return {
+        "p50_ms": round(statistics.median(samples) * 1000, 1),
+        "p99_ms": round(percentile(samples, 99) * 1000, 1),
+    }
+
+
+async def chat_turn(client, conversation_id: int, question: str) -> tuple:
+    started = time.perf_counter()
+    first_token = None
+    event = None
+    async with client.stream(
+        "POST", f"{settings.api_v1_prefix}/messages/conversation/{conversation_id}/chat",
+        json={"content": question},
+    ) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[7:]
+                if event == "token" and first_token is None:
+                    first_token = time.perf_counter() - started
+                elif event == "error":
+                    raise RuntimeError(f"chat turn failed in conversation {conversation_id}")
+    if event != "reply":
+        raise RuntimeError(f"no reply stored in conversation {conversation_id}")
+    return first_token, time.perf_counter() - started
+
+
+async def run(args):
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", args.host,
+         "--port", str(args.port), "--log-level", "warning"],
+        env={**os.environ,
+             "CHAT_BACKEND": "fake",
+             "CHAT_MAX_CONCURRENCY": str(args.max_concurrency),
+             "CHAT_MAX_QUEUE": str(args.turns),
+             "FAKE_CHAT_LATENCY_MS": str(args.latency_ms),
+             "FAKE_CHAT_TOKENS_PER_SECOND": str(args.tokens_per_second),
+             "FAKE_CHAT_REPLY_TOKENS": str(args.reply_tokens)},
+    )
+    limits = httpx.Limits(max_connections=args.clients + 5)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://{args.host}:{args.port}",
+                                     timeout=120, limits=limits) as client:
+            await wait_for_server(client)
+            report = await measure(client, args)
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+    print(json.dumps(report, indent=2))
+
+
+async def measure(client: httpx.AsyncClient, args) -> dict:
+    prefix = settings.api_v1_prefix
+    name = f"chat_bench_{uuid.uuid4().hex[:8]}"
+    user = (await client.post(f"{prefix}/users/", json={
+        "username": name, "email": f"{name}@example.com", "password": "x"})).json()
+    try:
+        conversations = [
+            (await client.post(f"{prefix}/conversations/", json={
+                "user_id": user["id"], "title": f"Trip {i}"})).json()["id"]
+            for i in range(args.turns)
+        ]
+        distinct = args.distinct_questions or args.turns
+        clients = asyncio.Semaphore(args.clients)
+
+        async def one(index: int, conversation_id: int):
+            async with clients:
+                return await chat_turn(
+                    client, conversation_id,
+                    f"What should I see in Bali? (variant {index % distinct})")
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(
+            one(i, conversation_id) for i, conversation_id in enumerate(conversations)))
+        elapsed = time.perf_counter() - started
+    finally:
+        await client.delete(f"{prefix}/users/{user['id']}")
+
+    return {
+        "turns": args.turns,
+        "clients": args.clients,
+        "model": {"latency_ms": args.latency_ms,
+                  "tokens_per_second": args.tokens_per_second,
+                  "reply_tokens": args.reply_tokens,
+                  "max_concurrency": args.max_concurrency},
+        "turns_per_second": round(args.turns / elapsed, 1),
+        "first_token": summarize([first for first, _ in results]),
+        "stored_reply": summarize([total for _, total in results]),
+        "model_calls": await server_metric(
+            client, 'chat_requests_total{backend="fake",result="ok"}'),
+        "coalesced": await server_metric(
+            client, 'chat_requests_total{backend="fake",result="coalesced"}'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--clients", type=int, default=50,
+                        help="chat turns in flight at once")
+    parser.add_argument("--distinct-questions", type=int, default=0,
+                        help="distinct opening questions; 0 makes every one distinct")
+    parser.add_argument("--max-concurrency", type=int, default=settings.chat_max_concurrency,
+                        help="concurrent model calls allowed by the pipeline")
+    parser.add_argument("--latency-ms", type=int, default=300)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--reply-tokens", type=int, default=40)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8767)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Prompt-building time against conversation length
+
+Seeds one conversation per size, each with a stored summary, then times
+build_context() against loading the full history the way
+get_conversation_messages does. build_context should stay flat as the
+conversation grows; the full history grows with it. Also reports the
+prompt size each approach would send to the model.
+
+Requires the configured database. Seeded rows are removed afterwards.
+
+    python -m benchmarks.context_window --sizes 10,100,1000,10000,50000
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from sqlalchemy import select, text
+
+from app.core.chat import estimate_tokens
+from app.core.context import build_context
+from app.database.database import AsyncSessionLocal, engine
+from app.models import Message
+
+PREFIX = "context_bench_"
+
+
+async def seed(sizes) -> dict:
+    conversations = {}
+    async with engine.begin() as conn:
+        user_id = (await conn.execute(text(
+            "INSERT INTO users (username, email, hashed_password, is_active) "
+            "VALUES (:name, :email, 'x', true) RETURNING id"
+        ), {"name": PREFIX + "user", "email": PREFIX + "user@example.com"})).scalar()
+        for size in sizes:
+            conversation_id = (await conn.execute(text(
+                "INSERT INTO conversations (user_id, title, is_active, summary) "
+                "VALUES (:user_id, :title, true, :summary) RETURNING id"
+            ), {"user_id": user_id, "title": f"{size} messages",
+                "summary": "user: planning two weeks in Bali in July on a mid-range budget\n" * 8}
+            )).scalar()
+            await conn.execute(text(
+                "INSERT INTO messages (conversation_id, sender_type, content, created_at) "
+                "SELECT :conversation_id, CASE WHEN g % 2 = 0 THEN 'user' ELSE 'ai' END, "
+                "repeat('Which temples in Ubud are worth an early start? ', 1 + g % 5), "
+                "now() - (:size - g) * interval '1 second' "
+                "FROM generate_series(1, :size) AS g"
+            ), {"conversation_id": conversation_id, "size": size})
+            # Everything but the newest 50 messages is covered by the summary
+            await conn.execute(text(
+                "UPDATE conversations SET summary_message_id = ("
+                "SELECT id FROM messages WHERE conversation_id = :id "
+                "ORDER BY created_at DESC, id DESC OFFSET 50 LIMIT 1) WHERE id = :id"
+            ), {"id": conversation_id})
+            conversations[size] = conversation_id
+        await conn.execute(text("ANALYZE messages"))
+    return conversations
+
+
+async def full_history(session, conversation_id: int) -> list:
+    result = await session.execute(
+        select(Message.sender_type, Message.content)
+        .where(Message.conversation_id == conversation_id)
+        .order_by(Message.created_at.asc(), Message.id.asc())
+    )
+    return [(row.sender_type, row.content) for row in result]
+
+
+async def time_builder(build, conversation_id: int, repeat: int) -> dict:
+    timings, history = [], None
+    async with AsyncSessionLocal() as session:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            history = await build(session, conversation_id)
+            timings.append(time.perf_counter() - started)
+    return {
+        "median_ms": round(statistics.median(timings) * 1000, 3),
+        "messages": len(history),
+        "prompt_tokens": sum(estimate_tokens(content) for _, content in history),
+    }
+
+
+async def run(args):
+    sizes = [int(size) for size in args.sizes.split(",")]
+    conversations = await seed(sizes)
+    report = {}
+    try:
+        for size, conversation_id in conversations.items():
+            report[size] = {
+                "build_context": await time_builder(
+                    build_context, conversation_id, args.repeat),
+                "full_history": await time_builder(
+                    full_history, conversation_id, args.repeat),
+            }
+    finally:
+        async with engine.begin() as conn:
+            await conn.execute(text("DELETE FROM users WHERE username = :name"),
+                               {"name": PREFIX + "user"})
+        await engine.dispose()
+    print(json.dumps(report, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10,100,1000,10000,50000",
+                        help="comma-separated message counts, one conversation each")
+    parser.add_argument("--repeat", type=int, default=30)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""Entity analytics from rollups against counting raw entity rows
+
+Seeds --entities entities over --days days, on messages spread across
+--users users, then builds the rollups with the rollup worker. Reports how
+long the build took and how long one day takes to recompute, then times
+each analytics query against the GROUP BY over entities that the rollups
+replace:
+
+- top: top 10 values of every type, all time
+- top_30_days: top 10 values of every type over the last 30 days
+- user_top: top 10 values of every type for one user, read live from
+  that user's entities rather than from the rollups
+- timeline: top 10 locations per week
+
+Requires the configured database. Seeded rows are removed afterwards; this
+leaves stale markers behind for the days it touched, which the worker
+recomputes.
+
+    python -m benchmarks.entity_analytics --entities 2000000
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import func, select, text
+
+from app.core.dictionary import find_type, intern_entities
+from app.core.rollups import rollup_worker, top_entities
+from app.database.database import AsyncSessionLocal, engine
+from app.models import Conversation, Entity, Message
+
+PREFIX = "analytics_bench_"
+
+VALUES = {
+    "location": ["Bali", "Ubud", "Canggu", "Seminyak", "Uluwatu", "Lombok", "Gili Air",
+                 "Nusa Penida", "Komodo", "Yogyakarta", "Mount Bromo", "Raja Ampat"],
+    "activity": ["surfing", "diving", "snorkeling", "yoga", "hiking", "cooking class",
+                 "spa", "temple tour", "rafting", "island hopping"],
+    "time": ["July", "August", "December", "5 days", "2 weeks", "next month", "dry season"],
+    "budget": ["$500", "$800", "$1,000", "$2,000", "luxury", "budget", "mid-range"],
+}
+
+
+async def seed(users: int, messages: int, entities: int, days: int):
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            "INSERT INTO users (username, email, hashed_password, is_active) "
+            "SELECT :prefix || g, :prefix || g || '@example.com', 'x', true "
+            "FROM generate_series(1, :users) AS g"
+        ), {"prefix": PREFIX, "users": users})
+        await conn.execute(text(
+            "INSERT INTO conversations (user_id, title, is_active) "
+            "SELECT id, 'Trip', true FROM users WHERE username LIKE :prefix || '%'"
+        ), {"prefix": PREFIX})
+        # Ids from one INSERT form a contiguous range; users take turns, as in
+        # a live system
+        low, high = (await conn.execute(text(
+            "WITH inserted AS ("
+            " INSERT INTO messages (conversation_id, sender_type, content) "
+            " SELECT c.id, 'user', 'Planning a trip' "
+            " FROM conversations c JOIN users u ON u.id = c.user_id, "
+            " generate_series(1, :per_user) AS g WHERE u.username LIKE :prefix || '%' "
+            " ORDER BY g, c.id RETURNING id) "
+            "SELECT min(id), max(id) FROM inserted"
+        ), {"prefix": PREFIX, "per_user": max(1, messages // users)})).one()
+    # Interleaved by rank, so the skew towards the front applies within every type
+    pairs = [(type, values[rank]) for rank in range(max(map(len, VALUES.values())))
+             for type, values in VALUES.items() if rank < len(values)]
+    async with engine.begin() as conn:
+        interned = await intern_entities(conn, pairs)
+    ids = [f"{interned[pair][0]}|{interned[pair][1]}" for pair in pairs]
+    batch = 250000
+    for start in range(0, entities, batch):
+        async with engine.begin() as conn:
+            await conn.execute(text(
+                "INSERT INTO entities (message_id, message_created_at, type_id, value_id, "
+                "confidence_score, created_at) "
+                "SELECT s.message_id, m.created_at, split_part(pair, '|', 1)::int, split_part(pair, '|', 2)::int, "
+                "80, s.created_at FROM ("
+                # In time order, on recent messages, as the extraction worker
+                # writes them
+                " SELECT CAST(:low AS integer) + ((g - random() * least(g - 1, 1000)) "
+                "   * (:high - :low) / :entities)::int AS message_id, "
+                " (CAST(:pairs AS text[]))[1 + floor(:count * power(random(), 2))::int] AS pair, "
+                " now() - (:entities - g) * :days * interval '1 day' / :entities AS created_at "
+                " FROM generate_series(CAST(:start AS integer), CAST(:stop AS integer)) AS g) AS s "
+                "JOIN messages m ON m.id = s.message_id"
+            ), {"low": low, "high": high, "days": days, "pairs": ids, "count": len(ids),
+                "entities": entities, "start": start + 1, "stop": min(start + batch, entities)})
+    async with engine.begin() as conn:
+        await conn.execute(text("ANALYZE messages, entities"))
+
+
+async def timed(call, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await call()
+        timings.append(time.perf_counter() - started)
+    return round(statistics.median(timings) * 1000, 2)
+
+
+async def run(args):
+    report = {}
+    try:
+        await seed(args.users, args.messages, args.entities, args.days)
+        started = time.perf_counter()
+        days = 0
+        while refreshed := await rollup_worker.run_once():
+            days += refreshed
+        report["build"] = {"days": days, "seconds": round(time.perf_counter() - started, 2),
+                           "entities": args.entities}
+
+        async with AsyncSessionLocal() as session:
+            user_id = await session.scalar(
+                select(func.min(Conversation.user_id)).join(Message).where(
+                    Message.id == select(func.min(Entity.message_id)).scalar_subquery()))
+            since = date.today() - timedelta(days=30)
+            location = await find_type(session, "location")
+
+            async def raw(where=(), user=False, period=None):
+                columns = [Entity.type_id, Entity.value_id]
+                if period:
+                    columns.append(func.date_trunc(period, Entity.created_at))
+                stmt = select(*columns, func.count())
+                if user:
+                    stmt = stmt.join(Message).join(Conversation).where(
+                        Conversation.user_id == user_id)
+                stmt = stmt.where(*where).group_by(*columns)
+                return (await session.execute(stmt)).all()
+
+            queries = {
+                "top": (lambda: top_entities(session),
+                        lambda: raw()),
+                "top_30_days": (lambda: top_entities(session, start=since),
+                                lambda: raw([Entity.created_at >= since])),
+                "user_top": (lambda: top_entities(session, user_id=user_id),
+                             lambda: raw(user=True)),
+                "timeline": (lambda: top_entities(session, entity_type="location",
+                                                  interval="week"),
+                             lambda: raw([Entity.type_id == location], period="week")),
+            }
+            for name, (analytics, baseline) in queries.items():
+                report[name] = {"analytics_ms": await timed(analytics, args.repeat),
+                                "group_by_ms": await timed(baseline, args.repeat)}
+
+        # One day's worth of changes, as after a burst of new entities
+        async with engine.begin() as conn:
+            await conn.execute(text(
+                "INSERT INTO stale_rollup_buckets (bucket) VALUES (CURRENT_DATE - 1)"))
+        started = time.perf_counter()
+        await rollup_worker.run_once()
+        report["recompute_one_day_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    finally:
+        async with engine.begin() as conn:
+            await conn.execute(text("DELETE FROM users WHERE username LIKE :prefix || '%'"),
+                               {"prefix": PREFIX})
+        await engine.dispose()
+    print(json.dumps(report, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entities", type=int, default=2000000)
+    parser.add_argument("--messages", type=int, default=500000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
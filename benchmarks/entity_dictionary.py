@@ -0,0 +1,164 @@
+"""Entity storage and lookups with interned ids against repeated strings
+
+Builds two temporary copies of --entities entities with the same skewed mix
+of types and values: one storing type_id and value_id, as entities does,
+the other repeating the type and value strings on every row, as entities
+used to. Reports the size of each table and of its (type, value) index,
+then times fetching one type and one value, the get_entities_by_type
+lookups, and counting entities per value, from each.
+
+Also times intern_entities() on batches of --batch pairs, the way the
+extraction worker resolves a batch, with a cold and a warm process cache.
+
+Requires the configured database. The temporary tables go away with the
+connection; dictionary rows for the benchmark's values are kept, like any
+other dictionary row.
+
+    python -m benchmarks.entity_dictionary --entities 2000000
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+from sqlalchemy import text
+
+from app.core import dictionary
+from app.core.dictionary import intern_entities
+from app.core.extractors import ACTIVITIES, LOCATIONS, MONTHS, SEASONS
+from app.database.database import AsyncSessionLocal, engine
+
+VALUES = {
+    "location": LOCATIONS,
+    "activity": ACTIVITIES,
+    "time": MONTHS + SEASONS + [f"{n}-day trip" for n in range(1, 31)],
+    "budget": [f"${n * 50:,}" for n in range(1, 400)],
+}
+
+
+async def seed(conn, entities: int) -> dict:
+    pairs = [(type, value) for type, values in VALUES.items() for value in values]
+    interned = await intern_entities(conn, pairs)
+    await conn.execute(text(
+        "CREATE TEMP TABLE interned AS "
+        "SELECT g AS id, g / 3 AS message_id, "
+        " (CAST(:type_ids AS integer[]))[i] AS type_id, "
+        " (CAST(:value_ids AS integer[]))[i] AS value_id, "
+        " 80 AS confidence_score, now() AS created_at, now() AS updated_at "
+        "FROM (SELECT g, 1 + floor(:count * power(random(), 2))::int AS i "
+        "      FROM generate_series(1, :entities) AS g) AS s"
+    ), {"type_ids": [interned[pair][0] for pair in pairs],
+        "value_ids": [interned[pair][1] for pair in pairs],
+        "count": len(pairs), "entities": entities})
+    await conn.execute(text(
+        "CREATE TEMP TABLE strings AS "
+        "SELECT e.id, e.message_id, t.name AS entity_type, v.value AS entity_value, "
+        " e.confidence_score, e.created_at, e.updated_at "
+        "FROM interned e JOIN entity_types t ON t.id = e.type_id "
+        "JOIN entity_values v ON v.id = e.value_id"
+    ))
+    await conn.execute(text("CREATE INDEX ON interned (type_id, value_id)"))
+    await conn.execute(text("CREATE INDEX ON strings (entity_type, entity_value)"))
+    await conn.execute(text("ANALYZE interned, strings"))
+    return {pair: interned[pair] for pair in pairs}
+
+
+async def sizes(conn, table: str) -> dict:
+    row = (await conn.execute(text(
+        "SELECT pg_table_size(CAST(:table AS regclass)), "
+        "pg_indexes_size(CAST(:table AS regclass))"
+    ), {"table": table})).one()
+    return {"table_mb": round(row[0] / 2 ** 20, 1), "index_mb": round(row[1] / 2 ** 20, 1)}
+
+
+async def timed(conn, sql: str, params: dict, repeat: int) -> dict:
+    timings, rows = [], 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = len((await conn.execute(text(sql), params)).all())
+        timings.append(time.perf_counter() - started)
+    return {"median_ms": round(statistics.median(timings) * 1000, 2), "rows": rows}
+
+
+async def lookups(conn, interned: dict, repeat: int) -> dict:
+    # A mid-frequency type and value, so neither result is most of the table
+    type, value = "activity", LOCATIONS[len(LOCATIONS) // 2]
+    type_id = interned[type, VALUES[type][0]][0]
+    value_type_id, value_id = interned["location", value]
+    by_ids = (
+        "SELECT e.id, e.message_id, t.name, v.value, e.confidence_score, "
+        "e.created_at, e.updated_at FROM interned e "
+        "JOIN entity_types t ON t.id = e.type_id JOIN entity_values v ON v.id = e.value_id "
+        "WHERE e.type_id = :type_id")
+    by_strings = "SELECT * FROM strings WHERE entity_type = :type"
+    return {
+        "by_type": {
+            "interned": await timed(conn, by_ids, {"type_id": type_id}, repeat),
+            "strings": await timed(conn, by_strings, {"type": type}, repeat),
+        },
+        "by_type_and_value": {
+            "interned": await timed(conn, by_ids + " AND e.value_id = :value_id",
+                                    {"type_id": value_type_id, "value_id": value_id}, repeat),
+            "strings": await timed(conn, by_strings + " AND entity_value = :value",
+                                   {"type": "location", "value": value}, repeat),
+        },
+        # What a rollup recompute or a raw analytics query does
+        "count_by_value": {
+            "interned": await timed(conn, "SELECT type_id, value_id, count(*) FROM interned "
+                                    "GROUP BY type_id, value_id", {}, repeat),
+            "strings": await timed(conn, "SELECT entity_type, entity_value, count(*) "
+                                   "FROM strings GROUP BY entity_type, entity_value",
+                                   {}, repeat),
+        },
+    }
+
+
+async def resolve(batch: int, repeat: int) -> dict:
+    pairs = [(type, value) for type, values in VALUES.items() for value in values]
+    report = {}
+    for name, clear in (("cold_cache", True), ("warm_cache", False)):
+        timings = []
+        async with AsyncSessionLocal() as session:
+            if not clear:
+                await intern_entities(session, pairs)
+            for _ in range(repeat):
+                if clear:
+                    dictionary._type_ids.clear()
+                    dictionary._value_ids.clear()
+                sample = random.sample(pairs, batch)
+                started = time.perf_counter()
+                await intern_entities(session, sample)
+                timings.append(time.perf_counter() - started)
+                await session.commit()
+        report[name] = {"median_ms": round(statistics.median(timings) * 1000, 3)}
+    return report
+
+
+async def run(args):
+    report = {}
+    try:
+        async with engine.connect() as conn:
+            interned = await seed(conn, args.entities)
+            await conn.commit()
+            report["size"] = {"interned": await sizes(conn, "interned"),
+                              "strings": await sizes(conn, "strings")}
+            report["lookups"] = await lookups(conn, interned, args.repeat)
+        report["intern_batch"] = await resolve(args.batch, args.repeat)
+    finally:
+        await engine.dispose()
+    print(json.dumps(report, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entities", type=int, default=2000000)
+    parser.add_argument("--batch", type=int, default=100,
+                        help="pairs per intern_entities() call")
+    parser.add_argument("--repeat", type=int, default=20)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
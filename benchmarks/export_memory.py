@@ -0,0 +1,130 @@
+"""Memory profile of the streaming conversation export
+
+Seeds conversations of increasing length, then reads each one through the
+streaming export and through the regular list endpoint while tracking the
+Python heap peak with tracemalloc. The export's peak should stay flat as
+history grows; the list endpoint's grows with it.
+
+Requires the configured database and httpx. Seeded rows are removed afterwards.
+
+    python -m benchmarks.export_memory --sizes 1000 10000 50000
+"""
+import argparse
+import asyncio
+import json
+import time
+import tracemalloc
+
+import httpx
+import uvicorn
+from sqlalchemy import text
+
+from app.main import app
+from app.core.config import settings
+from app.core.dictionary import intern_entities
+from app.database.database import AsyncSessionLocal
+
+
+async def seed_conversation(length: int) -> tuple:
+    async with AsyncSessionLocal() as session:
+        user_id = (await session.execute(text(
+            "INSERT INTO users (username, email, hashed_password) "
+            "VALUES ('export_bench_' || md5(random()::text), "
+            "md5(random()::text) || '@bench.local', 'x') RETURNING id"
+        ))).scalar()
+        conversation_id = (await session.execute(text(
+            "INSERT INTO conversations (user_id, title) "
+            "VALUES (:user_id, 'export benchmark') RETURNING id"
+        ), {"user_id": user_id})).scalar()
+        await session.execute(text(
+            "INSERT INTO messages (conversation_id, sender_type, content) "
+            "SELECT :conversation_id, "
+            "CASE WHEN n % 2 = 0 THEN 'user' ELSE 'ai' END, "
+            "repeat('Tell me about beaches and temples in Bali. ', 8) || n "
+            "FROM generate_series(1, :length) AS n"
+        ), {"conversation_id": conversation_id, "length": length})
+        pair = ("location", "Bali")
+        type_id, value_id = (await intern_entities(session, [pair]))[pair]
+        await session.execute(text(
+            "INSERT INTO entities (message_id, message_created_at, type_id, value_id) "
+            "SELECT id, created_at, :type_id, :value_id FROM messages "
+            "WHERE conversation_id = :conversation_id"
+        ), {"conversation_id": conversation_id, "type_id": type_id, "value_id": value_id})
+        await session.commit()
+    return user_id, conversation_id
+
+
+async def drop_seed(user_id: int, conversation_id: int):
+    async with AsyncSessionLocal() as session:
+        await session.execute(text(
+            "DELETE FROM entities WHERE message_id IN "
+            "(SELECT id FROM messages WHERE conversation_id = :c)"), {"c": conversation_id})
+        await session.execute(text(
+            "DELETE FROM messages WHERE conversation_id = :c"), {"c": conversation_id})
+        await session.execute(text(
+            "DELETE FROM conversations WHERE id = :c"), {"c": conversation_id})
+        await session.execute(text(
+            "DELETE FROM users WHERE id = :u"), {"u": user_id})
+        await session.commit()
+
+
+async def measure(client: httpx.AsyncClient, url: str, params: dict) -> dict:
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    received = 0
+    async with client.stream("GET", url, params=params) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes():
+            received += len(chunk)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "seconds": round(elapsed, 3),
+        "bytes": received,
+        "peak_heap_mb": round(peak / 1024 / 1024, 2),
+    }
+
+
+async def run(args):
+    prefix = settings.api_v1_prefix
+    report = []
+    # Serve over a real socket: httpx's ASGI transport buffers whole bodies,
+    # which would hide whether the response is actually streamed
+    server = uvicorn.Server(uvicorn.Config(
+        app, host="127.0.0.1", port=args.port, log_level="warning"))
+    serve_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    base_url = f"http://127.0.0.1:{args.port}"
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        for length in args.sizes:
+            user_id, conversation_id = await seed_conversation(length)
+            try:
+                row = {"messages": length}
+                row["export_ndjson"] = await measure(
+                    client, f"{prefix}/messages/conversation/{conversation_id}/export",
+                    {"include_entities": "true"})
+                if not args.skip_list:
+                    row["list_endpoint"] = await measure(
+                        client, f"{prefix}/messages/conversation/{conversation_id}", {})
+                report.append(row)
+            finally:
+                await drop_seed(user_id, conversation_id)
+    server.should_exit = True
+    await serve_task
+    print(json.dumps(report, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--skip-list", action="store_true",
+                        help="only measure the streaming export")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Throughput of the background entity extraction worker by batch size
+
+Seeds messages with realistic travel questions and queues them in the
+extraction outbox, then drains the queue in-process with the rule-based
+extractor, once per batch size. Reports messages and entities per second.
+Batch size 1 is roughly the per-message work of creating entities one
+request at a time.
+
+Requires the configured database. Seeded rows are removed afterwards.
+
+    python -m benchmarks.extraction_worker --messages 20000 --batch-sizes 1,10,100,500
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.extraction import extraction_worker
+from app.database.database import engine
+
+PREFIX = "extraction_bench_"
+
+QUESTIONS = [
+    "We want to go surfing in Canggu for 5 days in July, budget around $800",
+    "Is December the wet season in Bali? Looking for luxury hotels near Seminyak",
+    "Planning a 2-week trip to Lombok and the Gili Islands next month",
+    "Any scuba diving or snorkeling near Nusa Penida? We arrive on the 3rd of August",
+    "What is a good cooking class in Ubud for under Rp 500k?",
+    "Thanks, that sounds great!",
+]
+
+
+async def seed(messages: int):
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            "INSERT INTO users (username, email, hashed_password, is_active) "
+            "VALUES (:name, :email, 'x', true)"
+        ), {"name": PREFIX + "user", "email": PREFIX + "user@example.com"})
+        await conn.execute(text(
+            "INSERT INTO conversations (user_id, title, is_active) "
+            "SELECT id, 'Trip', true FROM users WHERE username = :name"
+        ), {"name": PREFIX + "user"})
+        await conn.execute(text(
+            "INSERT INTO messages (conversation_id, sender_type, content) "
+            "SELECT c.id, 'user', (CAST(:questions AS text[]))[1 + g % :count] "
+            "FROM conversations c JOIN users u ON u.id = c.user_id, "
+            "generate_series(1, :messages) AS g WHERE u.username = :name"
+        ), {"questions": QUESTIONS, "count": len(QUESTIONS),
+            "messages": messages, "name": PREFIX + "user"})
+
+
+async def queue_all():
+    async with engine.begin() as conn:
+        await conn.execute(text("DELETE FROM entities WHERE message_id IN ("
+                                "SELECT m.id FROM messages m "
+                                "JOIN conversations c ON c.id = m.conversation_id "
+                                "JOIN users u ON u.id = c.user_id WHERE u.username = :name)"),
+                           {"name": PREFIX + "user"})
+        await conn.execute(text(
+            "INSERT INTO extraction_outbox (message_id, message_created_at) "
+            "SELECT m.id, m.created_at FROM messages m JOIN conversations c ON c.id = m.conversation_id "
+            "JOIN users u ON u.id = c.user_id WHERE u.username = :name"
+        ), {"name": PREFIX + "user"})
+
+
+async def drain(batch_size: int, workers: int) -> dict:
+    settings.extraction_batch_size = batch_size
+    processed = 0
+
+    async def loop():
+        nonlocal processed
+        while claimed := await extraction_worker.run_once():
+            processed += claimed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(loop() for _ in range(workers)))
+    elapsed = time.perf_counter() - started
+    async with engine.connect() as conn:
+        entities = (await conn.execute(text(
+            "SELECT count(*) FROM entities e JOIN messages m ON m.id = e.message_id "
+            "JOIN conversations c ON c.id = m.conversation_id "
+            "JOIN users u ON u.id = c.user_id WHERE u.username = :name"
+        ), {"name": PREFIX + "user"})).scalar()
+    return {
+        "messages": processed,
+        "entities": entities,
+        "seconds": round(elapsed, 2),
+        "messages_per_second": round(processed / elapsed, 1),
+    }
+
+
+async def run(args):
+    await seed(args.messages)
+    report = {}
+    try:
+        for batch_size in [int(size) for size in args.batch_sizes.split(",")]:
+            await queue_all()
+            report[f"batch_{batch_size}"] = await drain(batch_size, args.workers)
+    finally:
+        async with engine.begin() as conn:
+            await conn.execute(text("DELETE FROM users WHERE username = :name"),
+                               {"name": PREFIX + "user"})
+        await engine.dispose()
+    print(json.dumps(report, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--batch-sizes", default="1,10,100,500")
+    parser.add_argument("--workers", type=int, default=settings.extraction_workers,
+                        help="concurrent claim loops")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""HTTP benchmark of every API router, saved as JSON for comparing commits
+
+Makes sure the configured database holds at least --scale messages, adding
+the difference with generate_data.py (one user per 100 messages, one
+conversation per 10). It then serves app.main:app with uvicorn on a local
+port and runs each endpoint in ENDPOINTS in turn: --warmup unmeasured
+requests, then --requests requests from --concurrency clients. Ids in the
+paths are sampled from the seeded rows with --seed, so two runs send the
+same requests.
+
+For every endpoint the report has throughput, p50/p95/p99 latency, errors,
+and the SQL statements and database time per request, read from the
+Server-Timing header of app.database.query_stats (turned on for the run if
+QUERY_STATS_ENABLED is not set). A streamed response's header covers the
+work done before its first byte. Writes go to a user the suite registers
+and removes afterwards.
+
+The report is written to --output. With --compare, each endpoint is also
+compared with a saved report, and the exit status is 1 if any p95 got more
+than --threshold percent slower.
+
+Requires the configured database and httpx:
+
+    python -m benchmarks.http_suite --scale 1000000 --output before.json
+    python -m benchmarks.http_suite --scale 1000000 --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+import httpx
+import uvicorn
+from sqlalchemy import text
+
+from app.main import app
+from app.core.config import settings
+from app.database.database import AsyncSessionLocal, engine, read_engine
+from app.database.query_stats import QueryStatsMiddleware, instrument_engine
+
+PREFIX = "http_bench_"
+PASSWORD = "http-bench-password"
+V1 = settings.api_v1_prefix
+GENERATOR = Path(__file__).resolve().parent.parent / "generate_data.py"
+
+# The statements and database time of a request, from its Server-Timing header
+DB_TIMING = re.compile(r'(?:^|,)\s*db;dur=([\d.]+);desc="(\d+) queries"')
+
+
+@dataclass
+class Endpoint:
+    name: str
+    method: str
+    # Builds the path, and the JSON body or form for writes, from the sampled ids
+    request: Callable[[random.Random, dict], tuple]
+
+
+def _get(path: Callable[[random.Random, dict], str]):
+    return lambda rng, ids: (path(rng, ids), {})
+
+
+ENDPOINTS = [
+    Endpoint("users.list", "GET", _get(lambda rng, ids: f"{V1}/users/?limit=50")),
+    Endpoint("users.list_cursor", "GET",
+             _get(lambda rng, ids: f"{V1}/users/?pagination=cursor&limit=50")),
+    Endpoint("users.get", "GET", _get(lambda rng, ids: f"{V1}/users/{rng.choice(ids['users'])}")),
+    Endpoint("users.get_expanded", "GET", _get(
+        lambda rng, ids: f"{V1}/users/{rng.choice(ids['users'])}?expand=conversations")),
+    Endpoint("users.create", "POST", lambda rng, ids: (f"{V1}/users/", {"json": _new_user()})),
+    Endpoint("conversations.list", "GET",
+             _get(lambda rng, ids: f"{V1}/conversations/?pagination=cursor&limit=50")),
+    Endpoint("conversations.get", "GET", _get(
+        lambda rng, ids: f"{V1}/conversations/{rng.choice(ids['conversations'])}")),
+    Endpoint("conversations.by_user", "GET", _get(
+        lambda rng, ids: f"{V1}/conversations/user/{rng.choice(ids['users'])}")),
+    Endpoint("conversations.create", "POST", lambda rng, ids: (
+        f"{V1}/conversations/", {"json": {"user_id": ids["bench_user"], "title": "Benchmark"}})),
+    Endpoint("messages.list", "GET",
+             _get(lambda rng, ids: f"{V1}/messages/?pagination=cursor&limit=50")),
+    Endpoint("messages.get", "GET",
+             _get(lambda rng, ids: f"{V1}/messages/{rng.choice(ids['messages'])}")),
+    Endpoint("messages.by_conversation", "GET", _get(
+        lambda rng, ids: f"{V1}/messages/conversation/{rng.choice(ids['conversations'])}")),
+    Endpoint("messages.export", "GET", _get(
+        lambda rng, ids: f"{V1}/messages/conversation/{rng.choice(ids['conversations'])}"
+                         f"/export?include_entities=true")),
+    Endpoint("messages.search", "GET", _get(
+        lambda rng, ids: f"{V1}/messages/search?q={rng.choice(SEARCH_TERMS)}")),
+    Endpoint("messages.create", "POST", lambda rng, ids: (f"{V1}/messages/", {"json": {
+        "conversation_id": ids["bench_conversation"], "sender_type": "user",
+        "content": "Is Lisbon good for surfing in October?"}})),
+    Endpoint("entities.list", "GET",
+             _get(lambda rng, ids: f"{V1}/entities/?pagination=cursor&limit=50")),
+    Endpoint("entities.get", "GET",
+             _get(lambda rng, ids: f"{V1}/entities/{rng.choice(ids['entities'])}")),
+    Endpoint("entities.by_message", "GET", _get(
+        lambda rng, ids: f"{V1}/entities/message/{rng.choice(ids['messages'])}")),
+    Endpoint("entities.by_type", "GET", _get(
+        lambda rng, ids: f"{V1}/entities/type/{rng.choice(ENTITY_TYPES)}?limit=50")),
+    Endpoint("entities.create", "POST", lambda rng, ids: (f"{V1}/entities/", {"json": {
+        "message_id": ids["bench_message"], "entity_type": "location",
+        "entity_value": rng.choice(["Lisbon", "Porto", "Sintra"])}})),
+    Endpoint("analytics.top", "GET", _get(lambda rng, ids: f"{V1}/analytics/entities/top")),
+    Endpoint("auth.login", "POST", lambda rng, ids: ("/auth/login", {"data": {
+        "username": ids["bench_username"], "password": PASSWORD}})),
+    Endpoint("auth.me", "GET", _get(lambda rng, ids: "/auth/me")),
+]
+
+SEARCH_TERMS = ["surfing", "Bali", "museum", "budget", "hiking Kyoto", "public transport"]
+ENTITY_TYPES = ["location", "activity", "time", "budget"]
+
+
+def _new_user() -> dict:
+    name = f"{PREFIX}{uuid.uuid4().hex[:12]}"
+    return {"username": name, "email": f"{name}@example.com", "password": PASSWORD}
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def seed(scale: int):
+    async with AsyncSessionLocal() as session:
+        existing = await session.scalar(text("SELECT count(*) FROM messages"))
+    missing = scale - existing
+    if missing <= 0:
+        return
+    print(f"Generating {missing} messages", file=sys.stderr)
+    subprocess.run(
+        [sys.executable, str(GENERATOR), "--messages", str(missing),
+         "--conversations", str(max(1, missing // 10)), "--users", str(max(1, missing // 100)),
+         "--prefix", f"{PREFIX}load_"],
+        check=True, stdout=subprocess.DEVNULL)
+
+
+async def sample_ids(seed: int, count: int = 500) -> Dict[str, list]:
+    """Up to `count` existing ids of each table, the same for the same seed and data"""
+    rng = random.Random(seed)
+    ids = {}
+    async with AsyncSessionLocal() as session:
+        for table in ("users", "conversations", "messages", "entities"):
+            low, high = (await session.execute(
+                text(f"SELECT min(id), max(id) FROM {table}"))).one()
+            if high is None:
+                raise RuntimeError(f"{table} is empty; seed the database with --scale")
+            candidates = [rng.randint(low, high) for _ in range(count)]
+            found = set((await session.execute(
+                text(f"SELECT id FROM {table} WHERE id = ANY(:ids)"),
+                {"ids": candidates})).scalars())
+            ids[table] = [id for id in candidates if id in found] or [low]
+    return ids
+
+
+async def measure(client: httpx.AsyncClient, endpoint: Endpoint, ids: dict, args) -> dict:
+    rng = random.Random(f"{args.seed}:{endpoint.name}")
+    requests = [endpoint.request(rng, ids) for _ in range(args.warmup + args.requests)]
+    latencies, queries, db_ms, errors = [], [], [], {}
+
+    async def send(path, options, record):
+        started = time.perf_counter()
+        try:
+            response = await client.request(endpoint.method, path, **options)
+            status = response.status_code
+        except httpx.HTTPError as exc:
+            status = type(exc).__name__
+            response = None
+        if not record:
+            return
+        latencies.append(time.perf_counter() - started)
+        timing = DB_TIMING.search(response.headers.get("server-timing", "")) if response else None
+        if timing:
+            db_ms.append(float(timing.group(1)))
+            queries.append(int(timing.group(2)))
+        if response is None or response.status_code >= 400:
+            errors[str(status)] = errors.get(str(status), 0) + 1
+
+    async def clients(batch, record):
+        pending = iter(batch)
+
+        async def one_client():
+            for path, options in pending:
+                await send(path, options, record)
+
+        await asyncio.gather(*(one_client() for _ in range(args.concurrency)))
+
+    await clients(requests[:args.warmup], record=False)
+    started = time.perf_counter()
+    await clients(requests[args.warmup:], record=True)
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": args.requests,
+        "errors": errors,
+        "requests_per_second": round(args.requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2),
+        "queries_per_request": round(statistics.fmean(queries), 2) if queries else None,
+        "max_queries": max(queries, default=None),
+        "db_ms_per_request": round(statistics.fmean(db_ms), 2) if db_ms else None,
+    }
+
+
+async def setup_bench_user(client: httpx.AsyncClient, ids: dict):
+    """The user, conversation and message the write endpoints add to"""
+    user = (await client.post("/auth/register", json=_new_user())).raise_for_status().json()
+    conversation = (await client.post(f"{V1}/conversations/", json={
+        "user_id": user["id"], "title": "Benchmark"})).raise_for_status().json()
+    message = (await client.post(f"{V1}/messages/", json={
+        "conversation_id": conversation["id"], "sender_type": "user",
+        "content": "Planning a trip to Lisbon"})).raise_for_status().json()
+    ids.update(bench_user=user["id"], bench_username=user["username"],
+               bench_conversation=conversation["id"], bench_message=message["id"])
+
+
+async def drop_bench_users():
+    async with AsyncSessionLocal() as session:
+        await session.execute(text(
+            "DELETE FROM users WHERE username LIKE :prefix || '%' "
+            "AND username NOT LIKE :prefix || 'load_%'"), {"prefix": PREFIX})
+        await session.commit()
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=GENERATOR.parent,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> bool:
+    """Print each endpoint's change against the baseline; True if any p95 regressed"""
+    regressed = False
+    print(f"{'endpoint':28} {'p95 ms':>18} {'change':>8} {'req/s':>18}", file=sys.stderr)
+    for name, result in report["endpoints"].items():
+        before = baseline["endpoints"].get(name)
+        if before is None:
+            continue
+        change = (result["p95_ms"] / before["p95_ms"] - 1) * 100 if before["p95_ms"] else 0.0
+        slower = change > threshold
+        regressed |= slower
+        print(f"{name:28} {before['p95_ms']:>8} -> {result['p95_ms']:<7} {change:>+7.1f}% "
+              f"{before['requests_per_second']:>8} -> {result['requests_per_second']:<7}"
+              f"{'  REGRESSED' if slower else ''}", file=sys.stderr)
+    return regressed
+
+
+async def run(args) -> dict:
+    await seed(args.scale)
+    ids = await sample_ids(args.seed)
+
+    served = app
+    if not settings.query_stats_enabled:
+        for target in filter(None, (engine, read_engine)):
+            instrument_engine(target.sync_engine)
+        served = QueryStatsMiddleware(app)
+    server = uvicorn.Server(uvicorn.Config(
+        served, host="127.0.0.1", port=args.port, log_level="warning"))
+    serve_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    selected = [endpoint for endpoint in ENDPOINTS
+                if not args.only or any(endpoint.name.startswith(name) for name in args.only)]
+    results = {}
+    limits = httpx.Limits(max_connections=args.concurrency + 5)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}",
+                                     timeout=60, limits=limits) as client:
+            await setup_bench_user(client, ids)
+            for endpoint in selected:
+                results[endpoint.name] = await measure(client, endpoint, ids, args)
+                print(f"{endpoint.name}: p95 {results[endpoint.name]['p95_ms']} ms, "
+                      f"{results[endpoint.name]['requests_per_second']} req/s", file=sys.stderr)
+    finally:
+        await drop_bench_users()
+        server.should_exit = True
+        await serve_task
+
+    async with AsyncSessionLocal() as session:
+        rows = {table: await session.scalar(text(f"SELECT count(*) FROM {table}"))
+                for table in ("users", "conversations", "messages", "entities")}
+    return {
+        "commit": git_commit(),
+        "rows": rows,
+        "config": {"requests": args.requests, "concurrency": args.concurrency,
+                   "warmup": args.warmup, "seed": args.seed},
+        "endpoints": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=int, default=100000,
+                        help="messages the database should hold at least")
+    parser.add_argument("--requests", type=int, default=500, help="measured requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=20, help="clients in flight")
+    parser.add_argument("--warmup", type=int, default=50, help="unmeasured requests first")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="+", metavar="NAME",
+                        help="endpoints whose names start with one of these, e.g. users auth.login")
+    parser.add_argument("--output", type=Path, default=Path("http_suite.json"))
+    parser.add_argument("--compare", type=Path, metavar="REPORT",
+                        help="a saved report to compare p95 latency against")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="percent slower p95 that counts as a regression")
+    parser.add_argument("--port", type=int, default=8768)
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    args.output.write_text(json.dumps(report, indent=2) + "\n")
+    print(json.dumps(report, indent=2))
+    if args.compare and compare(report, json.loads(args.compare.read_text()), args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
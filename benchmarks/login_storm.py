@@ -0,0 +1,130 @@
+"""Login storm load test
+
+Drives concurrent logins against the app in-process while probing a cheap
+non-auth endpoint, and reports the probe's latency percentiles. With hashing
+on the pool the probe's p99 should stay flat; --inline runs bcrypt on the
+event loop again for comparison.
+
+Requires the configured database and httpx:
+
+    python -m benchmarks.login_storm --logins 200 --concurrency 50
+    python -m benchmarks.login_storm --inline
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+
+import httpx
+
+from app.main import app
+from app.core import hash_pool
+from app.core.config import settings
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 95) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 2) if samples else 0.0,
+    }
+
+
+async def probe(client, url, stop, samples, interval=0.005):
+    # Latency is measured from when the probe was due to start, so time the
+    # event loop spends blocked before scheduling it is counted too
+    while not stop.is_set():
+        due = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        await client.get(url)
+        samples.append(time.perf_counter() - due)
+
+
+async def login_worker(client, queue, credentials, statuses):
+    while True:
+        try:
+            queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        response = await client.post("/auth/login", data=credentials)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+
+async def run(args):
+    if args.inline:
+        async def inline_job(operation, fn, *fn_args):
+            return fn(*fn_args)
+        hash_pool.run_password_job = inline_job
+        import app.core.auth as auth
+        auth.run_password_job = inline_job
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        username = f"storm_{uuid.uuid4().hex[:8]}"
+        credentials = {"username": username, "password": "storm-password"}
+        response = await client.post("/auth/register", json={
+            "username": username,
+            "email": f"{username}@example.com",
+            "password": credentials["password"],
+        })
+        response.raise_for_status()
+
+        health_url = f"{settings.api_v1_prefix}/health"
+        baseline, stop = [], asyncio.Event()
+        task = asyncio.create_task(probe(client, health_url, stop, baseline))
+        await asyncio.sleep(args.baseline_seconds)
+        stop.set()
+        await task
+
+        queue = asyncio.Queue()
+        for _ in range(args.logins):
+            queue.put_nowait(None)
+        storm, statuses, stop = [], {}, asyncio.Event()
+        task = asyncio.create_task(probe(client, health_url, stop, storm))
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            login_worker(client, queue, credentials, statuses)
+            for _ in range(args.concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await task
+
+    hash_pool.shutdown_hash_pool()
+    report = {
+        "mode": "inline" if args.inline else settings.password_hash_executor,
+        "workers": settings.password_hash_workers,
+        "logins": args.logins,
+        "concurrency": args.concurrency,
+        "login_statuses": statuses,
+        "logins_per_second": round(args.logins / elapsed, 1),
+        "probe_baseline": summarize(baseline),
+        "probe_during_storm": summarize(storm),
+    }
+    print(json.dumps(report, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--baseline-seconds", type=float, default=2.0)
+    parser.add_argument("--inline", action="store_true",
+                        help="hash on the event loop instead of the pool")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Message search latency on a large messages table
+
+Seeds --messages messages (2 million by default) across --conversations
+conversations, built from a travel vocabulary with a skewed word frequency,
+so queries range from rare to very common terms. Then times, per query:
+
+- search: find_messages(), full-text through the GIN index, first page
+- next_page: the second page, through the (rank, id) keyset cursor
+- conversation: the same search filtered to one conversation
+- fuzzy: trigram search with a misspelled query (skipped without pg_trgm)
+- ilike: the ILIKE '%word%' scan support runs today, for the query's first
+  word, newest matches first
+
+Requires the configured database. Seeded rows are removed afterwards.
+
+    python -m benchmarks.message_search --messages 2000000
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from sqlalchemy import select, text
+
+from app.core.search import find_messages
+from app.database.database import AsyncSessionLocal, engine
+from app.models import Message
+
+PREFIX = "search_bench_"
+
+# Earlier words are much more frequent than later ones
+VOCABULARY = [
+    "trip", "hotel", "day", "beach", "Bali", "food", "good", "week", "price", "time",
+    "Ubud", "temple", "villa", "pool", "night", "tour", "driver", "airport", "flight",
+    "restaurant", "sunset", "rice", "terraces", "waterfall", "Seminyak", "Canggu",
+    "surfing", "yoga", "market", "scooter", "massage", "breakfast", "family", "kids",
+    "budget", "luxury", "quiet", "crowded", "rain", "season", "Lombok", "Gili",
+    "snorkeling", "diving", "volcano", "sunrise", "trek", "Batur", "monkey", "forest",
+    "cooking", "class", "coffee", "plantation", "ferry", "island", "Penida", "manta",
+    "rays", "Uluwatu", "cliff", "kecak", "dance", "Amed", "shipwreck", "Tulamben",
+    "Sidemen", "Munduk", "Lovina", "dolphins", "Menjangan", "Pemuteran",
+]
+# Appended to one message in RARE_EVERY
+RARE_WORD = "Jatiluwih"
+RARE_EVERY = 50000
+QUERIES = {
+    "common": "bali beach",
+    "medium": "sunrise trek",
+    "phrase": '"cooking class"',
+    "uncommon": "Pemuteran",
+    "rare": RARE_WORD,
+}
+FUZZY_QUERIES = {"typo": "snorkling", "typo_rare": "Jatilwih"}
+
+
+async def seed(messages: int, conversations: int, words: int) -> int:
+    async with engine.begin() as conn:
+        user_id = (await conn.execute(text(
+            "INSERT INTO users (username, email, hashed_password, is_active) "
+            "VALUES (:name, :email, 'x', true) RETURNING id"
+        ), {"name": PREFIX + "user", "email": PREFIX + "user@example.com"})).scalar()
+        await conn.execute(text(
+            "INSERT INTO conversations (user_id, title, is_active) "
+            "SELECT :user_id, 'Trip ' || g, true FROM generate_series(1, :conversations) AS g"
+        ), {"user_id": user_id, "conversations": conversations})
+    first = await _first_conversation(user_id)
+    batch = 200000
+    for start in range(0, messages, batch):
+        async with engine.begin() as conn:
+            await conn.execute(text(
+                "INSERT INTO messages (conversation_id, sender_type, content, created_at) "
+                "SELECT :first + g % :conversations, "
+                "CASE WHEN g % 2 = 0 THEN 'user' ELSE 'ai' END, "
+                "(SELECT string_agg((CAST(:words AS text[]))"
+                "[1 + floor(:count * power(random(), 3))::int], ' ') "
+                " FROM generate_series(1, :length - 2 + g % 5)) "
+                "|| CASE WHEN g % :rare_every = 0 THEN ' ' || :rare ELSE '' END, "
+                "now() - (:messages - g) * interval '1 second' "
+                "FROM generate_series(CAST(:start AS integer), CAST(:stop AS integer)) AS g"
+            ), {"first": first, "conversations": conversations, "words": VOCABULARY,
+                "count": len(VOCABULARY), "length": words,
+                "rare": RARE_WORD, "rare_every": RARE_EVERY, "messages": messages,
+                "start": start + 1, "stop": min(start + batch, messages)})
+    async with engine.begin() as conn:
+        await conn.execute(text("ANALYZE messages"))
+    return first
+
+
+async def _first_conversation(user_id: int) -> int:
+    async with engine.connect() as conn:
+        return (await conn.execute(text(
+            "SELECT min(id) FROM conversations WHERE user_id = :user_id"
+        ), {"user_id": user_id})).scalar()
+
+
+async def has_trigram() -> bool:
+    async with engine.connect() as conn:
+        return bool((await conn.execute(text(
+            "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"))).scalar())
+
+
+async def timed(call, repeat: int) -> dict:
+    timings, rows = [], 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = await call()
+        timings.append(time.perf_counter() - started)
+    return {"median_ms": round(statistics.median(timings) * 1000, 2), "rows": rows}
+
+
+async def run(args):
+    report = {}
+    try:
+        first = await seed(args.messages, args.conversations, args.words)
+        trigram = await has_trigram()
+        async with AsyncSessionLocal() as session:
+            async def search(q, **kwargs):
+                items, _ = await find_messages(session, q, limit=args.limit, **kwargs)
+                return len(items)
+
+            async def next_page(q, cursor):
+                items, _ = await find_messages(session, q, cursor=cursor, limit=args.limit)
+                return len(items)
+
+            async def ilike(q):
+                result = await session.execute(
+                    select(Message.id).where(Message.content.ilike(f"%{q}%"))
+                    .order_by(Message.created_at.desc()).limit(args.limit))
+                return len(result.all())
+
+            for name, q in QUERIES.items():
+                plain = q.strip('"').split()[0]
+                _, cursor = await find_messages(session, q, limit=args.limit)
+                report[name] = {
+                    "search": await timed(lambda: search(q), args.repeat),
+                    "next_page": await timed(lambda: next_page(q, cursor), args.repeat),
+                    "conversation": await timed(
+                        lambda: search(q, conversation_id=first), args.repeat),
+                    "ilike": await timed(lambda: ilike(plain), args.repeat),
+                }
+            for name, q in FUZZY_QUERIES.items():
+                report[name] = {
+                    "fuzzy": await timed(lambda: search(q, fuzzy=True), args.repeat)
+                    if trigram else "skipped: pg_trgm is not installed",
+                }
+    finally:
+        async with engine.begin() as conn:
+            await conn.execute(text("DELETE FROM users WHERE username = :name"),
+                               {"name": PREFIX + "user"})
+        await engine.dispose()
+    print(json.dumps(report, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000000)
+    parser.add_argument("--conversations", type=int, default=20000)
+    parser.add_argument("--words", type=int, default=12, help="average words per message")
+    parser.add_argument("--limit", type=int, default=20, help="page size")
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
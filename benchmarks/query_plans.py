@@ -0,0 +1,187 @@
+"""Query plans and latency of the foreign key lookups, with and without indexes
+
+Seeds users, conversations, messages and entities, then runs the statements
+behind get_user_conversations, get_conversation_messages,
+get_message_entities and get_entities_by_type under EXPLAIN ANALYZE. It does
+this twice: once with the composite indexes from the models dropped, and
+once with them created. For each query it reports the plan's scan nodes and
+the median execution time.
+
+The indexes are dropped and recreated in place, so only run this against a
+development database. Seeded rows are removed afterwards.
+
+    python -m benchmarks.query_plans --users 1000 --conversations 5 --messages 40
+"""
+import argparse
+import asyncio
+import json
+import statistics
+
+from sqlalchemy import select, text
+from sqlalchemy.dialects import postgresql
+
+from app.core.dictionary import intern_entities
+from app.database.database import engine
+from app.models import Conversation, Entity, Message
+
+PREFIX = "plan_bench_"
+
+# The indexes this benchmark compares; all are declared on the models
+INDEXES = {
+    "ix_conversations_user_id_created_at_id": Conversation,
+    "ix_messages_conversation_id_created_at_id": Message,
+    "ix_entities_message_id_id": Entity,
+    "ix_entities_type_id_value_id": Entity,
+}
+
+TYPES = ["location", "activity", "time", "budget"]
+
+
+async def seed(conn, args):
+    await conn.execute(text(
+        "INSERT INTO users (username, email, hashed_password) "
+        "SELECT :prefix || n, :prefix || n || '@bench.local', 'x' "
+        "FROM generate_series(1, :users) AS n"
+    ), {"prefix": PREFIX, "users": args.users})
+    await conn.execute(text(
+        "INSERT INTO conversations (user_id, title, created_at) "
+        "SELECT u.id, 'Trip ' || g, now() - g * interval '1 day' "
+        "FROM users u, generate_series(1, :conversations) AS g "
+        "WHERE u.username LIKE :prefix || '%'"
+    ), {"prefix": PREFIX, "conversations": args.conversations})
+    await conn.execute(text(
+        "INSERT INTO messages (conversation_id, sender_type, content, created_at) "
+        "SELECT c.id, CASE WHEN g % 2 = 0 THEN 'user' ELSE 'ai' END, "
+        "'Where should I stay in Ubud? ' || g, c.created_at + g * interval '1 minute' "
+        "FROM conversations c JOIN users u ON u.id = c.user_id, "
+        "generate_series(1, :messages) AS g "
+        "WHERE u.username LIKE :prefix || '%'"
+    ), {"prefix": PREFIX, "messages": args.messages})
+    pairs = [(type, f"value {n}") for type in TYPES for n in range(200)]
+    interned = await intern_entities(conn, pairs)
+    await conn.execute(text(
+        "INSERT INTO entities (message_id, message_created_at, type_id, value_id) "
+        "SELECT m.id, m.created_at, (CAST(:type_ids AS integer[]))[1 + (m.id % 4) * 200 + m.id % 200], "
+        "(CAST(:value_ids AS integer[]))[1 + (m.id % 4) * 200 + m.id % 200] "
+        "FROM messages m JOIN conversations c ON c.id = m.conversation_id "
+        "JOIN users u ON u.id = c.user_id WHERE u.username LIKE :prefix || '%'"
+    ), {"prefix": PREFIX, "type_ids": [interned[pair][0] for pair in pairs],
+        "value_ids": [interned[pair][1] for pair in pairs]})
+
+
+async def pick_targets(conn) -> dict:
+    row = (await conn.execute(text(
+        "SELECT u.id, c.id, m.id FROM users u "
+        "JOIN conversations c ON c.user_id = u.id "
+        "JOIN messages m ON m.conversation_id = c.id "
+        "WHERE u.username LIKE :prefix || '%' "
+        "ORDER BY u.id DESC, c.id, m.id LIMIT 1"
+    ), {"prefix": PREFIX})).one()
+    pair = ("location", "value 8")
+    type_id, value_id = (await intern_entities(conn, [pair], create=False))[pair]
+    return {"user_id": row[0], "conversation_id": row[1], "message_id": row[2],
+            "type_id": type_id, "value_id": value_id}
+
+
+def route_queries(targets: dict) -> dict:
+    """The statements the routes issue, with the seeded ids bound"""
+    return {
+        "get_user_conversations": select(Conversation)
+        .where(Conversation.user_id == targets["user_id"])
+        .order_by(Conversation.created_at.asc(), Conversation.id.asc()),
+        "get_conversation_messages": select(Message)
+        .where(Message.conversation_id == targets["conversation_id"])
+        .order_by(Message.created_at.asc(), Message.id.asc()),
+        "get_message_entities": select(Entity)
+        .where(Entity.message_id == targets["message_id"])
+        .order_by(Entity.id.asc()),
+        "get_entities_by_type_and_value": select(Entity)
+        .where(Entity.type_id == targets["type_id"], Entity.value_id == targets["value_id"]),
+    }
+
+
+def scan_nodes(plan: dict) -> list:
+    nodes = []
+    if "Scan" in plan["Node Type"]:
+        node = plan["Node Type"]
+        if "Relation Name" in plan:
+            node += f" on {plan['Relation Name']}"
+        if "Index Name" in plan:
+            node += f" using {plan['Index Name']}"
+        nodes.append(node)
+    for child in plan.get("Plans", []):
+        nodes.extend(scan_nodes(child))
+    return nodes
+
+
+async def explain(conn, stmt, repeat: int) -> dict:
+    sql = str(stmt.compile(dialect=postgresql.dialect(),
+                           compile_kwargs={"literal_binds": True}))
+    timings, plan = [], None
+    for _ in range(repeat):
+        result = await conn.execute(text(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}"))
+        output = result.scalar()
+        output = json.loads(output) if isinstance(output, str) else output
+        plan = output[0]
+        timings.append(plan["Execution Time"])
+    return {
+        "plan": scan_nodes(plan["Plan"]),
+        "rows": plan["Plan"]["Actual Rows"],
+        "median_ms": round(statistics.median(timings), 3),
+    }
+
+
+async def set_indexes(present: bool):
+    async with engine.begin() as conn:
+        for name, model in INDEXES.items():
+            index = next(i for i in model.__table__.indexes if i.name == name)
+            if present:
+                await conn.run_sync(index.create, checkfirst=True)
+            else:
+                await conn.run_sync(index.drop, checkfirst=True)
+        for table in ("conversations", "messages", "entities"):
+            await conn.execute(text(f"ANALYZE {table}"))
+
+
+async def run(args):
+    async with engine.begin() as conn:
+        await seed(conn, args)
+    try:
+        async with engine.connect() as conn:
+            targets = await pick_targets(conn)
+        queries = route_queries(targets)
+        report = {"seeded": {
+            "users": args.users,
+            "conversations": args.users * args.conversations,
+            "messages": args.users * args.conversations * args.messages,
+        }}
+        for label, present in (("without_indexes", False), ("with_indexes", True)):
+            await set_indexes(present)
+            async with engine.connect() as conn:
+                report[label] = {
+                    name: await explain(conn, stmt, args.repeat)
+                    for name, stmt in queries.items()
+                }
+    finally:
+        await set_indexes(True)
+        async with engine.begin() as conn:
+            await conn.execute(text(
+                "DELETE FROM users WHERE username LIKE :prefix || '%'"
+            ), {"prefix": PREFIX})
+        await engine.dispose()
+    print(json.dumps(report, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--conversations", type=int, default=5,
+                        help="conversations per user")
+    parser.add_argument("--messages", type=int, default=40,
+                        help="messages per conversation")
+    parser.add_argument("--repeat", type=int, default=15)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Throughput of the nested get_users payload, with and without the fast path
+
+Seeds users with conversations, messages and entities, then requests
+/users/?expand=conversations.messages.entities repeatedly in-process, first
+through the response model path and then with FAST_JSON_RESPONSES, which
+builds the payload from column tuples and encodes it with orjson. Reports
+requests per second and latency for each, and checks both return the same
+payload.
+
+Requires the configured database and httpx. Seeded rows are removed afterwards.
+
+    python -m benchmarks.serialization --users 100 --requests 50
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import httpx
+from sqlalchemy import text
+
+from app.main import app
+from app.core.config import settings
+from app.core.dictionary import intern_entities
+from app.database.database import engine
+
+PREFIX = "serial_bench_"
+
+
+async def seed(args):
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            "INSERT INTO users (username, email, hashed_password, is_active) "
+            "SELECT :prefix || n, :prefix || n || '@bench.local', 'x', true "
+            "FROM generate_series(1, :users) AS n"
+        ), {"prefix": PREFIX, "users": args.users})
+        await conn.execute(text(
+            "INSERT INTO conversations (user_id, title, is_active) "
+            "SELECT u.id, 'Trip ' || g, true FROM users u, "
+            "generate_series(1, :conversations) AS g "
+            "WHERE u.username LIKE :prefix || '%'"
+        ), {"prefix": PREFIX, "conversations": args.conversations})
+        await conn.execute(text(
+            "INSERT INTO messages (conversation_id, sender_type, content) "
+            "SELECT c.id, CASE WHEN g % 2 = 0 THEN 'user' ELSE 'ai' END, "
+            "'Which beaches near Canggu are good for surfing? ' || g "
+            "FROM conversations c JOIN users u ON u.id = c.user_id, "
+            "generate_series(1, :messages) AS g WHERE u.username LIKE :prefix || '%'"
+        ), {"prefix": PREFIX, "messages": args.messages})
+        pair = ("location", "Canggu")
+        type_id, value_id = (await intern_entities(conn, [pair]))[pair]
+        await conn.execute(text(
+            "INSERT INTO entities (message_id, message_created_at, type_id, value_id, "
+            "confidence_score) "
+            "SELECT m.id, m.created_at, :type_id, :value_id, 90 FROM messages m "
+            "JOIN conversations c ON c.id = m.conversation_id "
+            "JOIN users u ON u.id = c.user_id WHERE u.username LIKE :prefix || '%'"
+        ), {"prefix": PREFIX, "type_id": type_id, "value_id": value_id})
+
+
+async def drop_seed():
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            "DELETE FROM users WHERE username LIKE :prefix || '%'"), {"prefix": PREFIX})
+
+
+async def measure(client, params, requests: int) -> tuple:
+    latencies = []
+    body = None
+    started = time.perf_counter()
+    for _ in range(requests):
+        t0 = time.perf_counter()
+        response = await client.get(f"{settings.api_v1_prefix}/users/", params=params)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - t0)
+        body = response.content
+    elapsed = time.perf_counter() - started
+    return {
+        "requests_per_second": round(requests / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2),
+        "response_kb": round(len(body) / 1024, 1),
+    }, json.loads(body)
+
+
+async def run(args):
+    await seed(args)
+    params = {"expand": "conversations.messages.entities", "limit": args.users}
+    report = {"payload": {
+        "users": args.users,
+        "messages": args.users * args.conversations * args.messages,
+    }}
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            payloads = {}
+            for label, fast in (("response_model", False), ("fast_path", True)):
+                settings.fast_json_responses = fast
+                await measure(client, params, 2)  # warm up
+                report[label], payloads[label] = await measure(
+                    client, params, args.requests)
+            report["same_payload"] = payloads["response_model"] == payloads["fast_path"]
+    finally:
+        await drop_seed()
+        await engine.dispose()
+    report["speedup"] = round(
+        report["fast_path"]["requests_per_second"]
+        / report["response_model"]["requests_per_second"], 2)
+    print(json.dumps(report, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--conversations", type=int, default=5,
+                        help="conversations per user")
+    parser.add_argument("--messages", type=int, default=20,
+                        help="messages per conversation")
+    parser.add_argument("--requests", type=int, default=50)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
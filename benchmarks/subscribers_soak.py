@@ -0,0 +1,197 @@
+"""Soak test for live conversation subscriptions
+
+Starts one uvicorn worker in a subprocess and opens thousands of SSE
+subscriptions to one conversation, using plain sockets so the client stays
+light. It then posts messages and checks that every subscriber receives
+every message. Reports fan-out latency, the worker's RSS, and how many
+deliberately stalled subscribers the broker dropped.
+
+Requires the configured database and httpx:
+
+    python -m benchmarks.subscribers_soak --subscribers 2000 --messages 50
+    python -m benchmarks.subscribers_soak --subscribers 50 --slow-subscribers 20 \
+        --payload-bytes 100000 --messages 200 --queue-size 32
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+
+from app.core.config import settings
+
+
+class Subscriber:
+    """Minimal SSE client that records when each message id arrives"""
+
+    def __init__(self, host: str, port: int, path: str, read: bool = True):
+        self.host, self.port, self.path, self.read = host, port, path, read
+        self.received = {}
+        self.ready = asyncio.Event()
+        self.closed = False
+
+    async def run(self):
+        reader, writer = await asyncio.open_connection(
+            self.host, self.port, limit=2 ** 20)
+        writer.write(
+            f"GET {self.path} HTTP/1.1\r\nHost: {self.host}\r\n"
+            "Accept: text/event-stream\r\n\r\n".encode())
+        await writer.drain()
+        await reader.readuntil(b"\r\n\r\n")
+        self.ready.set()
+        if not self.read:
+            # Stalled client: keep the socket open without reading from it
+            await asyncio.Event().wait()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.startswith(b"id: "):
+                    self.received[int(line[4:])] = time.perf_counter()
+        finally:
+            self.closed = True
+            writer.close()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return round(int(line.split()[1]) / 1024, 1)
+    return 0.0
+
+
+async def server_metric(client: httpx.AsyncClient, name: str) -> float:
+    text = (await client.get(f"{settings.api_v1_prefix}/metrics")).text
+    for line in text.splitlines():
+        if line.startswith(name + " "):
+            return float(line.split()[1])
+    return 0.0
+
+
+async def wait_for_server(client: httpx.AsyncClient):
+    for _ in range(200):
+        try:
+            await client.get(f"{settings.api_v1_prefix}/health")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+async def run(args):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", args.host,
+         "--port", str(args.port), "--log-level", "warning"],
+        env={**os.environ, "PUBSUB_QUEUE_SIZE": str(args.queue_size)},
+    )
+    tasks = []
+    try:
+        base_url = f"http://{args.host}:{args.port}"
+        async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+            await wait_for_server(client)
+            prefix = settings.api_v1_prefix
+            name = f"soak_{uuid.uuid4().hex[:8]}"
+            user = (await client.post(f"{prefix}/users/", json={
+                "username": name, "email": f"{name}@example.com", "password": "x"})).json()
+            conversation = (await client.post(f"{prefix}/conversations/", json={
+                "user_id": user["id"], "title": "soak"})).json()
+            path = f"{prefix}/messages/conversation/{conversation['id']}/events"
+            rss_before = rss_mb(server.pid)
+
+            subscribers = [Subscriber(args.host, args.port, path)
+                           for _ in range(args.subscribers)]
+            stalled = [Subscriber(args.host, args.port, path, read=False)
+                       for _ in range(args.slow_subscribers)]
+            connect_started = time.perf_counter()
+            # Each subscription checks out a connection briefly while it is
+            # set up, so connect in batches well below the pool size
+            for start in range(0, len(subscribers + stalled), args.connect_batch):
+                batch = (subscribers + stalled)[start:start + args.connect_batch]
+                tasks += [asyncio.create_task(s.run()) for s in batch]
+                await asyncio.gather(*(s.ready.wait() for s in batch))
+            connect_seconds = time.perf_counter() - connect_started
+            rss_subscribed = rss_mb(server.pid)
+
+            sent = {}
+            content = "x" * args.payload_bytes
+            for _ in range(args.messages):
+                started = time.perf_counter()
+                message = (await client.post(f"{prefix}/messages/", json={
+                    "conversation_id": conversation["id"],
+                    "sender_type": "ai", "content": content})).json()
+                sent[message["id"]] = started
+                await asyncio.sleep(args.interval)
+
+            deadline = time.perf_counter() + args.timeout
+            while time.perf_counter() < deadline and any(
+                    len(s.received) < len(sent) for s in subscribers):
+                await asyncio.sleep(0.1)
+
+            latencies = [s.received[id] - sent[id]
+                         for s in subscribers for id in sent if id in s.received]
+            complete = sum(len(s.received) == len(sent) for s in subscribers)
+            report = {
+                "subscribers": args.subscribers,
+                "messages": len(sent),
+                "connect_seconds": round(connect_seconds, 2),
+                "subscribers_with_every_message": complete,
+                "deliveries": len(latencies),
+                "fanout_p50_ms": round(statistics.median(latencies) * 1000, 2) if latencies else None,
+                "fanout_p99_ms": round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+                "server_rss_mb": {"idle": rss_before, "subscribed": rss_subscribed,
+                                  "after_messages": rss_mb(server.pid)},
+                "stalled_subscribers": args.slow_subscribers,
+                "dropped_by_broker": await server_metric(
+                    client, "pubsub_subscribers_dropped_total"),
+            }
+            await client.delete(f"{prefix}/users/{user['id']}")
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+    print(json.dumps(report, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--subscribers", type=int, default=2000)
+    parser.add_argument("--slow-subscribers", type=int, default=0,
+                        help="subscribers that never read, to exercise backpressure")
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--payload-bytes", type=int, default=200)
+    parser.add_argument("--interval", type=float, default=0.05,
+                        help="seconds between posted messages")
+    parser.add_argument("--queue-size", type=int, default=settings.pubsub_queue_size)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--connect-batch", type=int, default=25,
+                        help="subscriptions opened concurrently")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
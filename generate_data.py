@@ -0,0 +1,348 @@
+"""Generate synthetic users, conversations, messages and entities for load testing
+
+Adds --users users, --conversations conversations and --messages messages to
+the configured database, plus about --entities-per-message entities for
+each message. Their sizes are skewed the way real traffic is: a few users
+have most of the conversations, conversation lengths are log-normal, and AI
+replies are several times longer than user messages. Timestamps are spread
+over the --days days up to --end.
+
+Rows go in through COPY, one batch of about --batch-size messages per
+transaction. A batch holds whole users, with their conversations, messages
+and entities, so every committed batch is consistent on its own.
+--workers processes build batches while as many connections copy them.
+Every user shares one precomputed password hash (of --password).
+
+The same --seed gives the same rows. Ids are reserved from the tables'
+sequences up front, so on an empty database they match too. Run it while
+nothing else writes: a concurrent insert could take an id between the
+reservation's two steps. The tables must exist (alembic upgrade head); the
+monthly partitions the timestamps need are created first. Rollups of the
+new entities are marked stale and rebuilt by the rollup worker.
+
+    python generate_data.py --users 100000 --conversations 1000000 --messages 10000000
+"""
+import argparse
+import asyncio
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import date, datetime, time as day_start, timedelta, timezone
+from itertools import accumulate
+from typing import Dict, List, Tuple
+
+from sqlalchemy import text
+
+from app.core.auth import get_password_hash
+from app.core.dictionary import intern_entities
+from app.database.database import AsyncSessionLocal, engine
+from app.models.partition import PARTITIONED_TABLES
+
+FIRST_NAMES = ["Ana", "Ben", "Chen", "Dewi", "Emma", "Farid", "Giulia", "Hiro", "Ines",
+               "Jonas", "Kemal", "Lena", "Mateo", "Nadia", "Omar", "Priya", "Quinn",
+               "Rosa", "Sven", "Tariq", "Uma", "Viktor", "Wen", "Yusuf", "Zoe"]
+LAST_NAMES = ["Smith", "Garcia", "Wang", "Santoso", "Muller", "Rossi", "Tanaka", "Silva",
+              "Kowalski", "Nguyen", "Haddad", "Jensen", "Okafor", "Petrov", "Costa"]
+
+VALUES = {
+    "location": ["Bali", "Paris", "Tokyo", "Rome", "Barcelona", "Lisbon", "New York",
+                 "Bangkok", "Kyoto", "Istanbul", "Cape Town", "Reykjavik", "Ubud",
+                 "Marrakech", "Hanoi", "Cusco", "Santorini", "Queenstown", "Banff",
+                 "Zanzibar", "Swiss Alps", "Amalfi Coast", "Patagonia", "Seoul"],
+    "activity": ["surfing", "diving", "hiking", "food tour", "museum visit", "yoga",
+                 "skiing", "wine tasting", "city tour", "snorkeling", "cooking class",
+                 "safari", "kayaking", "temple tour", "shopping"],
+    "time": ["January", "March", "May", "July", "August", "October", "December",
+             "next month", "this weekend", "5 days", "2 weeks", "dry season"],
+    "budget": ["$500", "$1,000", "$2,000", "$5,000", "budget", "mid-range", "luxury"],
+    "accommodation": ["hostel", "boutique hotel", "resort", "villa", "guesthouse",
+                      "apartment", "campsite"],
+}
+
+USER_SENTENCES = [
+    template.format(place=place, activity=activity)
+    for place in VALUES["location"] for activity in VALUES["activity"]
+    for template in (
+        "What are the best places for {activity} in {place}?",
+        "Is {place} good for {activity} this time of year?",
+        "How many days do I need in {place}?",
+        "Can you suggest a cheap {activity} option near {place}?",
+        "I'm thinking about {place}, mostly for {activity}.",
+    )
+]
+AI_SENTENCES = [
+    template.format(place=place, activity=activity)
+    for place in VALUES["location"] for activity in VALUES["activity"]
+    for template in (
+        "{place} is one of the most popular destinations for {activity}.",
+        "Most visitors to {place} book {activity} a few days in advance.",
+        "Prices for {activity} in {place} vary a lot between high and low season.",
+        "If you stay near the center of {place}, {activity} is easy to reach by public transport.",
+        "Local guides in {place} often combine {activity} with a half-day tour.",
+        "The weather in {place} can change quickly, so plan {activity} for the morning.",
+    )
+]
+TITLE_TEMPLATES = ["Trip to {place}", "{place} itinerary", "Planning {place}",
+                   "Weekend in {place}", "{place} on a budget"]
+
+
+@dataclass(frozen=True)
+class Plan:
+    """What every batch needs to build its rows"""
+    seed: int
+    prefix: str
+    hashed_password: str
+    start: datetime
+    end: datetime
+    entities_per_message: float
+    # (type id, value id) pairs, with cumulative weights for choosing one
+    pairs: Tuple[Tuple[int, int], ...]
+    cum_weights: Tuple[float, ...]
+
+
+@dataclass
+class Batch:
+    """Whole users, with their ids and the size of everything under them"""
+    index: int
+    first_user: int
+    conversations: List[int]  # per user
+    first_conversation: int
+    messages: List[int]  # per conversation
+    first_message: int
+    first_entity: int = 0
+    entities: int = 0
+
+
+def _allocate(rng: random.Random, total: int, weights: List[float], minimum: int) -> List[int]:
+    """Split `total` into len(weights) counts of at least `minimum`, proportional to weights"""
+    scale = (total - minimum * len(weights)) / sum(weights)
+    counts = [minimum + int(weight * scale) for weight in weights]
+    for index in rng.sample(range(len(counts)), total - sum(counts)):
+        counts[index] += 1
+    return counts
+
+
+def _entity_counts(plan: Plan, batch: Batch) -> List[int]:
+    """Entities of each message in the batch; the same every time it is called"""
+    rng = random.Random(f"{plan.seed}:entities:{batch.index}")
+    messages = sum(batch.messages)
+    # Mostly 0 to 2, now and then a message that names many things
+    return [int(rng.expovariate(1 / plan.entities_per_message)) if plan.entities_per_message
+            else 0 for _ in range(messages)]
+
+
+def count_entities(plan: Plan, batch: Batch) -> int:
+    return sum(_entity_counts(plan, batch))
+
+
+def _content(rng: random.Random, sentences: List[str], mean: float) -> str:
+    count = max(1, round(rng.lognormvariate(0, 0.6) * mean))
+    return " ".join(rng.choices(sentences, k=count))
+
+
+def build(plan: Plan, batch: Batch) -> Dict[str, list]:
+    """The COPY records of every table for one batch"""
+    rng = random.Random(f"{plan.seed}:rows:{batch.index}")
+    entity_counts = iter(_entity_counts(plan, batch))
+    span = (plan.end - plan.start).total_seconds()
+    rows = {"users": [], "conversations": [], "messages": [], "entities": []}
+    conversation_id, message_id, entity_id = (
+        batch.first_conversation, batch.first_message, batch.first_entity)
+    message_counts = iter(batch.messages)
+
+    for offset, conversations in enumerate(batch.conversations):
+        user_id = batch.first_user + offset
+        joined = plan.start + timedelta(seconds=rng.random() * span * 0.5)
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        rows["users"].append((
+            user_id, f"{plan.prefix}{user_id}", f"{plan.prefix}{user_id}@example.com",
+            name, plan.hashed_password, True, joined, joined))
+
+        for _ in range(conversations):
+            messages = next(message_counts)
+            started = joined + timedelta(
+                seconds=rng.random() * (plan.end - joined).total_seconds())
+            sent = started
+            for number in range(messages):
+                # A user message, then the reply a few seconds later; the
+                # next question comes minutes to hours after that
+                if number % 2 == 0:
+                    if number:
+                        sent += timedelta(seconds=rng.expovariate(1 / 600))
+                    sender, content = "user", _content(rng, USER_SENTENCES, 1.5)
+                else:
+                    sent += timedelta(seconds=rng.uniform(2, 20))
+                    sender, content = "ai", _content(rng, AI_SENTENCES, 5)
+                sent = min(sent, plan.end)
+                rows["messages"].append(
+                    (message_id, conversation_id, sender, content, sent, sent))
+                for _ in range(next(entity_counts)):
+                    type_id, value_id = rng.choices(plan.pairs, cum_weights=plan.cum_weights)[0]
+                    extracted = min(sent + timedelta(seconds=rng.uniform(1, 30)), plan.end)
+                    rows["entities"].append((
+                        entity_id, message_id, sent, type_id, value_id,
+                        rng.randint(60, 100), extracted, extracted))
+                    entity_id += 1
+                message_id += 1
+            title = rng.choice(TITLE_TEMPLATES).format(place=rng.choice(VALUES["location"]))
+            active = plan.end - sent < timedelta(days=30)
+            rows["conversations"].append(
+                (conversation_id, user_id, title, active, started, sent))
+            conversation_id += 1
+    return rows
+
+
+COLUMNS = {
+    "users": ["id", "username", "email", "full_name", "hashed_password", "is_active",
+              "created_at", "updated_at"],
+    "conversations": ["id", "user_id", "title", "is_active", "created_at", "updated_at"],
+    "messages": ["id", "conversation_id", "sender_type", "content", "created_at",
+                 "updated_at"],
+    "entities": ["id", "message_id", "message_created_at", "type_id", "value_id",
+                 "confidence_score", "created_at", "updated_at"],
+}
+
+# Moves the sequence past `count` ids and returns the first of them
+RESERVE_IDS = text(
+    "SELECT setval(seq::regclass, nextval(seq::regclass) + :count - 1) - :count + 1 "
+    "FROM pg_get_serial_sequence(:table, 'id') AS seq"
+)
+
+
+def plan_batches(args, rng: random.Random) -> List[Batch]:
+    """Sizes of every user and conversation, cut into batches of whole users"""
+    # Pareto weights: most users have one or two conversations, a few have many
+    per_user = _allocate(rng, args.conversations,
+                         [rng.paretovariate(1.5) for _ in range(args.users)], 0)
+    per_conversation = _allocate(rng, args.messages,
+                                 [rng.lognormvariate(0, 1) for _ in range(args.conversations)], 1)
+
+    batches, user, conversation = [], 0, 0
+    while user < args.users:
+        batch = Batch(len(batches), user, [], conversation, [], 0)
+        messages = 0
+        while user < args.users and messages < args.batch_size:
+            counts = per_conversation[conversation:conversation + per_user[user]]
+            batch.conversations.append(per_user[user])
+            batch.messages.extend(counts)
+            messages += sum(counts)
+            conversation += per_user[user]
+            user += 1
+        batches.append(batch)
+    return batches
+
+
+async def _reserve(table: str, count: int) -> int:
+    async with engine.begin() as conn:
+        return await conn.scalar(RESERVE_IDS, {"table": table, "count": count}) if count else 0
+
+
+async def copy_batch(rows: Dict[str, list]):
+    """COPY one batch into every table in a single transaction"""
+    async with engine.connect() as conn:
+        raw = (await conn.get_raw_connection()).driver_connection
+        async with raw.transaction():
+            for table, columns in COLUMNS.items():
+                if rows[table]:
+                    await raw.copy_records_to_table(table, records=rows[table], columns=columns)
+
+
+async def generate(args):
+    started = time.perf_counter()
+    rng = random.Random(args.seed)
+    end = datetime.combine(args.end, day_start(), timezone.utc)
+    start = end - timedelta(days=args.days)
+    loop = asyncio.get_running_loop()
+    try:
+        async with AsyncSessionLocal() as session:
+            pairs = [(type, value) for type, values in VALUES.items() for value in values]
+            interned = await intern_entities(session, pairs)
+            await session.commit()
+        plan = Plan(
+            seed=args.seed, prefix=args.prefix,
+            hashed_password=get_password_hash(args.password),
+            start=start, end=end, entities_per_message=args.entities_per_message,
+            pairs=tuple(interned[pair] for pair in pairs),
+            # Zipf-like within each type: the first values are far more common
+            cum_weights=tuple(accumulate(1 / (rank + 1) for values in VALUES.values()
+                                         for rank in range(len(values)))),
+        )
+        batches = plan_batches(args, rng)
+
+        with ProcessPoolExecutor(args.workers) as pool:
+            entity_counts = await asyncio.gather(*(
+                loop.run_in_executor(pool, count_entities, plan, batch) for batch in batches))
+            first = {table: await _reserve(table, count) for table, count in (
+                ("users", args.users), ("conversations", args.conversations),
+                ("messages", args.messages), ("entities", sum(entity_counts)))}
+            offsets = {"users": 0, "conversations": 0, "messages": 0, "entities": 0}
+            for batch, entities in zip(batches, entity_counts):
+                batch.first_user += first["users"]
+                batch.first_conversation += first["conversations"]
+                batch.first_message = first["messages"] + offsets["messages"]
+                batch.first_entity = first["entities"] + offsets["entities"]
+                batch.entities = entities
+                offsets["messages"] += sum(batch.messages)
+                offsets["entities"] += entities
+
+            async with engine.begin() as conn:
+                for table in PARTITIONED_TABLES:
+                    await conn.execute(
+                        text("SELECT create_monthly_partitions(:table, :first, :last)"),
+                        {"table": table, "first": start.date(), "last": end.date()})
+            print(f"{len(batches)} batches: {args.users} users, {args.conversations} "
+                  f"conversations, {args.messages} messages, {sum(entity_counts)} entities")
+
+            queue: asyncio.Queue = asyncio.Queue()
+            for batch in batches:
+                queue.put_nowait(batch)
+
+            async def work():
+                while not queue.empty():
+                    batch = queue.get_nowait()
+                    rows = await loop.run_in_executor(pool, build, plan, batch)
+                    await copy_batch(rows)
+                    print(f"Batch {batch.index + 1}/{len(batches)}: "
+                          f"{len(rows['messages'])} messages, {len(rows['entities'])} entities "
+                          f"({time.perf_counter() - started:.0f}s)")
+
+            await asyncio.gather(*(work() for _ in range(args.workers)))
+
+        async with engine.begin() as conn:
+            await conn.execute(text("ANALYZE users, conversations, messages, entities"))
+        elapsed = time.perf_counter() - started
+        print(f"Done in {elapsed:.1f}s, {args.messages / elapsed:,.0f} messages/s")
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--conversations", type=int, default=10000)
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--entities-per-message", type=float, default=0.5,
+                        help="mean entities per message")
+    parser.add_argument("--days", type=int, default=365,
+                        help="how far back the timestamps go")
+    parser.add_argument("--end", type=date.fromisoformat, default=date.today(),
+                        help="date the timestamps end at (default: today)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--prefix", default="load_",
+                        help="usernames are the prefix and the user id")
+    parser.add_argument("--password", default="password123")
+    parser.add_argument("--batch-size", type=int, default=50000,
+                        help="about how many messages to copy per transaction")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="processes building batches, and connections copying them")
+    args = parser.parse_args()
+    if args.conversations > args.messages:
+        parser.error("every conversation needs a message: --conversations > --messages")
+    if args.users < 1 or args.conversations < 1:
+        parser.error("--users and --conversations must be at least 1")
+    asyncio.run(generate(args))
+
+
+if __name__ == "__main__":
+    main()
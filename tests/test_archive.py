@@ -0,0 +1,84 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+from app.core.archive import archive_conversation, archive_path
+from app.core.config import settings
+from app.database.database import AsyncSessionLocal
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def archive_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "archive_dir", str(tmp_path))
+
+
+@pytest.fixture
+async def user(client):
+    return (await client.post("/api/v1/users/", json={
+        "username": "alice", "email": "alice@example.com", "password": "secret123"})).json()
+
+
+async def archived_conversation(client, user) -> dict:
+    """A conversation with two messages, one entity, moved to cold storage"""
+    conversation = (await client.post(
+        "/api/v1/conversations/", json={"user_id": user["id"], "title": "Trip"})).json()
+    messages = [(await client.post("/api/v1/messages/", json={
+        "conversation_id": conversation["id"], "sender_type": "user",
+        "content": content})).json() for content in ("Flying to Paris", "Back home")]
+    await client.post("/api/v1/entities/", json={
+        "message_id": messages[0]["id"], "entity_type": "city", "entity_value": "Paris",
+        "confidence_score": 90})
+    await client.put(f"/api/v1/conversations/{conversation['id']}", json={"is_active": False})
+    async with AsyncSessionLocal() as session:
+        assert await archive_conversation(session, conversation["id"], timedelta(0)) == 2
+    assert archive_path(conversation["id"]).exists()
+    return {**conversation, "message_ids": [message["id"] for message in messages]}
+
+
+async def test_get_conversation_rehydrates(client, user):
+    conversation = await archived_conversation(client, user)
+    response = await client.get(f"/api/v1/conversations/{conversation['id']}")
+    assert [m["id"] for m in response.json()["messages"]] == conversation["message_ids"]
+    assert not archive_path(conversation["id"]).exists()
+
+
+async def test_get_message_rehydrates(client, user):
+    conversation = await archived_conversation(client, user)
+    response = await client.get(f"/api/v1/messages/{conversation['message_ids'][1]}")
+    assert response.status_code == 200
+    assert response.json()["content"] == "Back home"
+
+
+async def test_get_message_entities_rehydrates(client, user):
+    conversation = await archived_conversation(client, user)
+    response = await client.get(f"/api/v1/entities/message/{conversation['message_ids'][0]}")
+    assert response.status_code == 200
+    assert ("city", "Paris") in {(e["entity_type"], e["entity_value"]) for e in response.json()}
+
+
+async def test_deleting_user_removes_archives(client, user):
+    conversation = await archived_conversation(client, user)
+    assert (await client.delete(f"/api/v1/users/{user['id']}")).status_code == 200
+    assert not archive_path(conversation["id"]).exists()
+
+
+async def test_deleting_conversation_removes_archive(client, user):
+    conversation = await archived_conversation(client, user)
+    response = await client.delete(f"/api/v1/conversations/{conversation['id']}")
+    assert response.status_code == 200
+    assert not archive_path(conversation["id"]).exists()
+
+
+@pytest.mark.parametrize("target", ["users", "conversations"])
+async def test_background_delete_removes_archives(client, user, target):
+    conversation = await archived_conversation(client, user)
+    target_id = user["id"] if target == "users" else conversation["id"]
+    job = (await client.delete(f"/api/v1/{target}/{target_id}?background=true")).json()
+    while job["status"] in ("pending", "running"):
+        await asyncio.sleep(0.01)
+        job = (await client.get(f"/api/v1/jobs/delete/{job['id']}")).json()
+    assert job["status"] == "completed", job
+    assert not archive_path(conversation["id"]).exists()
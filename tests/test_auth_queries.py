@@ -0,0 +1,101 @@
+"""Query counts of the authentication paths
+
+Login and get_current_user need the user row only. Relationships are
+lazy="raise_on_sql", so loading one by accident fails loudly, but an eager
+option added to these queries would not; these tests catch that.
+"""
+import pytest
+from fastapi import HTTPException
+
+from app.core.auth import create_access_token, get_current_user
+from app.database.database import AsyncSessionLocal
+
+pytestmark = pytest.mark.anyio
+
+USER = {"username": "alice", "email": "alice@example.com", "password": "secret123"}
+
+
+def assert_single_user_select(statements):
+    assert len(statements) == 1, statements
+    statement = statements[0]
+    assert statement.startswith("SELECT")
+    assert "FROM users" in statement
+    assert "JOIN" not in statement
+    assert "conversations" not in statement
+
+
+@pytest.fixture
+async def user(client):
+    response = await client.post("/api/v1/users/", json=USER)
+    assert response.status_code == 200
+    return response.json()
+
+
+async def test_login_selects_only_the_user(client, user, statements):
+    statements.clear()
+    response = await client.post("/auth/login", data={
+        "username": USER["username"], "password": USER["password"]})
+
+    assert response.status_code == 200
+    assert_single_user_select(statements)
+
+
+async def test_failed_login_selects_only_the_user(client, user, statements):
+    statements.clear()
+    response = await client.post("/auth/login", data={
+        "username": USER["username"], "password": "wrong-password"})
+
+    assert response.status_code == 401
+    assert_single_user_select(statements)
+
+
+async def test_current_user_selects_only_the_user_then_is_cached(user, statements):
+    token = create_access_token({"sub": USER["username"]})
+    statements.clear()
+    async with AsyncSessionLocal() as session:
+        principal = await get_current_user(token, session)
+    assert principal.id == user["id"]
+    assert_single_user_select(statements)
+
+    statements.clear()
+    async with AsyncSessionLocal() as session:
+        assert (await get_current_user(token, session)).id == user["id"]
+    assert statements == []
+
+
+@pytest.mark.parametrize("change", [
+    {"is_active": False},
+    {"username": "alice2"},
+])
+async def test_write_racing_a_principal_miss_is_not_cached(client, user, change):
+    token = create_access_token({"sub": USER["username"]})
+    async with AsyncSessionLocal() as session:
+        read = session.execute
+
+        async def read_then_update(*args, **kwargs):
+            result = await read(*args, **kwargs)
+            # Commits and invalidates between the SELECT and caching the result
+            response = await client.put(f"/api/v1/users/{user['id']}", json=change)
+            assert response.status_code == 200
+            return result
+
+        session.execute = read_then_update
+        assert (await get_current_user(token, session)).is_active
+
+    async with AsyncSessionLocal() as session:
+        if "username" in change:
+            with pytest.raises(HTTPException):
+                await get_current_user(token, session)
+        else:
+            assert not (await get_current_user(token, session)).is_active
+
+
+async def test_deleted_user_is_not_served_from_the_cache(client, user):
+    token = create_access_token({"sub": USER["username"]})
+    async with AsyncSessionLocal() as session:
+        await get_current_user(token, session)
+    assert (await client.delete(f"/api/v1/users/{user['id']}")).status_code == 200
+
+    async with AsyncSessionLocal() as session:
+        with pytest.raises(HTTPException):
+            await get_current_user(token, session)
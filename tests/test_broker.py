@@ -0,0 +1,79 @@
+"""Bounded subscriber queues
+
+A subscriber that falls a full queue behind is dropped: publishing never
+waits on it, its queue never grows past the bound, and its stream ends with
+an overflow event so the client reconnects and replays.
+"""
+import asyncio
+
+import pytest
+
+from app.api.messages import _conversation_events
+from app.core.broker import PUBSUB_DROPPED, Broker, broker
+
+pytestmark = pytest.mark.anyio
+
+QUEUE_SIZE = 8
+EVENTS = 1000
+
+
+def event(id: int) -> dict:
+    return {"type": "message", "id": id, "data": "{}"}
+
+
+async def publish_all(broker: Broker, topic: str, keep_up=None):
+    """Publish EVENTS events, letting the `keep_up` subscription read each one first"""
+    for id in range(1, EVENTS + 1):
+        await broker.publish(topic, event(id))
+        while keep_up is not None and not keep_up.queue.empty():
+            await asyncio.sleep(0)
+
+
+async def test_slow_subscriber_is_dropped_without_blocking_publishers():
+    pubsub = Broker(queue_size=QUEUE_SIZE)
+    slow = pubsub.subscribe("conversation:1")
+    fast = pubsub.subscribe("conversation:1")
+    received = []
+
+    async def read():
+        while len(received) < EVENTS:
+            received.append((await fast.get(timeout=1))["id"])
+
+    reader = asyncio.create_task(read())
+    dropped = PUBSUB_DROPPED.value()
+    await asyncio.wait_for(publish_all(pubsub, "conversation:1", keep_up=fast), timeout=5)
+    await asyncio.wait_for(reader, timeout=5)
+
+    assert received == list(range(1, EVENTS + 1))
+    assert slow.overflowed and not fast.overflowed
+    assert slow.queue.qsize() == QUEUE_SIZE
+    assert pubsub.subscriber_count("conversation:1") == 1
+    assert PUBSUB_DROPPED.value() == dropped + 1
+
+
+async def test_dropped_subscriber_drains_then_ends():
+    pubsub = Broker(queue_size=QUEUE_SIZE)
+    slow = pubsub.subscribe("conversation:1")
+    await publish_all(pubsub, "conversation:1")
+
+    drained = []
+    while (item := await slow.get(timeout=1)) is not None:
+        drained.append(item["id"])
+    assert drained == list(range(1, QUEUE_SIZE + 1))
+    assert slow.overflowed
+
+
+async def test_stream_reports_overflow(monkeypatch):
+    monkeypatch.setattr(broker, "queue_size", QUEUE_SIZE)
+    events = _conversation_events(1, after=None)
+    # The generator subscribes on its first read, which then waits for an event
+    first = asyncio.create_task(events.__anext__())
+    while not broker.subscriber_count("conversation:1"):
+        await asyncio.sleep(0)
+    await publish_all(broker, "conversation:1")
+
+    streamed = [(await first)["id"]]
+    async for item in events:
+        streamed.append(item["type"] if item["type"] == "overflow" else item["id"])
+    assert streamed == [*range(1, QUEUE_SIZE + 1), "overflow"]
+    assert broker.subscriber_count("conversation:1") == 0
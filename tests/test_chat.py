@@ -0,0 +1,33 @@
+import pytest
+
+from app.core.chat import chat_pipeline
+from app.core.config import settings
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def conversation(client):
+    user = (await client.post("/api/v1/users/", json={
+        "username": "alice", "email": "alice@example.com", "password": "secret123"})).json()
+    return (await client.post(
+        "/api/v1/conversations/", json={"user_id": user["id"], "title": "Trip"})).json()
+
+
+@pytest.mark.parametrize("backend, api_key", [("gemini", None), ("unknown", "key")])
+async def test_unconfigured_backend_is_unavailable(
+        database, client, conversation, monkeypatch, backend, api_key):
+    monkeypatch.setattr(settings, "chat_backend", backend)
+    monkeypatch.setattr(settings, "gemini_api_key", api_key)
+    monkeypatch.setattr(chat_pipeline, "_backend", None)
+
+    for _ in range(2):
+        response = await client.post(
+            f"/api/v1/messages/conversation/{conversation['id']}/chat",
+            params={"stream": False}, json={"content": "Where to in May?"})
+        assert response.status_code == 503
+        assert "GEMINI_API_KEY" not in response.text
+
+    # Nothing is stored for a rejected turn
+    response = await client.get(f"/api/v1/messages/conversation/{conversation['id']}")
+    assert response.json() == []
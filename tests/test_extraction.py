@@ -0,0 +1,73 @@
+"""The extraction worker isolates messages whose entities cannot be stored
+
+When the batch insert fails, the batch is stored again message by message:
+the other messages keep their entities and the offending one is retried
+until it is marked failed.
+"""
+import pytest
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.extraction import ExtractionWorker
+from app.database.database import AsyncSessionLocal
+from app.models import Entity, ExtractionOutbox
+
+pytestmark = pytest.mark.anyio
+
+
+class OverflowingExtractor:
+    """Scores "Rome" out of the confidence column's range"""
+
+    async def extract(self, contents):
+        return [[("city", city, 2 ** 40 if city == "Rome" else 90)]
+                for city in (content.split()[-1] for content in contents)]
+
+
+@pytest.fixture
+async def messages(client):
+    user = (await client.post("/api/v1/users/", json={
+        "username": "alice", "email": "alice@example.com", "password": "secret123"})).json()
+    conversation = (await client.post(
+        "/api/v1/conversations/", json={"user_id": user["id"], "title": "Trip"})).json()
+    return [(await client.post("/api/v1/messages/", json={
+        "conversation_id": conversation["id"], "sender_type": "user",
+        "content": f"Flying to {city}"})).json() for city in ("Paris", "Rome", "Oslo")]
+
+
+@pytest.fixture
+def worker():
+    worker = ExtractionWorker()
+    worker._extractor = OverflowingExtractor()
+    return worker
+
+
+async def outbox_rows():
+    async with AsyncSessionLocal() as session:
+        return {row.message_id: row for row in (await session.execute(
+            select(ExtractionOutbox.__table__))).all()}
+
+
+async def test_failed_insert_is_isolated_and_retried(database, messages, worker):
+    paris, rome, oslo = (message["id"] for message in messages)
+    assert await worker.run_once() == 3
+
+    async with AsyncSessionLocal() as session:
+        stored = set((await session.execute(select(Entity.message_id))).scalars())
+    assert stored == {paris, oslo}
+
+    rows = await outbox_rows()
+    assert set(rows) == {rome}
+    assert rows[rome].attempts == 1
+    assert rows[rome].last_error
+    assert rows[rome].failed_at is None
+
+
+async def test_failed_insert_reaches_max_attempts(database, messages, worker, monkeypatch):
+    monkeypatch.setattr(settings, "extraction_max_attempts", 1)
+    await worker.run_once()
+
+    rows = await outbox_rows()
+    assert set(rows) == {messages[1]["id"]}
+    assert rows[messages[1]["id"]].failed_at is not None
+    # Failed rows are not claimed again
+    assert await worker.run_once() == 0
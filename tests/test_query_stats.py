@@ -0,0 +1,71 @@
+import asyncio
+import re
+
+import httpx
+import pytest
+from sqlalchemy import text
+
+from app.core.chat import chat_pipeline
+from app.database import query_stats
+from app.database.database import AsyncSessionLocal
+from app.database.query_stats import QueryStatsMiddleware, instrument_engine
+
+pytestmark = pytest.mark.anyio
+
+SERVER_TIMING = re.compile(
+    r'^db;dur=[\d.]+;desc="(\d+) queries", db-pool;dur=[\d.]+(, db-slow\d;dur=[\d.]+)*$')
+
+
+async def select_one():
+    async with AsyncSessionLocal() as session:
+        await session.execute(text("SELECT 1"))
+
+
+@pytest.fixture
+def observed(database, monkeypatch):
+    """The RequestQueries of each request, once the middleware is done with it"""
+    instrument_engine(database.sync_engine)
+    records = []
+    observe = query_stats.RequestQueries.observe
+
+    def record(self):
+        records.append(self)
+        observe(self)
+
+    monkeypatch.setattr(query_stats.RequestQueries, "observe", record)
+    return records
+
+
+async def test_server_timing_has_counts_and_durations_only(observed):
+    async def app(scope, receive, send):
+        await select_one()
+        await select_one()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    transport = httpx.ASGITransport(app=QueryStatsMiddleware(app))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/")
+
+    header = response.headers["server-timing"]
+    assert SERVER_TIMING.match(header), header
+    assert SERVER_TIMING.match(header).group(1) == "2"
+    assert "SELECT" not in header
+    assert observed[0].count == 2
+
+
+async def test_spawned_task_is_not_counted_against_the_request(observed):
+    spawned = []
+
+    async def app(scope, receive, send):
+        await select_one()
+        spawned.append(chat_pipeline.spawn(select_one()))
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    transport = httpx.ASGITransport(app=QueryStatsMiddleware(app))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        await client.get("/")
+    await asyncio.gather(*spawned)
+
+    assert [queries.count for queries in observed] == [1]
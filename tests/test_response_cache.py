@@ -0,0 +1,67 @@
+import time
+
+import pytest
+from starlette.requests import Request
+
+from app.core.cache import MemoryBackend, invalidate_tags
+from app.core.response_cache import cached_response, response_cache
+
+pytestmark = pytest.mark.anyio
+
+
+def make_request(if_none_match=None) -> Request:
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/api/v1/users/1",
+                    "query_string": b"", "headers": headers})
+
+
+def loader(value):
+    async def load():
+        return {"name": value}, []
+    return load
+
+
+async def get(value, if_none_match=None):
+    return await cached_response(
+        make_request(if_none_match), "get_user", dict, ["user:1"], loader(value))
+
+
+def expire_generations():
+    """Act as if the generation TTL passed, leaving the entries in place"""
+    response_cache.backend._generations.expire(
+        time.monotonic() + MemoryBackend.generation_ttl + 1)
+
+
+async def test_hit_until_invalidated():
+    first = await get("before")
+    assert (await get("ignored")).body == first.body
+    await invalidate_tags("user:1")
+    assert (await get("after")).body == b'{"name":"after"}'
+
+
+async def test_expired_generation_does_not_revalidate_stale_entry():
+    await invalidate_tags("user:1")
+    stale = await get("before")
+    expire_generations()
+    await invalidate_tags("user:1")
+
+    fresh = await get("after")
+    assert fresh.body == b'{"name":"after"}'
+    assert fresh.headers["etag"] != stale.headers["etag"]
+
+
+async def test_expired_generation_does_not_answer_304_for_stale_etag():
+    await invalidate_tags("user:1")
+    etag = (await get("before")).headers["etag"]
+    expire_generations()
+    await invalidate_tags("user:1")
+
+    response = await get("after", if_none_match=etag)
+    assert response.status_code == 200
+    assert response.body == b'{"name":"after"}'
+
+
+async def test_matching_etag_is_not_modified():
+    etag = (await get("value")).headers["etag"]
+    response = await get("value", if_none_match=etag)
+    assert response.status_code == 304
@@ -0,0 +1,48 @@
+import pytest
+
+from app.core.search import fuzzy_highlight
+
+XSS = "diving <img src=x onerror=alert(1)> bali"
+
+
+@pytest.fixture
+async def conversation(client):
+    user = (await client.post("/api/v1/users/", json={
+        "username": "alice", "email": "alice@example.com", "password": "secret123"})).json()
+    return (await client.post(
+        "/api/v1/conversations/", json={"user_id": user["id"], "title": "Trip"})).json()
+
+
+@pytest.mark.anyio
+async def test_highlight_escapes_content(client, conversation):
+    for content in (XSS, "reef \x02diving\x03 & <b>snorkeling</b>"):
+        await client.post("/api/v1/messages/", json={
+            "conversation_id": conversation["id"], "sender_type": "user",
+            "content": content})
+
+    response = await client.get("/api/v1/messages/search", params={"q": "diving"})
+    highlights = {hit["content"]: hit["highlight"] for hit in response.json()["items"]}
+    assert highlights[XSS] == "<mark>diving</mark> &lt;img src=x onerror=alert(1)&gt; bali"
+    for highlight in highlights.values():
+        assert highlight.count("<mark>diving</mark>") == 1
+        markup = highlight.replace("<mark>", "").replace("</mark>", "")
+        assert not set("<>\x02\x03") & set(markup), highlight
+
+
+def test_fuzzy_highlight_marks_trigram_matches():
+    assert fuzzy_highlight("Went snorkeling in Bali", "snorkling") == (
+        "Went <mark>snorkeling</mark> in Bali")
+
+
+def test_fuzzy_highlight_escapes_content():
+    assert fuzzy_highlight(XSS, "divng") == (
+        "<mark>diving</mark> &lt;img src=x onerror=alert(1)&gt; bali")
+
+
+def test_fuzzy_highlight_fragments_long_content():
+    words = [f"w{i}" for i in range(100)]
+    words[10], words[80] = "snorkeling", "snorkel"
+    highlight = fuzzy_highlight(" ".join(words), "snorkling")
+    first, second = highlight.split(" ... ")
+    assert "<mark>snorkeling</mark>" in first and "<mark>snorkel</mark>" in second
+    assert len(first.split()) == len(second.split()) == 20
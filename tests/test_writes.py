@@ -0,0 +1,179 @@
+"""Create and update routes write with one INSERT/UPDATE ... RETURNING
+
+Server defaults come back with the write, parent rows are checked by the
+foreign keys, and the IntegrityError is mapped from its SQLSTATE: a unique
+violation (23505) to 400, a missing parent (23503) to 404.
+"""
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+USER = {"username": "alice", "email": "alice@example.com", "password": "secret123"}
+
+
+@pytest.fixture
+async def user(client):
+    response = await client.post("/api/v1/users/", json=USER)
+    assert response.status_code == 200
+    return response.json()
+
+
+@pytest.fixture
+async def conversation(client, user):
+    response = await client.post(
+        "/api/v1/conversations/", json={"user_id": user["id"], "title": "Trip"})
+    assert response.status_code == 200
+    return response.json()
+
+
+@pytest.fixture
+async def message(client, conversation):
+    response = await client.post("/api/v1/messages/", json={
+        "conversation_id": conversation["id"], "sender_type": "user",
+        "content": "Flying to Paris"})
+    assert response.status_code == 200
+    return response.json()
+
+
+def assert_one_statement(statements, verb, table):
+    assert len(statements) == 1, statements
+    assert statements[0].lstrip().startswith(("WITH", verb)), statements[0]
+    assert f"{verb} INTO {table}" in statements[0] or f"{verb} {table}" in statements[0]
+    assert "RETURNING" in statements[0]
+
+
+async def test_create_user(client, statements):
+    response = await client.post("/api/v1/users/", json=USER)
+    assert response.status_code == 200
+    assert response.json()["created_at"] is not None
+    assert_one_statement(statements, "INSERT", "users")
+
+
+async def test_update_user(client, user, statements):
+    statements.clear()
+    response = await client.put(f"/api/v1/users/{user['id']}", json={"full_name": "Alice"})
+    assert response.status_code == 200
+    assert response.json()["full_name"] == "Alice"
+    assert_one_statement(statements, "UPDATE", "users")
+
+
+async def test_empty_user_update_writes_nothing(client, user, statements):
+    statements.clear()
+    response = await client.put(f"/api/v1/users/{user['id']}", json={})
+    assert response.status_code == 200
+    assert response.json()["updated_at"] == user["updated_at"]
+    assert not any("UPDATE" in statement for statement in statements)
+
+    response = await client.put("/api/v1/users/999", json={})
+    assert response.status_code == 404
+
+
+async def test_create_conversation(client, user, statements):
+    statements.clear()
+    response = await client.post(
+        "/api/v1/conversations/", json={"user_id": user["id"], "title": "Trip"})
+    assert response.status_code == 200
+    assert_one_statement(statements, "INSERT", "conversations")
+
+
+async def test_update_conversation(client, conversation, statements):
+    statements.clear()
+    response = await client.put(
+        f"/api/v1/conversations/{conversation['id']}", json={"title": "Holiday"})
+    assert response.status_code == 200
+    assert response.json()["title"] == "Holiday"
+    assert_one_statement(statements, "UPDATE", "conversations")
+
+
+async def test_create_message(client, conversation, statements):
+    statements.clear()
+    response = await client.post("/api/v1/messages/", json={
+        "conversation_id": conversation["id"], "sender_type": "user", "content": "Hi"})
+    assert response.status_code == 200
+    # The extraction outbox row is queued by the same statement
+    assert_one_statement(statements, "INSERT", "messages")
+    assert "INSERT INTO extraction_outbox" in statements[0]
+
+
+async def test_update_message(client, message, statements):
+    statements.clear()
+    response = await client.put(
+        f"/api/v1/messages/{message['id']}", json={"content": "Flying to Rome"})
+    assert response.status_code == 200
+    assert response.json()["content"] == "Flying to Rome"
+    assert_one_statement(statements, "UPDATE", "messages")
+
+
+async def test_create_entity(client, message, statements):
+    entity = {"message_id": message["id"], "entity_type": "city",
+              "entity_value": "Paris", "confidence_score": 90}
+    # The first one interns the type and value, and the second caches their
+    # ids once they are committed
+    for _ in range(2):
+        assert (await client.post("/api/v1/entities/", json=entity)).status_code == 200
+
+    statements.clear()
+    response = await client.post("/api/v1/entities/", json=entity)
+    assert response.status_code == 200
+    assert response.json()["entity_value"] == "Paris"
+    assert_one_statement(statements, "INSERT", "entities")
+
+
+async def test_update_entity(client, message, statements):
+    entity = (await client.post("/api/v1/entities/", json={
+        "message_id": message["id"], "entity_type": "city", "entity_value": "Paris",
+        "confidence_score": 90})).json()
+
+    statements.clear()
+    response = await client.put(
+        f"/api/v1/entities/{entity['id']}", json={"confidence_score": 50})
+    assert response.status_code == 200
+    assert response.json()["confidence_score"] == 50
+    assert_one_statement(statements, "UPDATE", "entities")
+
+
+@pytest.mark.parametrize("path, body", [
+    ("/api/v1/users/999", {"full_name": "Alice"}),
+    ("/api/v1/conversations/999", {"title": "Holiday"}),
+    ("/api/v1/messages/999", {"content": "Hi"}),
+    ("/api/v1/entities/999", {"confidence_score": 50}),
+])
+async def test_update_missing_row_is_404(client, statements, path, body):
+    response = await client.put(path, json=body)
+    assert response.status_code == 404
+    assert len(statements) == 1
+
+
+async def test_duplicate_user_is_400(client, user):
+    response = await client.post("/api/v1/users/", json=USER)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Username or email already registered"
+
+
+async def test_duplicate_registration_is_400(client, user):
+    response = await client.post("/auth/register", json=USER)
+    assert response.status_code == 400
+
+
+async def test_update_to_taken_username_is_400(client, user):
+    other = (await client.post("/api/v1/users/", json={
+        **USER, "username": "bob", "email": "bob@example.com"})).json()
+    response = await client.put(
+        f"/api/v1/users/{other['id']}", json={"username": USER["username"]})
+    assert response.status_code == 400
+
+
+async def test_conversation_for_missing_user_is_404(client, statements):
+    response = await client.post(
+        "/api/v1/conversations/", json={"user_id": 999, "title": "Trip"})
+    assert response.status_code == 404
+    assert response.json()["detail"] == "User not found"
+    assert len(statements) == 1
+
+
+async def test_message_for_missing_conversation_is_404(client, statements):
+    response = await client.post("/api/v1/messages/", json={
+        "conversation_id": 999, "sender_type": "user", "content": "Hi"})
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Conversation not found"
+    assert len(statements) == 1